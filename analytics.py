@@ -0,0 +1,195 @@
+'''
+Publication-trend analytics over a record table: papers per month (or year), per journal,
+per JCR quartile and, for each highlighted query term, per month.
+
+All counts are vectorised: dates are parsed with pandas string ops, grouped with
+np.bincount / value_counts, and term hits come from one pandas str.contains per term over
+the titles and abstracts, with the highlighter's word-exact regexes (the same terms the
+reading list highlights, see query_engine.query_terms); a ranking.TermIndex already built for
+the same rows is reused instead when passed.
+
+In monthly mode, records whose date has a year but no month are counted per year in
+"year_only"; "undated" counts only records without a usable year.
+
+    summary = summarize(rows, "(wnt5a NOT cancer) AND fibro*")
+    summary["periods"], summary["by_period"]     # ["2024-01", ...], [12, ...]
+    summary["terms"]["wnt5a"]                    # papers mentioning wnt5a, per period
+
+generate_reading_list(..., analytics=True) embeds the summary in the search summary block
+as JSON plus pre-rendered CSS bar charts, so the page does no computation when it opens.
+'''
+import numpy as np
+
+from instrumentation import METRICS
+
+
+TITLE_COLUMNS = ('Title', 'TI')
+ABSTRACT_COLUMNS = ('Abstract', 'AB')
+JOURNAL_COLUMNS = ('Journal', 'Journal (TA)', 'TA')
+QUARTILE_COLUMNS = ('JCR_Quartile', 'Quartile')
+DATE_COLUMNS = ('Publication_Date', 'DP', 'publish_date', 'Publish Date (LR)', 'LR')   # first parsable wins
+QUARTILES = ('Q1', 'Q2', 'Q3', 'Q4')
+MAX_MONTHS = 120      # longer spans are counted per year
+TOP_JOURNALS = 10
+
+_DATE_PATTERN = r"(?<!\d)((?:19|20)\d{2})(?:[-/ ]?(\d{2}|[A-Za-z]{3}))?"
+_MONTHS = {name: i + 1 for i, name in enumerate(("jan", "feb", "mar", "apr", "may", "jun",
+                                                  "jul", "aug", "sep", "oct", "nov", "dec"))}
+
+
+def _frame(table):
+    # DataFrame with the columns used here; Parquet / Arrow inputs (html_generate.ColumnarInput)
+    # are read batch by batch, lists of records / dicts are read field by field.
+    import pandas as pd
+    wanted = TITLE_COLUMNS + ABSTRACT_COLUMNS + JOURNAL_COLUMNS + QUARTILE_COLUMNS + DATE_COLUMNS
+    if hasattr(table, 'itertuples'):
+        return table[[name for name in wanted if name in table.columns]]
+    if hasattr(table, 'batches'):
+        import pyarrow as pa
+        batches = list(table.batches())
+        if not batches:
+            return pd.DataFrame()
+        return pa.Table.from_batches(batches).to_pandas()
+    rows = list(table)
+    return pd.DataFrame({name: [row.get(name) for row in rows] for name in wanted})
+
+
+def _column(frame, names):
+    # First non-empty value among names, as a str Series ('' when missing)
+    import pandas as pd
+    result = pd.Series('', index=frame.index)
+    for name in reversed(names):
+        if name not in frame.columns:
+            continue
+        values = frame[name]
+        text = values.astype(str).str.strip()
+        present = values.notna() & (text != '') & (text.str.lower() != 'nan')
+        result = result.where(~present, text)
+    return result
+
+
+def _periods(frame):
+    # (year, month) float arrays (NaN where unknown); month is taken from the first date column that has one
+    import pandas as pd
+    year = np.full(len(frame), np.nan)
+    month = np.full(len(frame), np.nan)
+    for name in DATE_COLUMNS:
+        if name not in frame.columns:
+            continue
+        # 日期值大量重复：只解析不同的值，再按编码展开
+        codes, uniques = pd.factorize(frame[name])
+        parts = pd.Series(uniques, dtype=object).astype(str).str.extract(_DATE_PATTERN)
+        token = parts[1].str.lower()
+        unique_months = token.map(_MONTHS).astype(float).fillna(pd.to_numeric(token, errors='coerce')).to_numpy(copy=True)
+        unique_months[(unique_months < 1) | (unique_months > 12)] = np.nan
+        known = codes >= 0
+        y = np.full(len(frame), np.nan)
+        m = np.full(len(frame), np.nan)
+        y[known] = parts[0].astype(float).to_numpy()[codes[known]]
+        m[known] = unique_months[codes[known]]
+        # 已有年月的行保持不变；只有年份的行用后面的列补月份
+        fill_month = np.isnan(month) & ~np.isnan(m) & (np.isnan(year) | (year == y))
+        month[fill_month] = m[fill_month]
+        fill_year = np.isnan(year) & ~np.isnan(y)
+        year[fill_year] = y[fill_year]
+    return year, month
+
+
+def _term_hits(text, query_words):
+    # (rows, terms) bool matrix: does the title / abstract contain the term, with the highlighter's
+    # word-exact regex (query_engine.term_regex), one vectorised str.contains per term.
+    from query_engine import Term, term_regex
+    columns = []
+    for word in query_words:
+        pattern = term_regex(Term(word.rstrip('*'), 'all', prefix=word.endswith('*')))
+        columns.append(text.str.contains(pattern, case=False, regex=True).to_numpy(dtype=bool))
+    return np.column_stack(columns)
+
+
+def _period_labels(start, count, monthly):
+    if monthly:
+        return [f"{(start + i) // 12}-{(start + i) % 12 + 1:02d}" for i in range(count)]
+    return [str(start + i) for i in range(count)]
+
+
+def summarize(table, query=None, top_journals=TOP_JOURNALS, index=None):
+    '''
+    Grouped counts of a record table.
+
+    Parameters:
+    -----------
+    table : DataFrame, list of records / dicts, or html_generate.ColumnarInput
+        Rows keyed by Excel header or MEDLINE tag
+    query : str, optional
+        PubMed query; its highlighted title / abstract terms get a per-period series
+    top_journals : int
+        Number of journals listed
+    index : ranking.TermIndex, optional
+        Index of the same rows, to reuse one already built for ranking
+
+    Returns:
+    --------
+    dict with "records", "period" ("month" or "year"), "periods", "by_period", "year_only"
+    (monthly mode: {year: records with a year but no month}), "undated" (no usable year),
+    "by_journal" ([name, count] pairs), "by_quartile" (Q1-Q4 and "n/a"), "terms" and
+    "term_totals" (papers mentioning each term)
+    '''
+    import query_engine
+    import ranking
+
+    with METRICS.stage("analytics"):
+        frame = _frame(table)
+        n = len(frame)
+        year, month = _periods(frame)
+
+        monthly_rows = ~np.isnan(month)
+        if monthly_rows.any():
+            keys = (year[monthly_rows] * 12 + month[monthly_rows] - 1).astype(np.int64)
+            monthly = keys.max() - keys.min() < MAX_MONTHS
+        else:
+            monthly = False
+        if monthly:
+            dated = monthly_rows
+            keys = (year * 12 + month - 1)[dated].astype(np.int64)
+        else:
+            dated = ~np.isnan(year)
+            keys = year[dated].astype(np.int64)
+        start = int(keys.min()) if len(keys) else 0
+        year_only = {}
+        if monthly:
+            # 只有年份、没有月份的记录单独按年计数，不算作无日期
+            years, counts = np.unique(year[~np.isnan(year) & np.isnan(month)].astype(np.int64), return_counts=True)
+            year_only = {str(y): int(c) for y, c in zip(years, counts)}
+        by_period = np.bincount(keys - start) if len(keys) else np.zeros(0, dtype=np.int64)
+
+        journals = _column(frame, JOURNAL_COLUMNS)
+        journal_counts = journals[journals != ''].value_counts().head(top_journals)
+        quartiles = _column(frame, QUARTILE_COLUMNS).str.upper()
+        quartile_counts = quartiles.where(quartiles.isin(QUARTILES), 'n/a').value_counts()
+
+        terms = {}
+        term_totals = {}
+        query_words = list(dict.fromkeys(query_engine.query_terms(query)))
+        if query_words and n:
+            if index is not None:
+                hits = index.frequencies(query_words) > 0
+            else:
+                hits = _term_hits(_column(frame, TITLE_COLUMNS) + ' ' + _column(frame, ABSTRACT_COLUMNS), query_words)
+            for column, term in enumerate(query_words):
+                term_totals[term] = int(hits[:, column].sum())
+                series = np.bincount(keys - start, weights=hits[dated, column], minlength=len(by_period))
+                terms[term] = series.astype(np.int64).tolist()
+
+        METRICS.incr("analytics_records", n)
+        return {
+            "records": n,
+            "period": "month" if monthly else "year",
+            "periods": _period_labels(start, len(by_period), monthly),
+            "by_period": by_period.tolist(),
+            "year_only": year_only,
+            "undated": int(np.isnan(year).sum()),
+            "by_journal": [[name, int(count)] for name, count in journal_counts.items()],
+            "by_quartile": {name: int(quartile_counts.get(name, 0)) for name in QUARTILES + ('n/a',)},
+            "terms": terms,
+            "term_totals": term_totals,
+        }
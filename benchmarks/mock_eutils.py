@@ -0,0 +1,240 @@
+'''
+Local stand-in for the NCBI E-utilities (esearch.fcgi / efetch.fcgi).
+
+Serves synthetic but deterministic MEDLINE records so the harvest loop can be measured
+offline. Latency, error rate and rate limiting are configurable:
+
+    with MockEutilsServer(total=5000, latency=0.02, error_rate=0.01, rate_limit=10) as server:
+        utils = pubmed_utils()
+        utils.eutils_base = server.base_url
+        ...
+
+Run standalone to point other tools at it:
+
+    python benchmarks/mock_eutils.py --port 8765 --total 10000 --latency 0.05
+'''
+import argparse
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+FIRST_PMID = 30000000
+FIRST_DATE = date(2015, 1, 1)   # mock Entrez date of FIRST_PMID; later PMIDs follow at records_per_day
+
+# PubMed 期刊缩写（大部分可在 jcr_2025.xlsx 中匹配，少数用于覆盖未匹配路径）
+JOURNALS = [
+    "Nat Commun", "Sci Rep", "PLoS One", "Front Immunol", "Hepatology", "Cardiovasc Res",
+    "J Biomed Sci", "Nat Catal", "Cell Rep", "Nucleic Acids Res", "Lancet Respir Med",
+    "Br J Sports Med", "Int J Mol Sci", "J Clin Invest", "Matrix Biol", "Fibrogenesis Tissue Repair",
+]
+
+WORDS = (
+    "wnt5a fibroblast fibrosis fibrotic signaling pathway tissue repair cancer tumor cell "
+    "expression regulates mice patients inflammation macrophage collagen matrix lung liver "
+    "kidney cardiac injury response receptor protein gene therapy model analysis single-cell "
+    "sequencing reveals novel mechanism beta-catenin planar polarity migration invasion"
+).split()
+
+
+def synthetic_medline(pmid, abstract_words=180):
+    '''
+    Deterministic MEDLINE text for one PMID (same PMID -> same record).
+    '''
+    rng = random.Random(pmid)
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+    abstract = " ".join(rng.choice(WORDS) for _ in range(abstract_words)) + "."
+    year = rng.randint(2015, 2025)
+    lines = [
+        f"PMID- {pmid}",
+        "OWN - NLM",
+        "STAT- MEDLINE",
+        f"DP  - {year} {rng.choice(['Jan', 'Mar', 'Jun', 'Sep', 'Dec'])}",
+    ]
+    # 长字段按 MEDLINE 格式折行（续行以 6 个空格开头）
+    for tag, text in (("TI", title), ("AB", abstract)):
+        words = text.split(" ")
+        line = f"{tag:<4}- "
+        for word in words:
+            if len(line) + len(word) > 80:
+                lines.append(line.rstrip())
+                line = "      "
+            line += word + " "
+        lines.append(line.rstrip())
+    for _ in range(rng.randint(2, 6)):
+        lines.append(f"AU  - {rng.choice(['Smith', 'Li', 'Wang', 'Garcia', 'Muller'])} {rng.choice('ABCDJKX')}")
+    lines += [
+        f"LID - 10.{1000 + pmid % 9000}/mock.{pmid} [doi]",
+        f"LID - e{pmid % 100000} [pii]",
+        f"TA  - {JOURNALS[rng.randrange(len(JOURNALS))]}",
+        f"LR  - {year + rng.randint(0, 1)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class _TokenBucket():
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockEutilsServer():
+    '''
+    Parameters:
+    -----------
+    total : int
+        Count reported by ESearch
+    latency : float
+        Seconds added to every response
+    error_rate : float
+        Probability (0-1) of answering 500
+    rate_limit : float, optional
+        Requests per second before answering 429 (NCBI: 3 without key, 10 with key)
+    seed : int
+        Seed for the error injection
+    records_per_day : int
+        PMIDs per day of mock date; ESearch mindate / maxdate select the PMIDs dated in that range
+    '''
+    def __init__(self, total=1000, latency=0.0, error_rate=0.0, rate_limit=None, seed=0, host="127.0.0.1", port=0,
+                 records_per_day=30):
+        self.total = total
+        self.records_per_day = records_per_day
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bucket = _TokenBucket(rate_limit) if rate_limit else None
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = {"requests": 0, "esearch": 0, "efetch": 0, "errors": 0, "throttled": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/entrez/eutils/"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, key):
+        with self.rng_lock:
+            self.stats[key] += 1
+
+    def _ids(self, start, count):
+        start = max(0, start)
+        end = min(self.total, start + count)
+        return list(range(FIRST_PMID + start, FIRST_PMID + end))
+
+    def _date_range(self, params):
+        # Index range [first, last) of the PMIDs dated within mindate..maxdate (reldate is ignored)
+        def day(value, default):
+            if not value:
+                return default
+            parts = [int(p) for p in value.split("/")] + [1, 1]
+            return (date(*parts[:3]) - FIRST_DATE).days
+        low = day(params.get("mindate"), -10 ** 6)
+        high = day(params.get("maxdate"), 10 ** 6)
+        first = min(self.total, max(0, low * self.records_per_day))
+        last = min(self.total, max(0, (high + 1) * self.records_per_day))
+        return first, max(first, last)
+
+    def esearch_body(self, params):
+        retmax = int(params.get("retmax", 20))
+        retstart = int(params.get("retstart", 0))
+        first, last = self._date_range(params)
+        count = last - first
+        ids = "".join(f"<Id>{pmid}</Id>" for pmid in self._ids(first + retstart, min(retmax, count - retstart)))
+        return (f"<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<eSearchResult><Count>{count}</Count>"
+                f"<RetMax>{min(retmax, count)}</RetMax><RetStart>{retstart}</RetStart>"
+                f"<QueryKey>1</QueryKey><WebEnv>MCID_mock</WebEnv><IdList>{ids}</IdList></eSearchResult>\n")
+
+    def efetch_body(self, params):
+        if params.get("id"):
+            ids = [int(pmid) for pmid in params["id"].split(",") if pmid.strip()]
+        else:
+            ids = self._ids(int(params.get("retstart", 0)), int(params.get("retmax", 20)))
+        return "\n".join(synthetic_medline(pmid) for pmid in ids)
+
+    def _handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                server._count("requests")
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.bucket and not server.bucket.take():
+                    server._count("throttled")
+                    return self._send(429, "text/plain", "API rate limit exceeded")
+                with server.rng_lock:
+                    failed = server.error_rate and server.rng.random() < server.error_rate
+                if failed:
+                    server._count("errors")
+                    return self._send(500, "text/plain", "Internal Server Error")
+                if url.path.endswith("esearch.fcgi"):
+                    server._count("esearch")
+                    return self._send(200, "text/xml", server.esearch_body(params))
+                if url.path.endswith("efetch.fcgi"):
+                    server._count("efetch")
+                    return self._send(200, "text/plain", server.efetch_body(params))
+                return self._send(404, "text/plain", "not found")
+
+            def _send(self, status, content_type, body):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type + "; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock NCBI E-utilities server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--total", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    args = parser.parse_args()
+    server = MockEutilsServer(args.total, args.latency, args.error_rate, args.rate_limit, port=args.port)
+    print(f"Serving mock E-utilities at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+'''
+Offline benchmark suite: reproducible perf numbers that can be compared across commits.
+
+    python benchmarks/run_benchmarks.py                         # all benchmarks, default sizes
+    python benchmarks/run_benchmarks.py --only harvest parse --records 5000
+    python benchmarks/run_benchmarks.py --render-sizes 1000 10000 100000 --out bench.json
+    python benchmarks/run_benchmarks.py --compare bench_before.json
+
+Benchmarks:
+    startup  interpreter start + `grabpubmed.py --help` / module import, checked against --startup-budget-ms
+    harvest  end-to-end ESearch + EFetch + parse against the mock E-utilities server (response cache off)
+    http_cache  the same harvest twice through an empty on-disk response cache (cold, then warm)
+    parse    MEDLINE parse cost per record (no network)
+    memory   retained bytes per parsed record: slotted Record vs plain dict (tracemalloc)
+    dedup    MinHash/LSH near-duplicate grouping (--records rows, 1% injected near-duplicates)
+    enrich   embed_IF_into_excel against jcr_2025.xlsx (cold and warm workbook cache)
+    rank     BM25 + IF + recency ranking of --rank-rows records (index build and scoring)
+    analytics  per-month / journal / quartile / query-term counts of --rank-rows records (DataFrame input)
+    render   generate_reading_list at each --render-sizes row count, for each --abstracts mode
+             and from a Parquet file (streamed; first_row_seconds is the time to the first record)
+
+All inputs are synthetic and seeded, so two runs on the same machine are comparable.
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_eutils import FIRST_PMID, JOURNALS, MockEutilsServer, synthetic_medline  # noqa: E402
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _quiet(func, *args, **kwargs):
+    # 屏蔽库函数的 print / tqdm 输出
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "Bio", "requests", "bs4", "tqdm")
+
+
+def _best_of(cmd, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 1)
+
+
+def bench_startup(args):
+    # Best-of-N wall time in ms for the cold-start paths, plus the heavy modules each one pulls in.
+    python = sys.executable
+    commands = {
+        "python": [python, "-c", "pass"],
+        "cli_help": [python, "grabpubmed.py", "--help"],
+        "import_modules": [python, "-c", "import pubmed_utils, html_generate, grabpubmed"],
+    }
+    timings = {name: _best_of(cmd, args.startup_repeat) for name, cmd in commands.items()}
+    probe = ("import sys, pubmed_utils, html_generate, grabpubmed; "
+             f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    loaded = subprocess.check_output([python, "-c", probe], cwd=ROOT).decode().strip()
+    over = [name for name in ("cli_help", "import_modules") if timings[name] > args.startup_budget_ms]
+    return {
+        "ms": timings,
+        "heavy_modules_on_import": [m for m in loaded.split(",") if m],
+        "budget_ms": args.startup_budget_ms,
+        "within_budget": not over and not loaded,
+    }
+
+
+def bench_harvest(args):
+    from pubmed_utils import pubmed_utils
+    from instrumentation import METRICS
+
+    with MockEutilsServer(total=args.records, latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit) as server:
+        utils = pubmed_utils()
+        utils.eutils_base = server.base_url
+        utils.grab_step = args.grab_step
+        utils.request_interval = args.request_interval
+        utils.retry_backoff = 0.01
+        utils.response_cache = False
+        METRICS.reset()
+        t0 = time.perf_counter()
+        n = sum(1 for _ in _quiet(lambda: list(utils.iter_pubmed_records(None, "wnt5a AND fibro*", progress=lambda done, total: None))))
+        elapsed = time.perf_counter() - t0
+        report = METRICS.report()
+    return {
+        "records": n,
+        "seconds": round(elapsed, 4),
+        "records_per_sec": round(n / elapsed, 1) if elapsed else None,
+        "requests": report["counters"].get("requests", 0),
+        "retries": report["counters"].get("retries", 0),
+        "bytes": report["counters"].get("bytes", 0),
+        "server": dict(server.stats),
+        "config": {"latency": args.latency, "error_rate": args.error_rate, "rate_limit": args.rate_limit,
+                   "grab_step": args.grab_step, "request_interval": args.request_interval},
+    }
+
+
+def bench_http_cache(args):
+    from http_cache import ResponseCache
+    from pubmed_utils import pubmed_utils
+    from instrumentation import METRICS
+
+    results = {}
+    with MockEutilsServer(total=args.records, latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        utils = pubmed_utils()
+        utils.eutils_base = server.base_url
+        utils.grab_step = args.grab_step
+        utils.request_interval = args.request_interval
+        utils.cache = ResponseCache(path=tmp)
+        for run in ("cold", "warm"):
+            METRICS.reset()
+            t0 = time.perf_counter()
+            n = sum(1 for _ in _quiet(lambda: list(utils.iter_pubmed_records(None, "wnt5a AND fibro*", progress=lambda done, total: None))))
+            elapsed = time.perf_counter() - t0
+            counters = METRICS.report()["counters"]
+            results[run] = {"records": n, "seconds": round(elapsed, 4), "requests": counters.get("requests", 0),
+                            "hits": counters.get("http_cache_hits", 0), "misses": counters.get("http_cache_misses", 0)}
+        results["cache"] = utils.cache.stats()
+        results["cache"].pop("path")
+    return results
+
+
+def bench_parse(args):
+    from pubmed_utils import pubmed_utils
+
+    utils = pubmed_utils()
+    pages = []
+    for start in range(0, args.records, args.grab_step):
+        pmids = range(FIRST_PMID + start, FIRST_PMID + min(args.records, start + args.grab_step))
+        pages.append("\n".join(synthetic_medline(pmid) for pmid in pmids))
+    t0 = time.perf_counter()
+    n = 0
+    for page in pages:
+        n += len(_quiet(utils.parse_medline, page))
+    elapsed = time.perf_counter() - t0
+    return {"records": n, "seconds": round(elapsed, 4), "us_per_record": round(elapsed / max(n, 1) * 1e6, 1)}
+
+
+def bench_memory(args):
+    import tracemalloc
+    import field_schema
+    from pubmed_utils import pubmed_utils
+
+    utils = pubmed_utils()
+    text = "\n".join(synthetic_medline(FIRST_PMID + i) for i in range(args.records))
+    to_record = field_schema.build_extractor(utils.schema)
+    extractors = {
+        "record": to_record,
+        "dict": lambda medline: dict(to_record(medline).items()),
+    }
+    results = {}
+    for name, extract in extractors.items():
+        tracemalloc.start()
+        records = _quiet(utils.parse_medline, text, extract)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {"records": len(records), "bytes_per_record": round(retained / max(len(records), 1)),
+                         "peak_mb": round(peak / 1024 / 1024, 2)}
+        del records
+    return results
+
+
+def _synthetic_rows(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        pmid = FIRST_PMID + i
+        text = synthetic_medline(pmid)
+        fields = {}
+        for line in text.splitlines():
+            if line[:4].strip() and line[4:6] == "- ":
+                tag = line[:4].strip()
+                fields.setdefault(tag, line[6:])
+            elif line.startswith("      "):
+                fields[tag] += " " + line.strip()
+        rows.append({
+            "PMID": str(pmid), "Title": fields.get("TI"), "Journal": fields.get("TA"),
+            "IF": round(rng.uniform(0.5, 50), 1), "JCR_Quartile": rng.choice(["Q1", "Q2", "Q3", "Q4"]),
+            "CSA_Quartile": None, "Top": None, "Open Access": None,
+            "publish_date": fields.get("LR"), "Abstract": fields.get("AB"), "DOI": f"10.1000/mock.{pmid} [doi]",
+        })
+    return rows
+
+
+def bench_dedup(args):
+    import dedup
+
+    rows = _synthetic_rows(args.records)
+    rng = random.Random(1)
+    injected = max(1, args.records // 100)
+    for k in range(injected):
+        # 预印本版本：同一摘要改动一个词
+        row = dict(rows[rng.randrange(args.records)])
+        words = row["Abstract"].split()
+        words[rng.randrange(len(words))] = "edited"
+        row.update({"PMID": str(FIRST_PMID + args.records + k), "Journal": "bioRxiv", "Abstract": " ".join(words)})
+        rows.append(row)
+    t0 = time.perf_counter()
+    groups = dedup.find_duplicates(rows)
+    elapsed = time.perf_counter() - t0
+    found = sum(len(group) - 1 for group in groups)
+    return {"rows": len(rows), "injected": injected, "found": found, "seconds": round(elapsed, 4),
+            "us_per_record": round(elapsed / len(rows) * 1e6, 1)}
+
+
+def bench_enrich(args):
+    import openpyxl
+    import field_schema
+    import journal_metrics
+    from pubmed_utils import pubmed_utils
+    from instrumentation import METRICS
+
+    reference = os.path.join(ROOT, "jcr_2025.xlsx")
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_path = os.path.join(tmp, "enrich.xlsx")
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        field_schema.write_header(ws)
+        rng = random.Random(0)
+        for row in range(2, args.enrich_rows + 2):
+            ws.cell(row=row, column=1).value = str(FIRST_PMID + row)
+            ws.cell(row=row, column=3).value = rng.choice(JOURNALS)
+        wb.save(excel_path)
+
+        # cold: empty workbook cache; warm: parsed columns read back from the cache
+        results = {"rows": args.enrich_rows}
+        saved = os.environ.get("GRABPUBMED_CACHE_DIR")
+        os.environ["GRABPUBMED_CACHE_DIR"] = os.path.join(tmp, "cache")
+        try:
+            for run in ("cold", "warm"):
+                journal_metrics._STORES.clear()
+                METRICS.reset()
+                t0 = time.perf_counter()
+                _quiet(pubmed_utils().embed_IF_into_excel, excel_path, reference)
+                elapsed = time.perf_counter() - t0
+                stages = METRICS.report()["stages"]
+                results[run] = {
+                    "seconds": round(elapsed, 4),
+                    "reference_load_seconds": stages.get("jcr_load", {}).get("seconds"),
+                    "match_seconds": stages.get("journal_match", {}).get("seconds"),
+                }
+        finally:
+            if saved is None:
+                os.environ.pop("GRABPUBMED_CACHE_DIR", None)
+            else:
+                os.environ["GRABPUBMED_CACHE_DIR"] = saved
+    return results
+
+
+def bench_render(args):
+    import pandas as pd
+    from html_generate import ColumnarInput, generate_reading_list
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.render_sizes:
+            df = pd.DataFrame(_synthetic_rows(size))
+            try:
+                # Parquet 输入：逐批读取，记录首行延迟（渲染能多快开始）
+                parquet = os.path.join(tmp, f"render_{size}.parquet")
+                df.to_parquet(parquet, row_group_size=10000)
+                output = os.path.join(tmp, f"render_{size}_parquet.html")
+                t0 = time.perf_counter()
+                next(iter(ColumnarInput(parquet)))
+                first_row = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                _quiet(generate_reading_list, parquet, output, {"search_keywords": "(wnt5a NOT cancer) AND fibro*"})
+                results[f"{size}_parquet"] = {"seconds": round(time.perf_counter() - t0, 4),
+                                              "first_row_seconds": round(first_row, 4),
+                                              "parquet_mb": round(os.path.getsize(parquet) / 1024 / 1024, 2)}
+            except ImportError:
+                pass
+            for mode in args.abstracts:
+                output = os.path.join(tmp, f"render_{size}_{mode}.html")
+                t0 = time.perf_counter()
+                _quiet(generate_reading_list, df, output, {"search_keywords": "(wnt5a NOT cancer) AND fibro*"}, abstracts=mode)
+                elapsed = time.perf_counter() - t0
+                sidecar = os.path.splitext(output)[0] + "_abstracts"
+                sidecar_bytes = sum(entry.stat().st_size for entry in os.scandir(sidecar)) if os.path.isdir(sidecar) else 0
+                key = str(size) if mode == "inline" else f"{size}_{mode}"
+                results[key] = {"seconds": round(elapsed, 4), "html_mb": round(os.path.getsize(output) / 1024 / 1024, 2),
+                                "sidecar_mb": round(sidecar_bytes / 1024 / 1024, 2)}
+    return results
+
+
+def bench_rank(args):
+    import ranking
+
+    # 10k 条合成记录重复铺满 --rank-rows，避免生成 10 万条记录的开销
+    base = _synthetic_rows(min(args.rank_rows, 10000))
+    rows = [base[i % len(base)] for i in range(args.rank_rows)]
+    query = '(wnt5a OR planar) AND fibros* AND "beta-catenin"'
+    t0 = time.perf_counter()
+    index = ranking.TermIndex.from_rows(rows)
+    index_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ranking.rank(rows, query, index=index, if_weight=0.2, recency_weight=0.2)
+    score_seconds = time.perf_counter() - t0
+    return {
+        "rows": len(rows),
+        "seconds": round(index_seconds + score_seconds, 4),
+        "index": {"seconds": round(index_seconds, 4), "tokens": len(index.starts)},
+        "score": {"seconds": round(score_seconds, 4)},
+    }
+
+
+def bench_analytics(args):
+    import analytics
+    import pandas as pd
+
+    base = _synthetic_rows(min(args.rank_rows, 10000))
+    frame = pd.DataFrame([base[i % len(base)] for i in range(args.rank_rows)])
+    query = '(wnt5a OR planar) AND fibros* AND "beta-catenin"'
+    t0 = time.perf_counter()
+    summary = analytics.summarize(frame, query)
+    return {"rows": len(frame), "seconds": round(time.perf_counter() - t0, 4),
+            "periods": len(summary["periods"]), "terms": len(summary["terms"])}
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "harvest": bench_harvest,
+    "http_cache": bench_http_cache,
+    "parse": bench_parse,
+    "memory": bench_memory,
+    "dedup": bench_dedup,
+    "enrich": bench_enrich,
+    "rank": bench_rank,
+    "analytics": bench_analytics,
+    "render": bench_render,
+}
+
+
+def _compare(current, previous):
+    # Print seconds deltas for every numeric "seconds" leaf present in both results.
+    def walk(cur, prev, path):
+        for key, value in cur.items():
+            if key not in prev:
+                continue
+            if isinstance(value, dict) and isinstance(prev[key], dict):
+                walk(value, prev[key], path + [key])
+            elif key in ("seconds", "ms") and isinstance(value, (int, float)) and prev[key]:
+                change = (value - prev[key]) / prev[key] * 100
+                print(f"  {'.'.join(path):<30} {prev[key]:>10.4f}s -> {value:>10.4f}s  ({change:+.1f}%)")
+    print(f"Compare {previous.get('commit')} -> {current.get('commit')}")
+    walk(current["results"], previous["results"], [])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the harvest / enrich / render stages")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument("--records", type=int, default=2000, help="records for harvest / parse / memory / dedup")
+    parser.add_argument("--grab-step", type=int, default=10, help="EFetch page size")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock server latency per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock server 500 rate")
+    parser.add_argument("--rate-limit", type=float, default=None, help="mock server requests/sec before 429")
+    parser.add_argument("--request-interval", type=float, default=0.0, help="client sleep between EFetch pages")
+    parser.add_argument("--enrich-rows", type=int, default=2000)
+    parser.add_argument("--rank-rows", type=int, default=100000)
+    parser.add_argument("--render-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--abstracts", nargs="+", choices=("inline", "embedded", "sidecar"), default=["inline", "embedded", "sidecar"],
+                        help="reading-list abstract modes to render")
+    parser.add_argument("--startup-repeat", type=int, default=5)
+    parser.add_argument("--startup-budget-ms", type=float, default=100.0)
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"[{name}] running...", file=sys.stderr)
+        results[name] = BENCHMARKS[name](args)
+        print(f"[{name}] {json.dumps(results[name])}", file=sys.stderr)
+
+    output = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _compare(output, json.load(f))
+    if "startup" in results and not results["startup"]["within_budget"]:
+        print(f"startup budget exceeded: {results['startup']}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
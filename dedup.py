@@ -0,0 +1,296 @@
+'''
+Near-duplicate detection for harvested records (MinHash + LSH banding).
+
+Overlapping queries return the same PMID more than once, and a paper can show up both as a
+preprint-derived entry and as its journal version with a lightly edited title / abstract.
+Each record's title + abstract is cut into word shingles, hashed into a MinHash signature
+(NumPy) and split into LSH bands; only records that share a band bucket are compared, so
+the cost stays near-linear in the number of records instead of O(n²) pairwise.
+
+    groups = find_duplicates(rows)          # [[canonical, duplicate, ...], ...] (row indices)
+    mark_duplicates(rows)                   # Duplicate_of = PMID of the canonical record
+    rows = collapse_duplicates(rows)        # keep one record per group
+
+    index = LSHIndex()                      # streaming variant (grabpubmed run --dedup)
+    canonical = index.add(pmid, text)       # PMID of an earlier near-duplicate, or None
+
+Rows may be records (records.py), dicts or pandas rows keyed by Excel header or MEDLINE tag.
+'''
+import re
+import zlib
+from functools import lru_cache
+
+from instrumentation import METRICS
+from records import first_value
+
+
+DUPLICATE_FIELD = ("Duplicate_of", "Duplicate_of")   # (schema key, Excel header)
+
+NUM_PERM = 128
+BANDS = 32              # 32 bands x 4 rows: pairs with Jaccard >= 0.6 become candidates with p > 0.98
+THRESHOLD = 0.8         # estimated Jaccard similarity needed to call a candidate a duplicate
+SHINGLE_SIZE = 3
+
+# 预印本来源：同一组重复记录中优先保留正式发表的期刊版本
+PREPRINT_PATTERN = re.compile(r"(?i)\b(bio ?rxiv|med ?rxiv|arxiv|chemrxiv|research ?square|ssrn|preprints?)\b")
+
+_SHINGLE_MULTIPLIER = 1099511628211   # FNV-1 64-bit prime
+_MAX_BLOCK = 4096       # shingles hashed per NumPy block (keeps the num_perm x block matrix in cache)
+
+
+def record_text(row):
+    # Title + abstract, the text that is shingled
+    return f"{first_value(row, ('Title', 'TI'))} {first_value(row, ('Abstract', 'AB'))}".strip()
+
+
+def record_pmid(row):
+    return first_value(row, ('PMID',))
+
+
+def is_preprint(row):
+    return bool(PREPRINT_PATTERN.search(first_value(row, ('Journal', 'TA'))))
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE, word_hashes=None):
+    '''
+    Sorted unique 64-bit hashes of the word shingles of text (empty for empty text).
+
+    Words are hashed once (crc32, cached in word_hashes) and each shingle hash is a
+    polynomial of its word hashes computed with NumPy, so no shingle string is built.
+    '''
+    import numpy as np
+    if word_hashes is None:
+        word_hashes = {}
+    tokens = re.findall(r"[a-z0-9]+", text.lower())
+    for word in set(tokens).difference(word_hashes):
+        word_hashes[word] = zlib.crc32(word.encode("utf-8"))
+    words = np.fromiter(map(word_hashes.__getitem__, tokens), dtype=np.uint64, count=len(tokens))
+    if not len(words):
+        return words
+    size = min(size, len(words))   # 短文本：整段作为一个 shingle
+    shingles = np.zeros(len(words) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        shingles = shingles * _SHINGLE_MULTIPLIER + words[offset:len(words) - size + 1 + offset]
+    return np.unique(shingles)
+
+
+@lru_cache(maxsize=None)
+def _permutations(num_perm, seed):
+    # multiply-shift hash family: h(x) = ((a*x + b) mod 2^64) >> 32, a odd
+    import numpy as np
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2**62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.randint(0, 2**62, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a[:, None], b[:, None]
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=1, word_hashes=None):
+    '''
+    MinHash signatures for a list of texts.
+
+    Returns (signatures, valid): a (len(texts), num_perm) uint32 array and a boolean mask
+    of the texts that had at least one shingle. Shingle hashes of many texts are processed
+    in one vectorised block and reduced per text with np.minimum.reduceat.
+    '''
+    import numpy as np
+    a, b = _permutations(num_perm, seed)
+    if word_hashes is None:
+        word_hashes = {}
+    hashes = [shingle_hashes(text, word_hashes=word_hashes) for text in texts]
+    valid = np.array([len(h) > 0 for h in hashes], dtype=bool)
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    block, block_rows, block_size = [], [], 0
+
+    def flush():
+        values = np.concatenate(block)
+        starts = np.cumsum([0] + [len(h) for h in block[:-1]])
+        permuted = a * values[None, :]
+        permuted += b
+        permuted >>= np.uint64(32)
+        signatures[block_rows] = np.minimum.reduceat(permuted, starts, axis=1).T.astype(np.uint32)
+
+    for row, h in enumerate(hashes):
+        if not len(h):
+            continue
+        block.append(h)
+        block_rows.append(row)
+        block_size += len(h)
+        if block_size >= _MAX_BLOCK:
+            flush()
+            block, block_rows, block_size = [], [], 0
+    if block:
+        flush()
+    return signatures, valid
+
+
+def _band_keys(signatures, bands):
+    # One hashable bucket key per (row, band): the band's rows viewed as raw bytes
+    import numpy as np
+    rows_per_band = signatures.shape[1] // bands
+    for band in range(bands):
+        chunk = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        yield chunk.view(np.dtype((np.void, chunk.dtype.itemsize * rows_per_band))).ravel()
+
+
+class _UnionFind():
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def find_duplicates(rows, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+    '''
+    Group duplicate and near-duplicate rows.
+
+    Parameters:
+    -----------
+    rows : list
+        Records, dicts or pandas rows (keyed by Excel header or MEDLINE tag)
+    threshold : float
+        Minimum estimated Jaccard similarity of the title + abstract shingles
+    num_perm, bands : int
+        MinHash signature length and number of LSH bands (num_perm must divide by bands)
+
+    Returns:
+    --------
+    list of lists of row indices, one per group of size > 1; the first index of each group
+    is the canonical record (the first journal version, or the first record if all are preprints)
+    '''
+    import numpy as np
+    if num_perm % bands:
+        raise ValueError("num_perm must be a multiple of bands")
+    rows = list(rows)
+    with METRICS.stage("dedup"):
+        uf = _UnionFind(len(rows))
+
+        # 完全相同的 PMID（多个检索式重叠）直接合并
+        first_seen = {}
+        for i, row in enumerate(rows):
+            pmid = record_pmid(row)
+            if pmid:
+                uf.union(first_seen.setdefault(pmid, i), i)
+
+        signatures, valid = minhash_signatures([record_text(row) for row in rows], num_perm, seed)
+        checked = set()
+        candidates = np.flatnonzero(valid)
+        for keys in _band_keys(signatures, bands):
+            # 只有落入同一个桶（count > 1）的记录才需要比较
+            _, inverse, counts = np.unique(keys[candidates], return_inverse=True, return_counts=True)
+            buckets = {}
+            for i, bucket in zip(candidates[counts[inverse] > 1].tolist(), inverse[counts[inverse] > 1].tolist()):
+                buckets.setdefault(bucket, []).append(i)
+            for members in buckets.values():
+                for pos in range(1, len(members)):
+                    i = members[pos]
+                    for j in members[:pos]:
+                        if uf.find(i) == uf.find(j) or (j, i) in checked:
+                            continue
+                        checked.add((j, i))
+                        if np.mean(signatures[i] == signatures[j]) >= threshold:
+                            uf.union(i, j)
+                            break
+
+        groups = {}
+        for i in range(len(rows)):
+            groups.setdefault(uf.find(i), []).append(i)
+        result = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            canonical = next((i for i in members if not is_preprint(rows[i])), members[0])
+            result.append([canonical] + [i for i in members if i != canonical])
+        METRICS.incr("duplicates", sum(len(g) - 1 for g in result))
+    return result
+
+
+def set_duplicate(row, value):
+    key, header = DUPLICATE_FIELD
+    if hasattr(row, "_keys"):           # records.Record
+        if key in row._keys:
+            setattr(row, key, value)
+    else:
+        row[header] = value
+
+
+def mark_duplicates(rows, groups=None, **kwargs):
+    '''
+    Set Duplicate_of (the canonical record's PMID) on every duplicate row; returns the groups.
+    '''
+    rows = list(rows)
+    if groups is None:
+        groups = find_duplicates(rows, **kwargs)
+    for group in groups:
+        canonical = record_pmid(rows[group[0]]) or f"row {group[0] + 1}"
+        for i in group[1:]:
+            set_duplicate(rows[i], canonical)
+    return groups
+
+
+def collapse_duplicates(rows, groups=None, **kwargs):
+    '''
+    Drop every duplicate row, keeping the canonical record of each group (order preserved).
+    '''
+    rows = list(rows)
+    if groups is None:
+        groups = find_duplicates(rows, **kwargs)
+    dropped = {i for group in groups for i in group[1:]}
+    return [row for i, row in enumerate(rows) if i not in dropped]
+
+
+class LSHIndex():
+    '''
+    Incremental MinHash/LSH index for streamed records.
+
+    add() returns the key of an earlier near-duplicate (or an identical key) and indexes
+    the new record otherwise. Records without a key (no PMID) are only compared by text
+    and indexed as "row N", N being their position in the stream (as in mark_duplicates). The first record seen is canonical, so a preprint that
+    arrives before its journal version stays canonical in streaming mode.
+    '''
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+        self.seen = set()
+        self.word_hashes = {}
+        self.added = 0
+
+    def add(self, key, text):
+        import numpy as np
+        self.added += 1
+        if not key:
+            # 没有 PMID：不能按键判重，用流中的序号作为键
+            key = f"row {self.added}"
+        elif key in self.seen:
+            METRICS.incr("duplicates")
+            return key
+        self.seen.add(key)
+        signatures, valid = minhash_signatures([text], self.num_perm, self.seed, self.word_hashes)
+        if not valid[0]:
+            return None
+        signature = signatures[0]
+        band_keys = [keys[0].tobytes() for keys in _band_keys(signatures, self.bands)]
+        for band, band_key in enumerate(band_keys):
+            for other in self.buckets[band].get(band_key, ()):
+                if np.mean(signature == self.signatures[other]) >= self.threshold:
+                    METRICS.incr("duplicates")
+                    return other
+        self.signatures[key] = signature
+        for band, band_key in enumerate(band_keys):
+            self.buckets[band].setdefault(band_key, []).append(key)
+        return None
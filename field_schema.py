@@ -0,0 +1,217 @@
+'''
+Declarative field schema for the PubMed Excel output and the JCR/CSA reference workbooks.
+
+Each FieldSpec maps one source field (a MEDLINE tag such as "TI", or a reference-sheet
+metric such as the JIF) to a typed column of the output Excel. Column positions are
+never hardcoded: output columns follow the schema order, existing files are resolved by
+their header row, and reference sheets are resolved by header name.
+'''
+import re
+from records import intern_value, record_type
+
+
+MEDLINE = "medline"
+JCR = "jcr"
+CSA = "csa"
+DERIVED = "derived"
+
+
+def _first_item(value):
+    # 列表字段取第一个（如 LR 日期字段取最新的）
+    if isinstance(value, list):
+        return value[0] if value else ''
+    return value
+
+
+def _doi_item(value):
+    # DOI 字段：找到包含 [doi] 的项
+    if isinstance(value, list):
+        doi_items = [item for item in value if '[doi]' in item.lower()]
+        if doi_items:
+            return doi_items[0]
+        return value[0] if value else ''
+    return value
+
+
+def _join_items(value):
+    # 其他列表字段用分号连接
+    if isinstance(value, list):
+        return '; '.join(str(x) for x in value)
+    return value
+
+
+class FieldSpec():
+    '''
+    One column of the output Excel.
+
+    Parameters:
+    -----------
+    key : str
+        Source field key (MEDLINE tag for source="medline", internal key otherwise)
+    header : str
+        Column header written into row 1 of the output Excel
+    source : str
+        "medline" (parsed from EFetch), "jcr" or "csa" (looked up in the reference workbook),
+        "derived" (filled in by a later stage, e.g. dedup.py)
+    kind : str
+        "str" or "float", used to coerce values read from the reference workbook
+    extractor : callable, optional
+        Turns the raw MEDLINE value (str or list) into a cell value
+    ref_headers : tuple of str
+        Regex patterns matched against normalized reference-sheet headers
+    legacy_column : int, optional
+        Reference-sheet column used when no header matches (old JCR_CSA_2025.xlsx layout)
+    intern : bool
+        Intern parsed values (for highly repeated fields such as the journal name)
+    '''
+    def __init__(self, key, header, source=MEDLINE, kind="str", extractor=None, ref_headers=(), legacy_column=None, intern=False):
+        self.key = key
+        self.header = header
+        self.source = source
+        self.kind = kind
+        self.extractor = extractor or _join_items
+        self.ref_headers = tuple(ref_headers)
+        self.legacy_column = legacy_column
+        self.intern = intern
+
+    def coerce(self, value):
+        if value is None or self.kind != "float":
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+
+    def __repr__(self):
+        return f"FieldSpec({self.key!r}, {self.header!r}, source={self.source!r})"
+
+
+# 参考表中的期刊名称列（全称 / 缩略名）
+JOURNAL_NAME_HEADERS = (r"journal ?name", r"full ?journal ?title", r"期刊全称", r"期刊名称?", r"journal")
+JOURNAL_ABBR_HEADERS = (r"abbreviated ?journal", r"jcr ?abbreviation", r"iso ?abbreviation", r"abbreviation", r"期刊缩写", r"缩略名", r"期刊简称")
+JOURNAL_NAME_LEGACY_COLUMN = 1
+JOURNAL_ABBR_LEGACY_COLUMN = 2
+
+
+# 默认 13 列结构（列顺序即 Excel 列顺序，键名保持与旧版 excel_property_dic 一致）
+DEFAULT_SCHEMA = (
+    FieldSpec("PMID", "PMID"),
+    FieldSpec("TI", "Title"),
+    FieldSpec("TA", "Journal", intern=True),
+    FieldSpec("IF", "IF", source=JCR, kind="float",
+              ref_headers=(r"(\d{4} ?)?jif( ?\d{4})?", r"impact ?factor", r"if"), legacy_column=7),
+    FieldSpec("Quartile", "JCR_Quartile", source=JCR,
+              ref_headers=(r"jif ?quartile", r"jcr ?quartile", r"quartile"), legacy_column=8),
+    FieldSpec("JCR_Quartile", "CSA_Quartile", source=CSA,
+              ref_headers=(r"(\d{4} ?)?分区", r"csa ?quartile", r"大类分区"), legacy_column=3),
+    FieldSpec("Top", "Top", source=CSA, ref_headers=(r"top",), legacy_column=4),
+    FieldSpec("OA", "Open Access", source=CSA, ref_headers=(r"open ?access", r"oa"), legacy_column=5),
+    FieldSpec("LR", "publish_date", extractor=_first_item),
+    FieldSpec("AB", "Abstract"),
+    FieldSpec("LID", "DOI", extractor=_doi_item),
+    FieldSpec("Duplicate_of", "Duplicate_of", source=DERIVED),
+    FieldSpec("DP", "Publication_Date", extractor=_first_item),   # 新列追加在末尾，不改变已有列的位置
+)
+
+
+def column_map(schema=DEFAULT_SCHEMA):
+    # {key: column index} following schema order, same shape as the old excel_property_dic
+    return {spec.key: index for index, spec in enumerate(schema, start=1)}
+
+
+def fields_for(schema, source):
+    return [spec for spec in schema if spec.source == source]
+
+
+def write_header(ws, schema=DEFAULT_SCHEMA):
+    for column, spec in enumerate(schema, start=1):
+        ws.cell(row=1, column=column).value = spec.header
+
+
+def resolve_columns(ws, schema=DEFAULT_SCHEMA, add_missing=True):
+    '''
+    Resolve {key: column} for an existing output sheet by its header row.
+
+    Headers are matched against both the schema header ("Title") and the key ("TI"),
+    so files written by older versions resolve the same way. Schema fields missing
+    from the sheet are appended as new columns when add_missing is True.
+    '''
+    header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    positions = {}
+    for column, value in enumerate(header_row, start=1):
+        if value is None:
+            continue
+        positions.setdefault(str(value).strip(), column)
+
+    columns = {}
+    next_column = len(header_row) + 1
+    for spec in schema:
+        column = positions.get(spec.header) or positions.get(spec.key)
+        if column is None and add_missing:
+            column = next_column
+            next_column += 1
+            ws.cell(row=1, column=column).value = spec.header
+        if column is not None:
+            columns[spec.key] = column
+    return columns
+
+
+def build_extractor(schema=DEFAULT_SCHEMA):
+    '''
+    Build a function turning a parsed MEDLINE record into a compact slotted Record
+    (see records.py). Only medline-sourced schema fields are visited; everything else
+    in the record is skipped.
+    '''
+    rtype = record_type(schema)
+    wanted = [(spec.key, spec.extractor, spec.intern) for spec in fields_for(schema, MEDLINE)]
+
+    def extract(record):
+        rec = rtype()
+        for key, extractor, intern in wanted:
+            if key in record:
+                value = extractor(record[key])
+                setattr(rec, key, intern_value(value) if intern else value)
+        return rec
+    return extract
+
+
+def _normalize_header(value):
+    return re.sub(r"\s+", " ", str(value).replace("_", " ")).strip().lower()
+
+
+def _find_column(headers, patterns):
+    for pattern in patterns:
+        prog = re.compile(pattern + r"$")
+        for column, header in enumerate(headers, start=1):
+            if header and prog.match(header):
+                return column
+    return None
+
+
+def resolve_reference_columns(header_row, specs):
+    '''
+    Resolve reference-sheet columns by header name.
+
+    Returns {"name": col, "abbr": col, <key>: col, ...} for the fields that could be
+    resolved, or None when the sheet has none of the requested metric columns.
+    '''
+    headers = [_normalize_header(v) if v is not None else '' for v in header_row]
+    columns = {}
+    for spec in specs:
+        column = _find_column(headers, spec.ref_headers)
+        if column is not None:
+            columns[spec.key] = column
+    if not columns:
+        return None
+    name_column = _find_column(headers, JOURNAL_NAME_HEADERS)
+    abbr_column = _find_column(headers, JOURNAL_ABBR_HEADERS)
+    columns["name"] = name_column or JOURNAL_NAME_LEGACY_COLUMN
+    columns["abbr"] = abbr_column or JOURNAL_ABBR_LEGACY_COLUMN
+    return columns
+
+
+def legacy_reference_columns(specs):
+    columns = {spec.key: spec.legacy_column for spec in specs if spec.legacy_column}
+    columns["name"] = JOURNAL_NAME_LEGACY_COLUMN
+    columns["abbr"] = JOURNAL_ABBR_LEGACY_COLUMN
+    return columns
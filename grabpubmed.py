@@ -0,0 +1,696 @@
+'''
+Command-line entry point for unattended runs (cron / CI).
+
+    python grabpubmed.py search -q "(wnt5a NOT cancer) AND fibro*" --days 365 -o ./paper_donload/wnt5a.xlsx
+    python grabpubmed.py enrich ./paper_donload/wnt5a.xlsx
+    python grabpubmed.py refine ./paper_donload/wnt5a.xlsx
+    python grabpubmed.py dedup ./paper_donload/wnt5a.xlsx --collapse
+    python grabpubmed.py render ./paper_donload/wnt5a.xlsx -q "(wnt5a NOT cancer) AND fibro*"
+    python grabpubmed.py analyze ./paper_donload/wnt5a.xlsx -q "(wnt5a NOT cancer) AND fibro*"
+    python grabpubmed.py run -q "(wnt5a NOT cancer) AND fibro*" --days 365 -o ./paper_donload/wnt5a.xlsx
+    python grabpubmed.py plan -q "fibrosis" -o ./paper_donload/fibrosis_plan.json
+    python grabpubmed.py run --plan ./paper_donload/fibrosis_plan.json -o ./paper_donload/fibrosis.xlsx
+    python grabpubmed.py run -q "(wnt5a NOT cancer) AND fibro*" --days 7 -o ./paper_donload/wnt5a_week.xlsx \\
+        --html ./paper_donload/wnt5a_reading_list.html --incremental
+    python grabpubmed.py watch add wnt5a -q "(wnt5a NOT cancer) AND fibro*" --every 30
+    python grabpubmed.py watch serve --port 8600
+
+`run` overlaps the stages: harvest -> enrich -> (Excel + HTML) are connected by bounded
+queues, so enrichment and rendering start as soon as the first EFetch page is parsed.
+
+With --progress json every progress/result/error event is written to stdout as one JSON
+object per line; human-readable library output goes to stderr.
+
+E-utilities responses are cached on disk (http_cache.py; `cache` shows or clears it,
+--no-http-cache bypasses it).
+
+--report writes a JSON run report (stage timings, counters, peak memory, see
+instrumentation.py); --profile cprofile|pyinstrument additionally profiles the command.
+
+Exit codes: 0 success, 1 runtime failure, 2 usage error, 130 interrupted.
+'''
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+# 默认参考表：优先使用 JCR_CSA_2025.xlsx，否则使用仓库自带的 jcr_2025.xlsx
+DEFAULT_REFERENCES = ("JCR_CSA_2025.xlsx", "jcr_2025.xlsx")
+
+_DONE = object()
+_ENRICH_BATCH = 64     # records per vectorised journal-metrics lookup
+
+
+class ProgressReporter():
+    '''
+    Emit progress events either as JSON lines on stdout or as short text lines on stderr.
+    '''
+    def __init__(self, mode="text"):
+        self.mode = mode
+        self.stream = sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        with self._lock:
+            if self.mode == "json":
+                payload = {"event": event, "time": round(time.time(), 3)}
+                payload.update(fields)
+                self.stream.write(json.dumps(payload, ensure_ascii=False, default=str) + "\n")
+                self.stream.flush()
+            elif self.mode == "text":
+                details = " ".join(f"{key}={value}" for key, value in fields.items())
+                sys.stderr.write(f"[{event}] {details}\n")
+                sys.stderr.flush()
+
+    def output(self, text):
+        # 命令结果写到真正的 stdout（main 把库函数的 print 转到了 stderr）；json 模式下作为 output 事件
+        if self.mode == "json":
+            self.emit("output", text=text)
+            return
+        with self._lock:
+            self.stream.write(text + "\n")
+            self.stream.flush()
+
+    def stage_progress(self, stage):
+        # progress(done, total) callback for pubmed_utils
+        def progress(done, total):
+            self.emit("progress", stage=stage, done=done, total=total)
+        return progress
+
+
+def _default_reference():
+    for path in DEFAULT_REFERENCES:
+        if os.path.exists(path):
+            return path
+    return DEFAULT_REFERENCES[0]
+
+
+def _default_html_path(excel_path):
+    out_dir = os.path.dirname(excel_path) or '.'
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(excel_path))[0] + '_reading_list.html')
+
+
+def _search_info(args, save_path):
+    return {
+        'search_keywords': args.query,
+        'paper_type': getattr(args, 'type', None),
+        'release_date_cutoff': getattr(args, 'days', None),
+        'grab_total': getattr(args, 'max', None),
+        'save_path': save_path,
+        'search_date': None,
+    }
+
+
+def _require_file(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such file: {path}")
+
+
+def _require_references(references):
+    # "jcr_2025.xlsx@2024" -> check jcr_2025.xlsx
+    from journal_metrics import split_reference
+    for reference in references:
+        _require_file(split_reference(reference)[0])
+
+
+def _load_plan(args):
+    # --plan 给出时，查询条件以计划为准
+    import planner
+    _require_file(args.plan)
+    plan = planner.load_plan(args.plan)
+    args.query, args.days, args.type, args.max = plan["query"], plan["days"], plan["paper_type"], plan["grab_total"]
+    return plan
+
+
+def _planned_records(utils, plan, args, reporter):
+    import planner
+    return planner.iter_planned_records(utils, plan, args.api_key, db=args.db,
+                                        progress=reporter.stage_progress("harvest"))
+
+
+def cmd_search(args, reporter):
+    from pubmed_utils import pubmed_utils
+    utils = pubmed_utils()
+    records = None
+    if args.plan:
+        records = _planned_records(utils, _load_plan(args), args, reporter)
+    utils.get_main_info_into_excel(args.api_key, args.query, args.days, args.type, args.max, args.out,
+                                   progress=reporter.stage_progress("harvest"), records=records)
+    result = {"excel": args.out}
+    if not args.no_index:
+        from query_engine import LocalCorpus
+        with LocalCorpus(args.db) as corpus:
+            result["indexed"] = corpus.add_excel(args.out)
+    return result
+
+
+def cmd_plan(args, reporter):
+    import planner
+    from pubmed_utils import pubmed_utils
+    plan = planner.plan_harvest(pubmed_utils(), args.api_key, args.query, args.days, args.type, args.max, db=args.db)
+    result = {key: plan[key] for key in ("count", "records", "slicing", "truncated", "local_hits")}
+    result["windows"] = len(plan["windows"])
+    result.update(plan["estimate"])
+    if args.out and args.out != "-":
+        planner.save_plan(plan, args.out)
+        result["plan"] = args.out
+    else:
+        reporter.output(json.dumps(plan, ensure_ascii=False, indent=2))
+    return result
+
+
+def cmd_enrich(args, reporter):
+    from pubmed_utils import pubmed_utils
+    _require_file(args.excel)
+    _require_references(args.jcr)
+    pubmed_utils().embed_IF_into_excel(args.excel, args.jcr)
+    return {"excel": args.excel, "reference": args.jcr}
+
+
+def cmd_refine(args, reporter):
+    from pubmed_utils import pubmed_utils
+    _require_file(args.excel)
+    _require_references([args.jcr])
+    pubmed_utils().refine_IF_matching(args.excel, args.jcr, args.min_similarity)
+    return {"excel": args.excel, "reference": args.jcr}
+
+
+def cmd_dedup(args, reporter):
+    from pubmed_utils import pubmed_utils
+    _require_file(args.excel)
+    stats = pubmed_utils().flag_duplicates_in_excel(args.excel, collapse=args.collapse, threshold=args.threshold)
+    return {"excel": args.excel, **stats}
+
+
+def cmd_render(args, reporter):
+    from html_generate import generate_reading_list
+    _require_file(args.excel)
+    output_html = args.html or _default_html_path(args.excel)
+    search_info = _search_info(args, args.excel) if args.query else None
+    if args.order_by == "score" and not args.query:
+        raise ValueError("--order-by score needs the query (-q) to rank against")
+    generate_reading_list(args.excel, output_html, search_info=search_info, dedup=args.dedup, incremental=args.incremental,
+                          abstracts=args.abstracts, order_by=args.order_by,
+                          rank_weights={"if_weight": args.if_weight, "recency_weight": args.recency_weight},
+                          analytics=args.analytics)
+    return {"html": output_html}
+
+
+def cmd_analyze(args, reporter):
+    import analytics
+    from html_generate import read_table
+    _require_file(args.excel)
+    summary = analytics.summarize(read_table(args.excel), args.query, top_journals=args.top)
+    out = args.out or os.path.splitext(args.excel)[0] + "_analytics.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    reporter.output(f"{summary['records']} records, {len(summary['periods'])} {summary['period']}s; analytics saved to {out}")
+    return {"json": out, "records": summary["records"], "term_totals": summary["term_totals"]}
+
+
+def cmd_cache(args, reporter):
+    from http_cache import ResponseCache
+    cache = ResponseCache()
+    result = {}
+    if args.clear:
+        result["deleted"] = cache.clear()
+    result.update(cache.stats())
+    return result
+
+
+def cmd_index(args, reporter):
+    from query_engine import LocalCorpus
+    indexed = 0
+    with LocalCorpus(args.db) as corpus:
+        for path in args.excel:
+            _require_file(path)
+            indexed += corpus.add_excel(path)
+            print(f"Indexed {path}")
+        total = len(corpus)
+        db_path = corpus.path
+    return {"indexed": indexed, "corpus_records": total, "db": db_path}
+
+
+def cmd_query(args, reporter):
+    from query_engine import LocalCorpus
+    with LocalCorpus(args.db) as corpus:
+        rows = corpus.search(args.query, limit=args.limit)
+    result = {"matches": len(rows)}
+    if args.out:
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet")
+        headers = [spec.header for spec in corpus.schema]
+        ws.append(headers)
+        for row in rows:
+            ws.append([row.get(header) for header in headers])
+        wb.save(args.out)
+        result["excel"] = args.out
+    if args.html:
+        from html_generate import generate_reading_list
+        generate_reading_list(rows, args.html, search_info={"search_keywords": args.query, "grab_total": len(rows)},
+                              order_by=args.order_by, analytics=args.analytics)
+        result["html"] = args.html
+    if not args.out and not args.html:
+        for row in rows[:20]:
+            reporter.output(f"{row.get('PMID')}  {row.get('publish_date') or '':8}  {row.get('Journal') or '':24.24}  {row.get('Title') or ''}")
+        if len(rows) > 20:
+            print(f"... {len(rows) - 20} more (use -o / --html to export)")
+    return result
+
+
+def _watch_service(args):
+    from watch_service import WatchRegistry, WatchService
+    references = None if args.no_enrich else args.jcr
+    if references:
+        _require_references(references)
+    return WatchService(WatchRegistry(args.watches), api_key=args.api_key, references=references, db=args.db)
+
+
+def cmd_watch_add(args, reporter):
+    from watch_service import WatchRegistry
+    registry = WatchRegistry(args.watches)
+    watch = registry.add(args.name, args.query, args.type, args.days, args.every, args.html)
+    return {"watch": args.name, "html": watch["html"], "watches": registry.path}
+
+
+def cmd_watch_remove(args, reporter):
+    from watch_service import WatchRegistry
+    WatchRegistry(args.watches).remove(args.name)
+    return {"removed": args.name}
+
+
+def cmd_watch_list(args, reporter):
+    from watch_service import WatchRegistry
+    watches = WatchRegistry(args.watches).all()
+    for name, watch in sorted(watches.items()):
+        reporter.output(f"{name:16} every {watch['every']:g} min  last run {watch.get('last_run') or 'never':19}  "
+              f"{watch.get('total', 0):6} records  {watch['query']}")
+    return {"watches": len(watches)}
+
+
+def cmd_watch_run(args, reporter):
+    service = _watch_service(args)
+    try:
+        names = args.names or sorted(service.registry.all())
+        for name in names:
+            service.registry.get(name)
+        results = service.run_due(names)
+    finally:
+        service.close()
+    failed = [name for name, result in results.items() if "error" in result]
+    if failed:
+        raise RuntimeError(f"watch run failed: {', '.join(failed)}")
+    return {"runs": results}
+
+
+def cmd_watch_serve(args, reporter):
+    service = _watch_service(args)
+    try:
+        service.serve(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    return {"watches": len(service.registry.all())}
+
+
+def run_pipeline(args, reporter):
+    '''
+    harvest -> enrich -> sink (Excel + HTML), connected by bounded queues.
+
+    Each stage runs in its own thread; a full queue blocks the upstream stage, so memory
+    stays bounded by queue_size records. The first failing stage stops the others.
+    '''
+    import openpyxl
+    from pubmed_utils import pubmed_utils
+    from html_generate import ReadingListUpdater, ReadingListWriter
+    from instrumentation import METRICS
+    from journal_metrics import publication_year
+
+    utils = pubmed_utils()
+    schema = utils.schema
+    plan = _load_plan(args) if args.plan else None
+    reference = None if args.no_enrich else args.jcr
+    if reference:
+        _require_references(reference)
+    output_html = args.html or _default_html_path(args.out)
+
+    harvested = queue.Queue(maxsize=args.queue_size)
+    enriched = queue.Queue(maxsize=args.queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def guarded(stage, target, downstream):
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                errors.append((stage, e))
+                stop.set()
+            finally:
+                if downstream is not None:
+                    put(downstream, _DONE)
+        return threading.Thread(target=run, name=stage, daemon=True)
+
+    def harvest():
+        if plan is not None:
+            records = _planned_records(utils, plan, args, reporter)
+        else:
+            records = utils.iter_pubmed_records(args.api_key, args.query, args.days, args.type, args.max,
+                                                progress=reporter.stage_progress("harvest"))
+        for values in records:
+            if not put(harvested, values):
+                return
+
+    enrich_stats = {"matched": 0, "unmatched": 0}
+    if args.dedup:
+        import dedup
+        index = dedup.LSHIndex(threshold=args.dedup_threshold)
+        enrich_stats["duplicates"] = 0
+
+    def next_batch():
+        # 阻塞等待第一条记录，再取走队列中已有的记录（最多 _ENRICH_BATCH 条），按批查询
+        batch = [get(harvested)]
+        while batch[-1] is not _DONE and len(batch) < _ENRICH_BATCH:
+            try:
+                batch.append(harvested.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def enrich():
+        # 参考表在 ESearch / 第一页 EFetch 进行时并行加载
+        store = utils.load_metrics_store(reference) if reference else None
+        while True:
+            batch = next_batch()
+            done = batch[-1] is _DONE
+            if done:
+                batch.pop()
+            if args.dedup:
+                kept = []
+                for values in batch:
+                    canonical = index.add(dedup.record_pmid(values), dedup.record_text(values))
+                    if canonical is not None:
+                        enrich_stats["duplicates"] += 1
+                        if args.dedup == "collapse":
+                            continue
+                        dedup.set_duplicate(values, canonical)
+                    kept.append(values)
+                batch = kept
+            if store is not None:
+                named = [values for values in batch if values.TA]
+                years = [publication_year(values.DP, values.LR) for values in named]
+                results = utils.lookup_journal_metrics([values.TA for values in named], years, store) if named else []
+                for values, (updates, methods) in zip(named, results):
+                    values.update(updates)
+                    enrich_stats["matched" if any(methods.values()) else "unmatched"] += 1
+            for values in batch:
+                if not put(enriched, values):
+                    return
+            if done:
+                return
+
+    threads = [guarded("harvest", harvest, harvested), guarded("enrich", enrich, enriched)]
+    for thread in threads:
+        thread.start()
+
+    # sink: 主线程写 Excel 和 HTML
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet")
+    ws.append([spec.header for spec in schema])
+    writer = None
+    if args.incremental and os.path.exists(output_html):
+        try:
+            writer = ReadingListUpdater(output_html, _search_info(args, args.out), abstracts=args.abstracts)
+        except ValueError as e:
+            print(f"{e}; writing a full reading list instead")
+    if writer is None:
+        writer = ReadingListWriter(output_html, _search_info(args, args.out), abstracts=args.abstracts)
+    corpus = None
+    if not args.no_index:
+        from query_engine import LocalCorpus
+        corpus = LocalCorpus(args.db, schema)
+    pending = []
+    indexed = 0
+    written = 0
+    try:
+        with writer:
+            while True:
+                values = get(enriched)
+                if values is _DONE:
+                    break
+                t0 = time.perf_counter()
+                ws.append(values.row())
+                METRICS.add_time("excel_write", time.perf_counter() - t0)
+                writer.add(values)
+                written += 1
+                if corpus is not None:
+                    # 本地语料库按批写入（一个事务一批）
+                    pending.append(values)
+                    if len(pending) >= args.queue_size:
+                        indexed += corpus.add(pending)
+                        pending = []
+                if written % args.queue_size == 0:
+                    reporter.emit("progress", stage="render", done=written)
+            if errors:
+                raise errors[0][1]
+            if corpus is not None and pending:
+                indexed += corpus.add(pending)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if corpus is not None:
+            corpus.close()
+    if errors:
+        raise errors[0][1]
+
+    with METRICS.stage("excel_save"):
+        wb.save(args.out)
+    print(f"Data saved to {args.out}")
+    result = {"records": written, "excel": args.out, "html": output_html, **enrich_stats}
+    if corpus is not None:
+        result["indexed"] = indexed
+    if isinstance(writer, ReadingListUpdater):
+        result.update(new_cards=writer.count, already_listed=writer.skipped)
+    return result
+
+
+def _add_search_arguments(parser):
+    parser.add_argument("-q", "--query", default=None, help="PubMed query (AND / OR / NOT, field tags, wildcards)")
+    parser.add_argument("--plan", default=None, help="execute a saved plan (see the plan command) instead of -q / --days / --type / --max")
+    parser.add_argument("--api-key", default=os.environ.get("PUBMED_API_KEY"), help="NCBI API key (default: $PUBMED_API_KEY)")
+    parser.add_argument("--days", type=int, default=None, help="only papers released in the last N days")
+    parser.add_argument("--type", default="Journal Article", help='publication type filter, "" to disable')
+    parser.add_argument("--max", type=int, default=None, help="maximum number of records to fetch")
+    parser.add_argument("-o", "--out", required=True, help="Excel output path")
+    parser.add_argument("--no-index", action="store_true", help="do not add the records to the local corpus (see the query command)")
+    parser.add_argument("--db", default=None, help="local corpus database (default: corpus.sqlite in the cache directory)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="grabpubmed", description="PubMed harvest, journal enrichment and reading list generation")
+    parser.add_argument("--progress", choices=("text", "json", "none"), default="text",
+                        help="progress output: text (stderr), json (JSON lines on stdout) or none")
+    parser.add_argument("--report", default=None, help="write a JSON run report (timings, counters, memory) to this path")
+    parser.add_argument("--profile", choices=("cprofile", "pyinstrument"), default=None, help="profile the command")
+    parser.add_argument("--profile-out", default=None, help="profile output path (default: grabpubmed.prof / grabpubmed_profile.html)")
+    parser.add_argument("--no-http-cache", action="store_true", help="bypass the on-disk E-utilities response cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("search", help="query PubMed and save records to Excel")
+    _add_search_arguments(p)
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("plan", help="dry run: ESearch only, report counts, date windows, local hits and expected requests / time")
+    p.add_argument("-q", "--query", required=True, help="PubMed query (AND / OR / NOT, field tags, wildcards)")
+    p.add_argument("--api-key", default=os.environ.get("PUBMED_API_KEY"), help="NCBI API key (default: $PUBMED_API_KEY)")
+    p.add_argument("--days", type=int, default=None, help="only papers released in the last N days")
+    p.add_argument("--type", default="Journal Article", help='publication type filter, "" to disable')
+    p.add_argument("--max", type=int, default=None, help="maximum number of records to fetch")
+    p.add_argument("--db", default=None, help="local corpus checked for stored records (default: corpus.sqlite in the cache directory)")
+    p.add_argument("-o", "--out", default=None, help="save the plan as JSON (default or \"-\": print it to stdout)")
+    p.set_defaults(func=cmd_plan)
+
+    p = sub.add_parser("enrich", help="add IF / quartile / CSA info to an existing Excel")
+    p.add_argument("excel")
+    p.add_argument("--jcr", nargs="+", default=[_default_reference()],
+                   help="JCR/CSA reference workbook(s), one per edition year (path@year to set the year)")
+    p.set_defaults(func=cmd_enrich)
+
+    p = sub.add_parser("refine", help="fuzzy-match journals left unmatched by enrich")
+    p.add_argument("excel")
+    p.add_argument("--jcr", default=_default_reference(), help="JCR/CSA reference workbook")
+    p.add_argument("--min-similarity", type=float, default=0.6)
+    p.set_defaults(func=cmd_refine)
+
+    p = sub.add_parser("dedup", help="flag or remove duplicate / near-duplicate records")
+    p.add_argument("excel")
+    p.add_argument("--collapse", action="store_true", help="delete duplicates instead of filling the Duplicate_of column")
+    p.add_argument("--threshold", type=float, default=0.8, help="title + abstract similarity (estimated Jaccard)")
+    p.set_defaults(func=cmd_dedup)
+
+    p = sub.add_parser("cache", help="show (or clear) the on-disk E-utilities response cache")
+    p.add_argument("--clear", action="store_true", help="delete every cached response")
+    p.set_defaults(func=cmd_cache)
+
+    p = sub.add_parser("index", help="add saved Excel files to the local corpus")
+    p.add_argument("excel", nargs="+")
+    p.add_argument("--db", default=None, help="local corpus database (default: corpus.sqlite in the cache directory)")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser("query", help="run a PubMed-style query against the local corpus (no network)")
+    p.add_argument("query", help="AND / OR / NOT, parentheses, wildcards, field tags ([tiab], [ti], [ta], [dp], [pmid], ...)")
+    p.add_argument("--db", default=None, help="local corpus database (default: corpus.sqlite in the cache directory)")
+    p.add_argument("--limit", type=int, default=None, help="maximum number of records (newest first)")
+    p.add_argument("-o", "--out", default=None, help="write the matches to this Excel file")
+    p.add_argument("--html", default=None, help="write the matches as a reading list")
+    p.add_argument("--order-by", choices=("score",), default=None, help="order reading-list cards by BM25 relevance")
+    p.add_argument("--analytics", action="store_true", help="chart papers per month / journal / quartile / term in the summary")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("render", help="generate the HTML reading list")
+    p.add_argument("excel", help="Excel / CSV, or Parquet / Feather / Arrow (streamed batch by batch)")
+    p.add_argument("--html", default=None, help="HTML output path (default: <excel>_reading_list.html)")
+    p.add_argument("-q", "--query", default=None, help="query used for keyword highlighting")
+    p.add_argument("--dedup", choices=("flag", "collapse"), default=None, help="badge or drop near-duplicate records")
+    p.add_argument("--incremental", action="store_true", help="only add records missing from an existing HTML, marked as new")
+    p.add_argument("--abstracts", choices=("inline", "embedded", "sidecar"), default="inline",
+                   help="inline abstracts, or compressed chunks (in the page / next to it) loaded on scroll")
+    p.add_argument("--order-by", choices=("score",), default=None, help="order cards by BM25 relevance to the query")
+    p.add_argument("--if-weight", type=float, default=0.0, help="weight of the impact factor in the score")
+    p.add_argument("--recency-weight", type=float, default=0.0, help="weight of publication recency in the score")
+    p.add_argument("--analytics", action="store_true", help="chart papers per month / journal / quartile / term in the summary")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser("analyze", help="count papers per month / journal / quartile / query term (JSON)")
+    p.add_argument("excel", help="Excel / CSV / Parquet / Feather / Arrow")
+    p.add_argument("-q", "--query", default=None, help="query whose highlighted terms get a per-month series")
+    p.add_argument("-o", "--out", default=None, help="JSON output path (default: <excel>_analytics.json)")
+    p.add_argument("--top", type=int, default=10, help="number of journals listed")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("run", help="search + enrich + render, pipelined")
+    _add_search_arguments(p)
+    p.add_argument("--jcr", nargs="+", default=[_default_reference()],
+                   help="JCR/CSA reference workbook(s), one per edition year (path@year to set the year)")
+    p.add_argument("--no-enrich", action="store_true", help="skip journal enrichment")
+    p.add_argument("--html", default=None, help="HTML output path (default: <out>_reading_list.html)")
+    p.add_argument("--queue-size", type=int, default=200, help="bounded queue size between stages")
+    p.add_argument("--dedup", choices=("flag", "collapse"), default=None, help="flag or drop near-duplicate records while streaming")
+    p.add_argument("--dedup-threshold", type=float, default=0.8, help="title + abstract similarity (estimated Jaccard)")
+    p.add_argument("--incremental", action="store_true", help="only add records missing from an existing HTML, marked as new")
+    p.add_argument("--abstracts", choices=("inline", "embedded", "sidecar"), default="inline",
+                   help="inline abstracts, or compressed chunks (in the page / next to it) loaded on scroll")
+    p.set_defaults(func=run_pipeline)
+
+    p = sub.add_parser("watch", help="re-run registered queries on a schedule and serve the reading lists locally")
+    watch_sub = p.add_subparsers(dest="watch_command", required=True)
+    w = watch_sub.add_parser("add", help="register or redefine a watch")
+    w.add_argument("name", help="watch name (letters, digits, _ - .), used in URLs")
+    w.add_argument("-q", "--query", required=True, help="PubMed query (AND / OR / NOT, field tags, wildcards)")
+    w.add_argument("--type", default="Journal Article", help='publication type filter, "" to disable')
+    w.add_argument("--days", type=int, default=30, help="days covered by the first run (later runs fetch the delta)")
+    w.add_argument("--every", type=float, default=60, help="minutes between runs")
+    w.add_argument("--html", default=None, help="reading list path (default: <name>_reading_list.html next to the registry)")
+    w.set_defaults(func=cmd_watch_add)
+    w = watch_sub.add_parser("remove", help="unregister a watch (its reading list is kept)")
+    w.add_argument("name")
+    w.set_defaults(func=cmd_watch_remove)
+    w = watch_sub.add_parser("list", help="show the registered watches")
+    w.set_defaults(func=cmd_watch_list)
+    for command, func, help_text in (("run", cmd_watch_run, "run watches once now (for cron)"),
+                                     ("serve", cmd_watch_serve, "run watches on schedule and serve them over HTTP")):
+        w = watch_sub.add_parser(command, help=help_text)
+        w.add_argument("--api-key", default=os.environ.get("PUBMED_API_KEY"), help="NCBI API key (default: $PUBMED_API_KEY)")
+        w.add_argument("--jcr", nargs="+", default=[_default_reference()],
+                       help="JCR/CSA reference workbook(s), one per edition year (path@year to set the year)")
+        w.add_argument("--no-enrich", action="store_true", help="skip journal enrichment")
+        w.add_argument("--db", default=None, help="local corpus database (default: corpus.sqlite in the cache directory)")
+        w.set_defaults(func=func)
+    w.add_argument("--host", default="127.0.0.1", help="address to bind (default: localhost only)")
+    w.add_argument("--port", type=int, default=8600)
+    watch_sub.choices["run"].add_argument("names", nargs="*", help="watches to run (default: all)")
+    for w in watch_sub.choices.values():
+        w.add_argument("--watches", default=None, help="watch registry (default: watches.json in the cache directory)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+        if args.command in ("search", "run") and args.query is None and args.plan is None:
+            parser.error(f"{args.command}: one of -q/--query or --plan is required")
+    except SystemExit as e:
+        return EXIT_USAGE if e.code else EXIT_OK
+
+    from instrumentation import METRICS, profiled
+
+    if args.no_http_cache:
+        from pubmed_utils import pubmed_utils
+        pubmed_utils.response_cache = False
+
+    reporter = ProgressReporter(args.progress)
+    started = time.time()
+    METRICS.reset()
+    METRICS.set_meta(command=args.command, argv=sys.argv[1:] if argv is None else list(argv))
+    reporter.emit("start", command=args.command)
+    exit_code = EXIT_OK
+    result = None
+    try:
+        # 库函数的 print 输出转到 stderr，保持 stdout 只有机器可读的事件
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.profile:
+                default_out = "grabpubmed.prof" if args.profile == "cprofile" else "grabpubmed_profile.html"
+                with profiled(args.profile, args.profile_out or default_out):
+                    result = args.func(args, reporter)
+            else:
+                result = args.func(args, reporter)
+    except KeyboardInterrupt:
+        reporter.emit("error", command=args.command, message="interrupted")
+        exit_code = EXIT_INTERRUPTED
+    except Exception as e:
+        reporter.emit("error", command=args.command, message=f"{type(e).__name__}: {e}")
+        exit_code = EXIT_FAILURE
+
+    METRICS.sample_memory("end")
+    METRICS.set_meta(exit_code=exit_code)
+    if args.report:
+        METRICS.write_report(args.report)
+    if exit_code == EXIT_OK:
+        result = dict(result or {})
+        if args.report:
+            result["report"] = args.report
+        reporter.emit("done", command=args.command, elapsed=round(time.time() - started, 3), **result)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,42 @@
-import pandas as pd
 import re
+import base64
+import gzip
 import html
+import json
 import os
+import shutil
+import tempfile
+import time
+import uuid
+import zlib
 from datetime import datetime
+import query_engine
+from instrumentation import METRICS
+from records import first_value
 
 
-def _build_pattern_from_query(query):
-    # Build a regex alternation pattern from a search query. Handles * wildcard and removes common boolean operators.
-    if not query or not isinstance(query, str):
-        return None
-    tokens = re.split(r"\s+", query)
-    cleaned = []
-    skip_next = False  # 追踪 NOT 操作符
-
-    for t in tokens:
-        up = t.upper()
-
-        # 遇到 NOT 操作符，标记跳过下一个词
-        if up == "NOT":
-            skip_next = True
-            continue
+COLORS = ['#ffd54f', '#ff79c6', '#8be9fd', '#50fa7b', '#ffb86b']
 
-        # 跳过 AND、OR 并重置 NOT 标志
-        if up in ("AND", "OR"):
-            skip_next = False
-            continue
+# 摘要输出方式：卡片内联 / 页内压缩块 / 旁路压缩文件
+ABSTRACT_MODES = ("inline", "embedded", "sidecar")
 
-        # 移除括号和字段限定符
-        t = t.strip('()')
-        if '[' in t:
-            t = t.split('[')[0]
-        t = t.strip('"')
+# 增量更新用的插入点（各占一行）
+_SIDEBAR_MARKER = '<!-- reading-list:sidebar -->'
+_CARDS_MARKER = '<!-- reading-list:cards -->'
+_SIDEBAR_SLOT = '\0sidebar-links\0'   # placeholder split out of the rendered head; the spooled links go there
+_CARD_ID_RE = re.compile(r'<div class="article-card[^"]*" id="article-([^"]+)"')
+_META_RE = re.compile(r'<meta name="(reading-list-[a-z]+)" content="([^"]*)">')
 
-        # 忽略无效的 token
-        if not re.search(r"[A-Za-z0-9*]", t):
-            continue
 
-        # 跳过 NOT 操作的词（如： NOT cancer）
-        if skip_next:
-            skip_next = False
-            continue
-
-        cleaned.append(t)
+def _build_pattern_from_query(query):
+    # Build a regex alternation pattern from the query AST (query_engine.py): title / abstract terms outside NOT,
+    # whole words, phrases across punctuation, * as prefix wildcard. Unparsable queries fall back to the plain term list.
+    if not query or not isinstance(query, str):
+        return None
+    try:
+        return query_engine.highlight_pattern(query_engine.parse(query))
+    except query_engine.QuerySyntaxError:
+        cleaned = query_engine.query_terms(query)
 
     patterns = []
     for t in cleaned:
@@ -58,113 +53,101 @@ def _build_pattern_from_query(query):
     return r'(?i)(' + '|'.join(patterns) + r')'
 
 
-def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
-    # Generate a night-mode HTML reading list from CSV/Excel or a DataFrame with interactive features.
-    # Optional search_info dict may contain 'search_keywords', 'paper_type', 'release_date_cutoff', 'grab_total', 'save_path', 'search_date'.
-    try:
-        if isinstance(input_path_or_df, pd.DataFrame):
-            df = input_path_or_df
-        else:
-            input_path = str(input_path_or_df)
-            _, ext = os.path.splitext(input_path)
-            ext = ext.lower()
-            if ext in ('.xls', '.xlsx'):
-                df = pd.read_excel(input_path, sheet_name=0)
-            else:
-                df = pd.read_csv(input_path)
-    except Exception as e:
-        print(f"Failed to read input: {e}")
-        return
-
-    pattern = None
-    if search_info and 'search_keywords' in search_info:
-        pattern = _build_pattern_from_query(search_info.get('search_keywords'))
-    if not pattern:
-        sample = ''
-        if 'Title' in df.columns or 'TI' in df.columns:
-            col = 'Title' if 'Title' in df.columns else 'TI'
-            vals = df[col].dropna().values
-            sample = str(vals[0]) if len(vals)>0 else ''
-            words = re.findall(r"[A-Za-z0-9]{3,}", sample)
-            if words:
-                pattern = r'(?i)(' + re.escape(words[0]) + r')'
-
-    colors = ['#ffd54f', '#ff79c6', '#8be9fd', '#50fa7b', '#ffb86b']
-
-    def _make_highlighter(pat):
-        if not pat:
-            return lambda s: s
-        prog = re.compile(pat)
-        counter = {'i': 0}
-        def repl(m):
-            idx = counter['i'] % len(colors)
-            color = colors[idx]
-            counter['i'] += 1
-            return f'<span style="color: {color}; font-weight:700;">{m.group(0)}</span>'
-        return lambda s: prog.sub(repl, s)
-
-    highlighter = _make_highlighter(pattern)
-
-    def truncate_text(text, length=1500):
-        if not isinstance(text, str):
-            return ""
-        if len(text) > length:
-            return text[:length] + "..."
-        return text
-
-    search_block_html = ''
-    if search_info:
-        sd = search_info.get('search_date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        sk = search_info.get('search_keywords', 'N/A')
-        pt = search_info.get('paper_type', 'N/A')
-        rc = search_info.get('release_date_cutoff', None)
-        rc_text = f"last {rc} days" if rc else 'all time'
-        gt = search_info.get('grab_total_requested', search_info.get('grab_total', 'all'))
-        savep = search_info.get('save_path', '')
-
-        # Search summary block displayed on top of the HTML
-        search_block_html = f'''\
+def _make_highlighter(pat):
+    # Wrap every match in a colored span, rotating through COLORS across the whole document.
+    if not pat:
+        return lambda s: s
+    prog = re.compile(pat)
+    counter = {'i': 0}
+    def repl(m):
+        idx = counter['i'] % len(COLORS)
+        color = COLORS[idx]
+        counter['i'] += 1
+        return f'<span style="color: {color}; font-weight:700;">{m.group(0)}</span>'
+    return lambda s: prog.sub(repl, s)
+
+
+def _truncate_text(text, length=1500):
+    if not isinstance(text, str):
+        return ""
+    if len(text) > length:
+        return text[:length] + "..."
+    return text
+
+
+def _bar_chart(title, items, vertical=False):
+    # Pre-rendered CSS bars: items are (label, count); heights / widths are percentages of the maximum
+    items = list(items)
+    peak = max((count for _, count in items), default=0) or 1
+    if vertical:
+        bars = ''.join(f'<span class="bar" style="height:{100 * count / peak:.1f}%" title="{html.escape(str(label))}: {count}"></span>'
+                       for label, count in items)
+        axis = f'<div class="axis"><span>{html.escape(str(items[0][0]))}</span><span>{html.escape(str(items[-1][0]))}</span></div>' if items else ''
+        return f'<div class="chart"><h3>{html.escape(title)}</h3><div class="bars">{bars}</div>{axis}</div>'
+    bars = ''.join(f'<div class="hbar"><span class="label">{html.escape(str(label))}</span>'
+                   f'<span class="fill" style="width:{100 * count / peak:.1f}%"></span><span class="n">{count}</span></div>'
+                   for label, count in items)
+    return f'<div class="chart"><h3>{html.escape(title)}</h3>{bars}</div>'
+
+
+def _render_analytics(summary):
+    # Charts of analytics.summarize() plus the summary itself as JSON (id="reading-list-analytics")
+    if not summary:
+        return ''
+    periods = summary['periods']
+    per = summary['period']
+    charts = [_bar_chart(f"Papers per {per}", zip(periods, summary['by_period']), vertical=True)]
+    for term, series in summary['terms'].items():
+        charts.append(_bar_chart(f'"{term}" per {per} ({summary["term_totals"][term]} papers)', zip(periods, series), vertical=True))
+    year_only = summary.get('year_only') or {}
+    if year_only:
+        charts.append(_bar_chart(f"Papers with a year but no month ({sum(year_only.values())})", year_only.items(), vertical=True))
+    charts.append(_bar_chart("Top journals", summary['by_journal']))
+    charts.append(_bar_chart("JCR quartile", summary['by_quartile'].items()))
+    payload = json.dumps(summary, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    undated = f' ({summary["undated"]} without a publication year)' if summary['undated'] else ''
+    return (f'<div class="analytics"><h2>Publication trends: {summary["records"]} records{undated}</h2>'
+            f'{"".join(charts)}</div>'
+            f'<script type="application/json" id="reading-list-analytics">{payload}</script>')
+
+
+def _render_search_block(search_info, analytics_html=''):
+    if not search_info:
+        if analytics_html:
+            return f'<div class="search-summary" id="search-summary">{analytics_html}</div>'
+        return ''
+    sd = search_info.get('search_date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    sk = search_info.get('search_keywords', 'N/A')
+    pt = search_info.get('paper_type', 'N/A')
+    rc = search_info.get('release_date_cutoff', None)
+    rc_text = f"last {rc} days" if rc else 'all time'
+    gt = search_info.get('grab_total_requested', search_info.get('grab_total', 'all'))
+    savep = search_info.get('save_path', '')
+
+    # Search summary block displayed on top of the HTML
+    return f'''\
         <div class="search-summary" id="search-summary">\
             <h1>Search Summary (Night mode)</h1>\
             <div class="search-meta">\
                 <div><strong>Search time:</strong> {sd}</div>\
-                <div><strong>Query:</strong> <code class="query">{html.escape(sk)}</code></div>\
+                <div><strong>Query:</strong> <code class="query">{html.escape(str(sk))}</code></div>\
                 <div><strong>Paper type:</strong> {html.escape(str(pt))}  <strong>Time range:</strong> {html.escape(rc_text)}</div>\
                 <div><strong>Requested count:</strong> {html.escape(str(gt))}  <strong>Save path:</strong> {html.escape(str(savep))}</div>\
             </div>\
+            {analytics_html}\
         </div>\
         '''
 
-    # 添加交互式JavaScript和CSS
-
-    # Generate sidebar bookmark links
-    sidebar_links_html = ""
-    for idx, row in df.iterrows():
-        # 使用实际的Excel列名
-        journal_raw = row.get('Journal', row.get('Journal (TA)', row.get('TA', '')))
-        journal = str(journal_raw).strip() if pd.notna(journal_raw) else "Unknown"
-        
-        pub_date_raw = row.get('publish_date', row.get('Publish Date (LR)', row.get('LR', '')))
-        if pd.notna(pub_date_raw) and str(pub_date_raw).strip():
-            pub_date = str(pub_date_raw).replace("-", "").replace("/", "").replace(" ", "")
-        else:
-            pub_date = "Unknown"
-        bookmark_text = f"{journal}. {pub_date}"
-        # 添加状态指示器容器
-        sidebar_links_html += f'            <li><a href="#article-{idx}" data-article-id="{idx}"><span class="bookmark-indicators" id="indicators-{idx}"></span>{html.escape(bookmark_text)}</a></li>\n'
-
-    # Extract unique identifier from output filename for localStorage isolation
-    storage_key_suffix = os.path.splitext(os.path.basename(output_html_path))[0]
-    # Sanitize: remove special chars, limit length
-    storage_key_suffix = re.sub(r'[^a-zA-Z0-9_]', '_', storage_key_suffix)[:50]
 
-    html_content = f'''
+def _render_head(sidebar_links_html, search_block_html, meta_html=''):
+    return f'''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <title>Reading List (Night mode)</title>
         <meta name="viewport" content="width=device-width, initial-scale=1">
+{meta_html}
         <style>
             /* Sidebar styles */
             .sidebar {{ position: fixed; left: 0; top: 0; width: 280px; height: 100%; background: #2a2a2a; border-right: 1px solid #444; overflow-y: auto; padding: 20px; z-index: 1000; transition: transform 0.3s; }}
@@ -190,10 +173,24 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
             .search-summary h1 {{ margin:0 0 8px 0; color:var(--accent); font-size:1.6em }}
             .search-meta div {{ margin:6px 0; color:var(--muted) }}
             .query {{ background: rgba(255,255,255,0.03); padding:6px 8px; border-radius:6px; color:var(--text); font-family:monospace }}
+            .analytics {{ display:grid; grid-template-columns: repeat(auto-fill, minmax(280px, 1fr)); gap:16px; margin-top:14px; }}
+            .analytics h2 {{ grid-column: 1 / -1; margin:0; font-size:1.1em; color:var(--accent); }}
+            .chart h3 {{ margin:0 0 6px 0; font-size:0.9em; color:var(--muted); font-weight:normal; }}
+            .chart .bars {{ display:flex; align-items:flex-end; gap:1px; height:70px; border-bottom:1px solid var(--border); }}
+            .chart .bar {{ flex:1; min-width:1px; background:var(--accent); opacity:0.75; }}
+            .chart .axis {{ display:flex; justify-content:space-between; font-size:0.75em; color:var(--muted); }}
+            .chart .hbar {{ display:flex; align-items:center; gap:6px; font-size:0.8em; margin:2px 0; }}
+            .chart .hbar .label {{ width:110px; overflow:hidden; text-overflow:ellipsis; white-space:nowrap; color:var(--muted); }}
+            .chart .hbar .fill {{ height:10px; background:var(--accent); opacity:0.75; border-radius:2px; }}
 
             .article-card {{ background:var(--card); padding:30px; margin-bottom:18px; box-shadow: 0 6px 18px rgba(2,6,23,0.6); border:1px solid var(--border); border-radius:10px; page-break-inside:avoid; position:relative; transition: border-color 0.3s }}
             .article-card.starred {{ border-left: 4px solid #ffd700; }}
             .article-card.read {{ opacity: 0.6; }}
+            .article-card.duplicate {{ border-style: dashed; opacity: 0.75; }}
+            .duplicate-badge {{ background: rgba(255,184,108,0.15); color: #ffb86c; text-decoration: none; }}
+            .article-card.new {{ border-left: 4px solid #50fa7b; }}
+            .article-card.new .article-title::before {{ content: "NEW "; color: #50fa7b; font-size: 0.7em; vertical-align: middle; }}
+            .sidebar a.new {{ color: #50fa7b; }}
             
             .article-title {{ color:var(--accent); font-size:1.3em; font-weight:700; margin-bottom:8px }}
             .article-meta {{ color:var(--muted); font-size:0.95em; margin-bottom:14px }}
@@ -222,6 +219,7 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
         <h2>📑 Bookmarks</h2>
         <ul>
             <li><a href="#search-summary">Research Summary</a></li>
+            {_SIDEBAR_MARKER}
     {sidebar_links_html}
         </ul>
     </div>
@@ -229,66 +227,23 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
     {search_block_html}
     '''
 
-    for index, row in df.iterrows():
-        title = str(row.get('Title', row.get('TI', 'No Title')))
-        journal = str(row.get('Journal', row.get('TA', '')))
-        publish_date = str(row.get('publish_date', row.get('LR', '')))
-        abstract = str(row.get('Abstract', row.get('AB', '')))
-        pmid = str(row.get('PMID', ''))
-        doi = str(row.get('DOI', row.get('LID', '')))
-        impact_factor = str(row.get('IF', ''))
-        quartile = str(row.get('JCR_Quartile', row.get('Quartile', '')))
-
-        display_abstract = truncate_text(abstract, length=2000)
-        safe_title = html.escape(title)
-        safe_abstract = html.escape(display_abstract)
-        highlighted_title = highlighter(safe_title) if pattern else safe_title
-        highlighted_abstract = highlighter(safe_abstract) if pattern else safe_abstract
-
-        # 创建书签标题（期刊名+日期）
-        bookmark_title = f"{journal} - {publish_date}"
-        article_id = f"article-{index}"
-
-        meta_html = f'<span class="journal-info">{journal}</span>. {publish_date}.'
-        metrics_html = ''
-        if impact_factor and impact_factor != 'nan':
-            metrics_html += f'<span class="metrics">IF: {impact_factor}</span>'
-        if quartile and quartile != 'nan':
-            metrics_html += f'<span class="metrics">{quartile}</span>'
-
-        article_html = f'''
-        <div class="article-card" id="{article_id}" data-bookmark-title="{html.escape(bookmark_title)}">
-            <div class="action-buttons">
-                <button class="action-btn star-btn" onclick="toggleStar(this)" title="星标重点">⭐</button>
-                <button class="action-btn read-btn" onclick="toggleRead(this)" title="标记已读">✓</button>
-            </div>
-            <div class="article-title">{highlighted_title}</div>
-            <div class="article-meta">
-                {meta_html} <br>
-                {metrics_html}
-            </div>
-            <div class="abstract-section">
-                <span class="abstract-label">Abstract</span>
-                <div class="abstract-text">
-                    {highlighted_abstract}
-                </div>
-            </div>
-            <div class="article-ids">
-                PMID: {pmid} &nbsp;|&nbsp; DOI: {doi}
-            </div>
-        </div>
-        '''
-        html_content += article_html
 
 # 添加交互式JavaScript
-    html_content += '''
+_SCRIPT_HTML = '''
     <script>
-        // Unique storage key suffix to isolate localStorage for different queries
-        const STORAGE_KEY_PREFIX = '{storage_key_suffix}';
+        // Unique storage key suffix to isolate localStorage for different reading lists
+        // (written into <meta name="reading-list-key"> from the output file name)
+        function readMeta(name) {
+            const meta = document.querySelector('meta[name="' + name + '"]');
+            return meta ? meta.getAttribute('content') : '';
+        }
+        const STORAGE_KEY_PREFIX = readMeta('reading-list-key');
+        // 由 watch 服务（watch_service.py）通过 HTTP 提供时，星标 / 已读状态同步到服务器
+        const STATE_URL = location.protocol.startsWith('http') ? '/api/state/' + encodeURIComponent(STORAGE_KEY_PREFIX) : null;
 
         // 更新侧边栏的小图标
         function updateSidebarIndicator(articleId) {
-            // 从 article-0 提取 0
+            // 从 article-<PMID> 提取 PMID
             const articleNum = articleId.replace('article-', ''); 
             const indicatorContainer = document.getElementById('indicators-' + articleNum);
             if (!indicatorContainer) return;
@@ -310,7 +265,7 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
         function updateAllSidebarIndicators() {
             const allLinks = document.querySelectorAll('.sidebar a[data-article-id]');
             allLinks.forEach(link => {
-                const articleNum = link.getAttribute('data-article-id'); // 这里拿到的是数字索引
+                const articleNum = link.getAttribute('data-article-id'); // PMID
                 if (articleNum !== null) {
                     const articleId = 'article-' + articleNum;
                     updateSidebarIndicator(articleId);
@@ -351,6 +306,7 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
             
             localStorage.setItem('starred_' + STORAGE_KEY_PREFIX, JSON.stringify(starred));
             updateSidebarIndicator(articleId); // 更新侧边栏
+            pushState();
         }
         
         function toggleRead(btn) {
@@ -374,47 +330,680 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
             
             localStorage.setItem('read_' + STORAGE_KEY_PREFIX, JSON.stringify(read));
             updateSidebarIndicator(articleId); // 更新侧边栏
+            pushState();
         }
         
-        window.onload = function() {
-            const starred = JSON.parse(localStorage.getItem('starred_' + STORAGE_KEY_PREFIX) || '[]');
-            const read = JSON.parse(localStorage.getItem('read_' + STORAGE_KEY_PREFIX) || '[]');
-            
-            // 恢复星标状态
-            starred.forEach(id => {
-                const card = document.getElementById(id);
-                if (card) {
-                    card.classList.add('starred');
-                    // 修复3：加载时也点亮按钮
-                    const btn = card.querySelector('.star-btn');
-                    if (btn) btn.classList.add('active');
-                }
+        // --- 摘要懒加载：abstracts='embedded'（页内 gzip+base64 块）或 'sidecar'（旁路 .js 文件）---
+        const HIGHLIGHT_COLORS = __HIGHLIGHT_COLORS__;
+        const abstractChunks = {};   // chunk id -> Promise<string[]>
+        const sidecarWaiters = {};
+        let highlightCount = 0;
+
+        // 旁路文件加载后调用：loadAbstractChunk("<chunk id>", "<gzip+base64>")
+        function loadAbstractChunk(chunkId, payload) {
+            if (sidecarWaiters[chunkId]) sidecarWaiters[chunkId](payload);
+        }
+
+        async function gunzipBase64(payload) {
+            const bytes = Uint8Array.from(atob(payload), c => c.charCodeAt(0));
+            const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+            return JSON.parse(await new Response(stream).text());
+        }
+
+        function fetchAbstractChunk(el) {
+            const chunkId = el.dataset.chunk;
+            if (!abstractChunks[chunkId]) {
+                abstractChunks[chunkId] = new Promise((resolve, reject) => {
+                    const embedded = document.getElementById('abstracts-' + chunkId);
+                    if (embedded) {
+                        resolve(embedded.textContent.trim());
+                        return;
+                    }
+                    sidecarWaiters[chunkId] = resolve;
+                    const script = document.createElement('script');
+                    script.src = el.dataset.src;
+                    script.onerror = reject;
+                    document.head.appendChild(script);
+                }).then(gunzipBase64);
+            }
+            return abstractChunks[chunkId];
+        }
+
+        function escapeHtml(text) {
+            const entities = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'};
+            return text.replace(/[&<>"']/g, c => entities[c]);
+        }
+
+        // 与 Python 端 _make_highlighter 相同的高亮规则（模式取自 reading-list-pattern）
+        function highlightText(text) {
+            const pattern = readMeta('reading-list-pattern');
+            if (!pattern) return text;
+            let regex;
+            try {
+                regex = new RegExp(pattern.replace(/^\\(\\?i\\)/, ''), 'gi');
+            } catch (e) {
+                return text;
+            }
+            return text.replace(regex, m => '<span style="color: ' + HIGHLIGHT_COLORS[highlightCount++ % HIGHLIGHT_COLORS.length] + '; font-weight:700;">' + m + '</span>');
+        }
+
+        function renderAbstract(el) {
+            if (el.dataset.loaded) return;
+            el.dataset.loaded = '1';
+            fetchAbstractChunk(el)
+                .then(items => { el.innerHTML = highlightText(escapeHtml(items[Number(el.dataset.item)] || '')); })
+                .catch(() => { el.textContent = 'Abstract could not be loaded (needs a browser with DecompressionStream).'; });
+        }
+
+        // 卡片滚动到视口附近时才解压并渲染摘要
+        function initLazyAbstracts() {
+            const pending = document.querySelectorAll('.abstract-text[data-chunk]');
+            if (!pending.length) return;
+            if (!('IntersectionObserver' in window)) {
+                pending.forEach(renderAbstract);
+                return;
+            }
+            const observer = new IntersectionObserver(entries => {
+                entries.forEach(entry => {
+                    if (entry.isIntersecting) {
+                        observer.unobserve(entry.target);
+                        renderAbstract(entry.target);
+                    }
+                });
+            }, { rootMargin: '800px 0px' });
+            pending.forEach(el => observer.observe(el));
+        }
+
+        // 标记最近一次增量更新加入的文献（data-added 等于 reading-list-updated）
+        function markNewArticles() {
+            const updated = readMeta('reading-list-updated');
+            if (!updated) return;
+            document.querySelectorAll('.article-card[data-added="' + updated + '"]').forEach(card => {
+                card.classList.add('new');
+                const link = document.querySelector('.sidebar a[href="#' + card.id + '"]');
+                if (link) link.classList.add('new');
             });
-            
-            // 恢复已读状态
-            read.forEach(id => {
-                const card = document.getElementById(id);
-                if (card) {
-                    card.classList.add('read');
-                    // 修复3：加载时也点亮按钮
-                    const btn = card.querySelector('.read-btn');
-                    if (btn) btn.classList.add('active');
-                }
+        }
+
+        // 按 localStorage 中的状态设置卡片和按钮（服务器状态同步后会再次调用）
+        function applyState() {
+            const starred = new Set(JSON.parse(localStorage.getItem('starred_' + STORAGE_KEY_PREFIX) || '[]'));
+            const read = new Set(JSON.parse(localStorage.getItem('read_' + STORAGE_KEY_PREFIX) || '[]'));
+            document.querySelectorAll('.article-card').forEach(card => {
+                card.classList.toggle('starred', starred.has(card.id));
+                card.classList.toggle('read', read.has(card.id));
+                // 修复3：加载时也点亮按钮
+                const starBtn = card.querySelector('.star-btn');
+                if (starBtn) starBtn.classList.toggle('active', starred.has(card.id));
+                const readBtn = card.querySelector('.read-btn');
+                if (readBtn) readBtn.classList.toggle('active', read.has(card.id));
             });
-            
             // 初始化侧边栏所有图标
             updateAllSidebarIndicators();
         }
+
+        function pushState() {
+            if (!STATE_URL) return;
+            const body = JSON.stringify({
+                starred: JSON.parse(localStorage.getItem('starred_' + STORAGE_KEY_PREFIX) || '[]'),
+                read: JSON.parse(localStorage.getItem('read_' + STORAGE_KEY_PREFIX) || '[]'),
+            });
+            fetch(STATE_URL, {method: 'PUT', headers: {'Content-Type': 'application/json'}, body: body}).catch(() => {});
+        }
+
+        // 服务器状态为准；首次同步时把本地已有的标记合并进去
+        function syncState() {
+            if (!STATE_URL) return;
+            fetch(STATE_URL).then(r => r.ok ? r.json() : null).then(remote => {
+                if (!remote) return;
+                const firstSync = !localStorage.getItem('synced_' + STORAGE_KEY_PREFIX);
+                ['starred', 'read'].forEach(kind => {
+                    const key = kind + '_' + STORAGE_KEY_PREFIX;
+                    let ids = remote[kind] || [];
+                    if (firstSync) {
+                        ids = Array.from(new Set(ids.concat(JSON.parse(localStorage.getItem(key) || '[]'))));
+                    }
+                    localStorage.setItem(key, JSON.stringify(ids));
+                });
+                localStorage.setItem('synced_' + STORAGE_KEY_PREFIX, '1');
+                applyState();
+                if (firstSync) pushState();
+            }).catch(() => {});
+        }
+
+        window.onload = function() {
+            markNewArticles();
+            initLazyAbstracts();
+            applyState();
+            syncState();
+        }
     </script>
     </div>
     </body>
     </html>
+    '''.replace('__HIGHLIGHT_COLORS__', json.dumps(COLORS))
+
+
+def _article_key(row, index=None):
+    # Stable anchor / localStorage key: the PMID, else a hash of the title (never the row position).
+    pmid = first_value(row, ('PMID',))
+    if pmid:
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', pmid)
+    title = first_value(row, ('Title', 'TI'))
+    if title:
+        return 't' + format(zlib.crc32(title.encode('utf-8')), '08x')
+    return f'row{index}'
+
+
+def _storage_key(output_html_path):
+    # localStorage key suffix derived from the output file name
+    name = os.path.splitext(os.path.basename(output_html_path))[0]
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', name) or 'reading_list'
+
+
+def _render_meta(storage_key, updated, pattern):
+    return (f'        <meta name="reading-list-key" content="{html.escape(storage_key)}">\n'
+            f'        <meta name="reading-list-updated" content="{html.escape(updated or "")}">\n'
+            f'        <meta name="reading-list-pattern" content="{html.escape(pattern or "")}">')
+
+
+def _scan_reading_list(path):
+    # (article keys, reading-list-* meta) of an existing reading list; one streaming pass.
+    keys = set()
+    meta = {}
+    markers = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped in (_SIDEBAR_MARKER, _CARDS_MARKER):
+                markers.add(stripped)
+                continue
+            m = _CARD_ID_RE.search(line)
+            if m:
+                keys.add(html.unescape(m.group(1)))
+                continue
+            m = _META_RE.search(line)
+            if m:
+                meta[m.group(1)] = html.unescape(m.group(2))
+    if len(markers) < 2:
+        raise ValueError(f"{path} has no update markers (written by an older version); regenerate it once without incremental mode")
+    return keys, meta
+
+
+class ReadingListWriter():
+    '''
+    Streaming reading list writer.
+
+    Cards are rendered as soon as rows are added and spooled to a temporary file next to
+    the output, so a pipeline can render while records are still being harvested. Sidebar
+    links are spooled the same way (the sidebar precedes the cards in the page) and both are
+    copied into place on close(), so memory does not grow with the number of records.
+
+    Anchors (article-<PMID>) and the star / read state in localStorage are keyed by PMID,
+    so re-harvesting a query in a different order keeps every saved mark.
+
+    Parameters:
+    -----------
+    output_html_path : str
+        HTML output path
+    search_info : dict, optional
+        Same keys as generate_reading_list
+    pattern : str, optional
+        Highlight regex; built from search_info['search_keywords'] when omitted
+    added : str, optional
+        Date written as data-added on every card; cards added on the latest date are shown as new
+    abstracts : str
+        "inline" (abstracts in the cards), "embedded" (gzip+base64 chunks inside the page) or
+        "sidecar" (chunk scripts in <output>_abstracts/); the lazy modes decompress and
+        highlight an abstract in the browser when its card scrolls into view
+    chunk_size : int
+        Abstracts per compressed chunk in the lazy modes
+    analytics : dict, optional
+        analytics.summarize() result, charted in the search summary block; may be set any time before close()
     '''
+    def __init__(self, output_html_path, search_info=None, pattern=None, added=None, abstracts="inline", chunk_size=200,
+                 analytics=None):
+        if abstracts not in ABSTRACT_MODES:
+            raise ValueError(f"abstracts must be one of {ABSTRACT_MODES}")
+        self.output_html_path = output_html_path
+        self.search_info = search_info
+        if pattern is None and search_info and 'search_keywords' in search_info:
+            pattern = _build_pattern_from_query(search_info.get('search_keywords'))
+        self.pattern = pattern
+        self.highlighter = _make_highlighter(pattern)
+        self.added = added
+        self.abstracts = abstracts
+        self.chunk_size = chunk_size
+        self.analytics = analytics
+        self.count = 0
+        self._chunk = []
+        # 块编号带随机前缀，增量更新时不会与页面中已有的块冲突
+        self._chunk_prefix = uuid.uuid4().hex[:8]
+        self._chunk_count = 0
+        out_dir = os.path.dirname(output_html_path) or '.'
+        os.makedirs(out_dir, exist_ok=True)
+        self._cards = tempfile.TemporaryFile('w+', encoding='utf-8', dir=out_dir)
+        self._sidebar = tempfile.TemporaryFile('w+', encoding='utf-8', dir=out_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _discard(self):
+        self._cards.close()
+        self._sidebar.close()
+
+    def add(self, row, index=None, score=None):
+        # Render one record (pandas Series or dict keyed by Excel headers / MEDLINE tags).
+        # score: relevance score shown on the card (see ranking.py)
+        t0 = time.perf_counter()
+        if index is None:
+            index = self.count
+        key = _article_key(row, index)
+        self.count += 1
+        self._add_sidebar_link(row, key)
+        self._add_card(row, key, score)
+        METRICS.add_time("render_cards", time.perf_counter() - t0)
+        METRICS.incr("cards")
+
+    def _add_sidebar_link(self, row, key):
+        # 使用实际的Excel列名
+        journal = first_value(row, ('Journal', 'Journal (TA)', 'TA'), 'Unknown').strip()
+        
+        pub_date_raw = first_value(row, ('publish_date', 'Publish Date (LR)', 'LR'))
+        if pub_date_raw.strip():
+            pub_date = pub_date_raw.replace("-", "").replace("/", "").replace(" ", "")
+        else:
+            pub_date = "Unknown"
+        bookmark_text = f"{journal}. {pub_date}"
+        if first_value(row, ('Duplicate_of',)):
+            bookmark_text += " (dup)"
+        # 添加状态指示器容器
+        self._sidebar.write(f'            <li><a href="#article-{key}" data-article-id="{key}"><span class="bookmark-indicators" id="indicators-{key}"></span>{html.escape(bookmark_text)}</a></li>\n')
+
+    def _add_card(self, row, key, score=None):
+        title = first_value(row, ('Title', 'TI'), 'No Title')
+        journal = first_value(row, ('Journal', 'TA'))
+        publish_date = first_value(row, ('publish_date', 'LR'))
+        abstract = first_value(row, ('Abstract', 'AB'))
+        pmid = first_value(row, ('PMID',))
+        doi = first_value(row, ('DOI', 'LID'))
+        impact_factor = first_value(row, ('IF',))
+        quartile = first_value(row, ('JCR_Quartile', 'Quartile'))
+        duplicate_of = first_value(row, ('Duplicate_of',))
+
+        display_abstract = _truncate_text(abstract, length=2000)
+        safe_title = html.escape(title)
+        highlighted_title = self.highlighter(safe_title)
+        if self.abstracts == "inline":
+            abstract_html = f'<div class="abstract-text">\n                    {self.highlighter(html.escape(display_abstract))}\n                </div>'
+        else:
+            abstract_html = self._lazy_abstract(display_abstract)
+
+        # 创建书签标题（期刊名+日期）
+        bookmark_title = f"{journal} - {publish_date}"
+        article_id = f"article-{key}"
 
-    out_dir = os.path.dirname(output_html_path) or '.'
-    os.makedirs(out_dir, exist_ok=True)
-    with open(output_html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+        meta_html = f'<span class="journal-info">{journal}</span>. {publish_date}.'
+        metrics_html = ''
+        if impact_factor and impact_factor != 'nan':
+            metrics_html += f'<span class="metrics">IF: {impact_factor}</span>'
+        if quartile and quartile != 'nan':
+            metrics_html += f'<span class="metrics">{quartile}</span>'
+        if score is not None:
+            metrics_html += f'<span class="metrics" title="relevance score">Score: {score:.3f}</span>'
+        card_class = 'article-card'
+        if duplicate_of:
+            # 重复记录：标注规范记录并链接过去
+            metrics_html += f'<a class="metrics duplicate-badge" href="#article-{html.escape(duplicate_of)}">Duplicate of PMID {html.escape(duplicate_of)}</a>'
+            card_class += ' duplicate'
+        data_attrs = f' data-pmid="{html.escape(pmid)}"' if pmid else ''
+        if self.added:
+            data_attrs += f' data-added="{html.escape(self.added)}"'
+        if score is not None:
+            data_attrs += f' data-score="{score:.4f}"'
+
+        article_html = f'''
+        <div class="{card_class}" id="{article_id}"{data_attrs} data-bookmark-title="{html.escape(bookmark_title)}">
+            <div class="action-buttons">
+                <button class="action-btn star-btn" onclick="toggleStar(this)" title="星标重点">⭐</button>
+                <button class="action-btn read-btn" onclick="toggleRead(this)" title="标记已读">✓</button>
+            </div>
+            <div class="article-title">{highlighted_title}</div>
+            <div class="article-meta">
+                {meta_html} <br>
+                {metrics_html}
+            </div>
+            <div class="abstract-section">
+                <span class="abstract-label">Abstract</span>
+                {abstract_html}
+            </div>
+            <div class="article-ids">
+                PMID: {pmid} &nbsp;|&nbsp; DOI: {doi}
+            </div>
+        </div>
+        '''
+        self._cards.write(article_html)
+        if len(self._chunk) >= self.chunk_size:
+            self._flush_chunk()
+
+    def _chunk_id(self):
+        return f"{self._chunk_prefix}-{self._chunk_count}"
+
+    def _sidecar_dir(self):
+        return os.path.splitext(self.output_html_path)[0] + '_abstracts'
+
+    def _lazy_abstract(self, abstract):
+        # Placeholder pointing at (chunk, item); the text goes into the current chunk.
+        chunk_id = self._chunk_id()
+        attrs = f'data-chunk="{chunk_id}" data-item="{len(self._chunk)}"'
+        if self.abstracts == "sidecar":
+            src = f"{os.path.basename(self._sidecar_dir())}/{chunk_id}.js"
+            attrs += f' data-src="{html.escape(src)}"'
+        self._chunk.append(abstract)
+        return f'<div class="abstract-text" {attrs}>Loading abstract…</div>'
+
+    def _flush_chunk(self):
+        # gzip + base64 the pending abstracts into an inline <script> block or a sidecar file.
+        if not self._chunk:
+            return
+        chunk_id = self._chunk_id()
+        raw = json.dumps(self._chunk, ensure_ascii=False).encode('utf-8')
+        payload = base64.b64encode(gzip.compress(raw, compresslevel=9, mtime=0)).decode('ascii')
+        if self.abstracts == "embedded":
+            self._cards.write(f'    <script type="application/octet-stream" id="abstracts-{chunk_id}">{payload}</script>\n')
+        else:
+            os.makedirs(self._sidecar_dir(), exist_ok=True)
+            with open(os.path.join(self._sidecar_dir(), f"{chunk_id}.js"), 'w', encoding='ascii') as f:
+                f.write(f'loadAbstractChunk("{chunk_id}", "{payload}");\n')
+        METRICS.incr("abstract_chunks")
+        self._chunk = []
+        self._chunk_count += 1
+
+    def close(self):
+        # Assemble head + sidebar + spooled cards + script into the output file.
+        self._flush_chunk()
+        search_block_html = _render_search_block(self.search_info, _render_analytics(self.analytics))
+        meta_html = _render_meta(_storage_key(self.output_html_path), self.added, self.pattern)
+        head_before, head_after = _render_head(_SIDEBAR_SLOT, search_block_html, meta_html).split(_SIDEBAR_SLOT, 1)
+        self._sidebar.seek(0)
+        self._cards.seek(0)
+        with METRICS.stage("render_write"):
+            with open(self.output_html_path, 'w', encoding='utf-8') as f:
+                f.write(head_before)
+                shutil.copyfileobj(self._sidebar, f)
+                f.write(head_after)
+                f.write(f'    {_CARDS_MARKER}\n')
+                shutil.copyfileobj(self._cards, f)
+                f.write(_SCRIPT_HTML)
+        self._discard()
+
+
+class ReadingListUpdater(ReadingListWriter):
+    '''
+    Incremental update of an existing reading list.
+
+    Only records whose PMID is not in the page yet are rendered. On close() their cards and
+    sidebar links are spliced in at the top (after the marker comments) with data-added set
+    to today, and the reading-list-updated meta is bumped so the page shows them as new.
+    Existing cards are copied through unchanged, and the star / read state (keyed by PMID
+    and the file name) is untouched. If nothing is new the file is not rewritten.
+
+    Parameters:
+    -----------
+    Same as ReadingListWriter. The highlight pattern defaults to the one stored in the page.
+    '''
+    def __init__(self, output_html_path, search_info=None, pattern=None, added=None, abstracts="inline", chunk_size=200):
+        existing, meta = _scan_reading_list(output_html_path)
+        if pattern is None and not (search_info and search_info.get('search_keywords')):
+            pattern = meta.get('reading-list-pattern') or None
+        super().__init__(output_html_path, search_info, pattern, added or datetime.now().strftime('%Y-%m-%d'), abstracts, chunk_size)
+        self.existing = existing
+        self.skipped = 0
+
+    def add(self, row, index=None, score=None):
+        key = _article_key(row, index)
+        if key in self.existing:
+            self.skipped += 1
+            return
+        self.existing.add(key)
+        super().add(row, index, score)
+
+    def close(self):
+        self._flush_chunk()
+        if not self.count:
+            self._discard()
+            return
+        updated_meta = f'        <meta name="reading-list-updated" content="{html.escape(self.added)}">\n'
+        tmp_path = self.output_html_path + '.tmp'
+        self._sidebar.seek(0)
+        self._cards.seek(0)
+        with METRICS.stage("render_write"):
+            with open(self.output_html_path, encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+                for line in src:
+                    if '<meta name="reading-list-updated"' in line:
+                        dst.write(updated_meta)
+                        continue
+                    dst.write(line)
+                    stripped = line.strip()
+                    if stripped == _SIDEBAR_MARKER:
+                        shutil.copyfileobj(self._sidebar, dst)
+                    elif stripped == _CARDS_MARKER:
+                        shutil.copyfileobj(self._cards, dst)
+            os.replace(tmp_path, self.output_html_path)
+        self._discard()
+
+
+# Columns read by the cards, the sidebar, ranking.py and dedup.py; file inputs are projected onto these.
+RENDER_COLUMNS = ('PMID', 'Title', 'TI', 'Journal', 'Journal (TA)', 'TA', 'publish_date', 'Publish Date (LR)', 'LR',
+                  'Publication_Date', 'DP', 'Abstract', 'AB', 'DOI', 'LID', 'IF', 'JCR_Quartile', 'Quartile',
+                  'Duplicate_of')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.feather', '.arrow', '.arrows', '.ipc')
+COLUMNAR_BATCH_ROWS = 4096
+
+
+class ColumnarInput():
+    '''
+    A Parquet / Feather / Arrow IPC file read lazily: the file is memory-mapped, only RENDER_COLUMNS
+    are decoded and rows are yielded one record batch at a time, so the first cards are written
+    before the rest of the file is read and memory is bounded by one batch, not the whole file.
+
+    Parameters:
+    -----------
+    path : str
+        .parquet / .pq, or .feather / .arrow / .ipc (IPC file format) / .arrows (IPC stream format).
+    columns : sequence of str
+        Columns to read; those missing from the file are ignored.
+    batch_rows : int
+        Rows per Parquet batch. Feather / Arrow files keep the record batches they were written with.
+    '''
+    def __init__(self, path, columns=RENDER_COLUMNS, batch_rows=COLUMNAR_BATCH_ROWS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet / Arrow input requires pyarrow (pip install pyarrow)")
+        self.path = str(path)
+        self.batch_rows = batch_rows
+        ext = os.path.splitext(self.path)[1].lower()
+        if ext in PARQUET_EXTENSIONS:
+            self._parquet = pq.ParquetFile(self.path, memory_map=True)
+            names = self._parquet.schema_arrow.names
+            self.num_rows = self._parquet.metadata.num_rows
+        else:
+            self._parquet = None
+            # Feather v2 is the Arrow IPC file format; .arrows (or a file without a footer) is the stream format
+            with pa.memory_map(self.path) as source:
+                try:
+                    reader = pa.ipc.open_file(source)
+                    self._stream = False
+                    self.num_rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+                except pa.ArrowInvalid:
+                    source.seek(0)
+                    reader = pa.ipc.open_stream(source)
+                    self._stream = True
+                    self.num_rows = None
+                names = reader.schema.names
+        self.columns = [name for name in names if name in set(columns)]
+
+    def __len__(self):
+        if self.num_rows is None:
+            raise TypeError("row count of an Arrow stream is unknown until it has been read")
+        return self.num_rows
+
+    def batches(self):
+        if self._parquet is not None:
+            yield from self._parquet.iter_batches(batch_size=self.batch_rows, columns=self.columns)
+            return
+        import pyarrow as pa
+        with pa.memory_map(self.path) as source:
+            if self._stream:
+                for batch in pa.ipc.open_stream(source):
+                    yield batch.select(self.columns)
+            else:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).select(self.columns)
+
+    def __iter__(self):
+        # (index, row) pairs, numbered across batches like a RangeIndex
+        index = 0
+        for batch in self.batches():
+            METRICS.incr("input_batches")
+            for row in batch.to_pylist():
+                yield index, row
+                index += 1
+
+
+def read_table(input_path_or_df):
+    # pandas is imported here so that importing html_generate (and the CLI) stays fast.
+    # DataFrames and lists of records (records.py) are used as they are; Parquet / Arrow files are
+    # streamed (ColumnarInput) and CSV / Excel are read with only RENDER_COLUMNS.
+    if hasattr(input_path_or_df, 'iterrows') or isinstance(input_path_or_df, (list, tuple, ColumnarInput)):
+        return input_path_or_df
+    input_path = str(input_path_or_df)
+    _, ext = os.path.splitext(input_path)
+    ext = ext.lower()
+    if ext in PARQUET_EXTENSIONS + ARROW_EXTENSIONS:
+        return ColumnarInput(input_path)
+    import pandas as pd
+    usecols = set(RENDER_COLUMNS).__contains__
+    if ext in ('.xls', '.xlsx'):
+        return pd.read_excel(input_path, sheet_name=0, usecols=usecols)
+    return pd.read_csv(input_path, usecols=usecols)
+
+
+def _iter_rows(table):
+    # (index, row) pairs; DataFrame rows are plain dicts built from itertuples, which avoids
+    # materialising one pandas Series (and a copy of every cell) per row as iterrows() does.
+    if isinstance(table, ColumnarInput):
+        yield from table
+        return
+    if not hasattr(table, 'itertuples'):
+        yield from enumerate(table)
+        return
+    columns = [str(col) for col in table.columns]
+    for values in table.itertuples(name=None):
+        yield values[0], dict(zip(columns, values[1:]))
+
+
+def _unscored(table):
+    for idx, row in _iter_rows(table):
+        yield idx, row, None
+
+
+def _fallback_pattern(table):
+    # No query: highlight the first word of the first title.
+    sample = ''
+    for _, row in _iter_rows(table):
+        title = first_value(row, ('Title', 'TI'))
+        if title:
+            sample = title
+            break
+    words = re.findall(r"[A-Za-z0-9]{3,}", sample)
+    if words:
+        return r'(?i)(' + re.escape(words[0]) + r')'
+    return None
+
+
+def generate_reading_list(input_path_or_df, output_html_path, search_info=None, dedup=None, incremental=False, abstracts="inline",
+                          order_by=None, rank_weights=None, analytics=False):
+    # Generate a night-mode HTML reading list from CSV/Excel, Parquet/Feather/Arrow, a DataFrame or a list of records, with interactive features.
+    # Parquet / Arrow inputs are streamed batch by batch (see ColumnarInput); dedup and order_by need every
+    # record at once and so read the whole file first.
+    # Optional search_info dict may contain 'search_keywords', 'paper_type', 'release_date_cutoff', 'grab_total', 'save_path', 'search_date'.
+    # dedup='flag' badges near-duplicate records (see dedup.py), dedup='collapse' keeps one card per group.
+    # incremental=True inserts only records not yet in an existing output_html_path (see ReadingListUpdater).
+    # abstracts='embedded' / 'sidecar' moves abstracts into compressed chunks loaded on demand (see ReadingListWriter).
+    # order_by='score' lists the records by BM25 relevance to search_info['search_keywords'] (see ranking.py);
+    # rank_weights, e.g. {'if_weight': 0.2, 'recency_weight': 0.2}, blends in impact factor and recency.
+    # analytics=True charts papers per month / journal / quartile / query term in the search summary (see analytics.py);
+    # incremental updates keep the summary of the existing page.
+    try:
+        with METRICS.stage("read_input"):
+            table = read_table(input_path_or_df)
+    except Exception as e:
+        print(f"Failed to read input: {e}")
+        return
+
+    if dedup:
+        import dedup as dedup_module
+        rows = [row for _, row in _iter_rows(table)]
+        groups = dedup_module.find_duplicates(rows)
+        if dedup == 'collapse':
+            table = dedup_module.collapse_duplicates(rows, groups)
+        else:
+            dedup_module.mark_duplicates(rows, groups)
+            table = rows
+
+    query = (search_info or {}).get('search_keywords')
+    entries = None
+    term_index = None
+    if order_by == 'score':
+        import ranking
+        indexed = list(_iter_rows(table))
+        rows = [row for _, row in indexed]
+        term_index = ranking.TermIndex.from_rows(rows)
+        order, scores = ranking.rank(rows, query, index=term_index, **(rank_weights or {}))
+        entries = [(*indexed[i], float(scores[i])) for i in order]
+        table = rows
+    elif order_by:
+        raise ValueError(f"Unknown order_by: {order_by!r}")
+
+    summary = None
+    if analytics and not (incremental and os.path.exists(output_html_path)):
+        import analytics as analytics_module
+        summary = analytics_module.summarize(table, query, index=term_index)
+
+    pattern = None
+    if search_info and 'search_keywords' in search_info:
+        pattern = _build_pattern_from_query(search_info.get('search_keywords'))
+    if not pattern:
+        pattern = _fallback_pattern(table)
+
+    if incremental and os.path.exists(output_html_path):
+        try:
+            # 未给出检索式时沿用页面中保存的高亮规则
+            query_pattern = _build_pattern_from_query((search_info or {}).get('search_keywords'))
+            updater = ReadingListUpdater(output_html_path, search_info, pattern=query_pattern, abstracts=abstracts)
+        except ValueError as e:
+            print(f"{e}; writing a full reading list instead")
+        else:
+            with updater:
+                for idx, row, score in entries or _unscored(table):
+                    updater.add(row, idx, score)
+            print(f"Update complete: {output_html_path} ({updater.count} new, {updater.skipped} already listed)")
+            return
+
+    with ReadingListWriter(output_html_path, search_info, pattern=pattern, abstracts=abstracts, analytics=summary) as writer:
+        for idx, row, score in entries or _unscored(table):
+            writer.add(row, idx, score)
 
     print(f"Conversion complete: {output_html_path}")
 
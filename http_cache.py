@@ -0,0 +1,211 @@
+'''
+Content-addressed on-disk cache of E-utilities responses.
+
+    cache = ResponseCache()                     # $GRABPUBMED_CACHE_DIR/http, 512 MB
+    body = cache.get(url, params)               # bytes, or None when missing / expired
+    cache.put(url, params, body)
+
+pubmed_utils._get goes through it transparently, so rerunning a search while working on
+parsing or enrichment reads the pages from disk instead of NCBI.
+
+Keys are the SHA-256 of the endpoint and the sorted request parameters without api_key
+(the key changes the rate limit, not the answer). EFetch pages requested through the
+history server (WebEnv / query_key) are keyed by the content of the ESearch answer that
+created the WebEnv, minus WebEnv / QueryKey themselves: NCBI hands out a new WebEnv for
+every ESearch, but when the result is unchanged every page of the rerun is a hit.
+
+TTL per endpoint (seconds, 0 disables caching for that endpoint):
+
+    esearch         600       new papers appear; keep reruns fresh
+    efetch_id       30 days   records of fixed PMIDs
+    efetch_history  1 day     pages of a search result (see above)
+    other           1 day
+
+Entries are gzip files; the mtime is the time stored (TTL), the atime the last use (LRU).
+When the cache grows beyond max_bytes the least recently used entries are deleted down to
+90% of it. Hits, misses, expired entries and evictions are counted in METRICS.
+'''
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from instrumentation import METRICS
+
+
+DEFAULT_TTLS = {
+    "esearch": 600,
+    "efetch_id": 30 * 86400,
+    "efetch_history": 86400,
+    "other": 86400,
+}
+DEFAULT_MAX_MB = 512
+COMPRESS_LEVEL = 6
+_SECRET_PARAMS = ("api_key",)
+_HISTORY_PARAMS = ("webenv", "query_key")
+_WEBENV_RE = re.compile(rb"<WebEnv>(.*?)</WebEnv>")
+_QUERY_KEY_RE = re.compile(rb"<QueryKey>(.*?)</QueryKey>")
+
+
+def endpoint(url, params):
+    # esearch / efetch_id / efetch_history / other
+    name = url.rstrip("/").rsplit("/", 1)[-1].split(".", 1)[0]
+    if name == "esearch":
+        return "esearch"
+    if name == "efetch":
+        return "efetch_history" if params.get("webenv") else "efetch_id"
+    return "other"
+
+
+class ResponseCache():
+    '''
+    Parameters:
+    -----------
+    path : str, optional
+        Cache directory (default: http/ in journal_metrics.cache_dir())
+    max_mb : float
+        Size bound of the compressed entries
+    ttls : dict, optional
+        TTL overrides by endpoint, e.g. {"esearch": 0} to always re-run searches
+    '''
+    def __init__(self, path=None, max_mb=DEFAULT_MAX_MB, ttls=None):
+        if path is None:
+            from journal_metrics import cache_dir
+            path = os.path.join(cache_dir(), "http")
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._history = {}     # (WebEnv, QueryKey) -> digest of the ESearch answer
+        self._size = None      # 首次写入时统计
+        self._lock = threading.Lock()
+
+    def key(self, url, params):
+        '''
+        Hex digest of the normalized request (api_key stripped, parameters sorted).
+        '''
+        params = {name: str(value) for name, value in params.items() if value is not None and name not in _SECRET_PARAMS}
+        search = self._history.get((params.get("webenv"), params.get("query_key")))
+        if search is not None:
+            for name in _HISTORY_PARAMS:
+                params.pop(name)
+            params["search"] = search
+        base = url.split("?", 1)[0].rstrip("/")
+        payload = json.dumps([base, sorted(params.items())], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".gz")
+
+    def _remember_search(self, body):
+        # 同一结果的 ESearch 每次返回不同的 WebEnv：历史服务器上的 EFetch 页按结果内容寻址
+        webenv = _WEBENV_RE.search(body)
+        query_key = _QUERY_KEY_RE.search(body)
+        if webenv and query_key:
+            content = _QUERY_KEY_RE.sub(b"", _WEBENV_RE.sub(b"", body))
+            self._history[(webenv.group(1).decode(), query_key.group(1).decode())] = hashlib.sha256(content).hexdigest()
+
+    def get(self, url, params):
+        '''
+        Cached body (bytes) of the request, or None.
+        '''
+        kind = endpoint(url, params)
+        ttl = self.ttls.get(kind, self.ttls["other"])
+        if not ttl:
+            return None
+        file_path = self._file(self.key(url, params))
+        try:
+            stat = os.stat(file_path)
+            if time.time() - stat.st_mtime > ttl:
+                METRICS.incr("http_cache_expired")
+                METRICS.incr("http_cache_misses")
+                return None
+            with open(file_path, "rb") as f:
+                body = gzip.decompress(f.read())
+            os.utime(file_path, (time.time(), stat.st_mtime))   # LRU：刷新 atime，mtime 保持写入时间
+        except (OSError, EOFError, gzip.BadGzipFile):
+            METRICS.incr("http_cache_misses")
+            return None
+        METRICS.incr("http_cache_hits")
+        if kind == "esearch":
+            self._remember_search(body)
+        return body
+
+    def put(self, url, params, body):
+        '''
+        Store a successful response body; evicts least recently used entries past max_bytes.
+        '''
+        kind = endpoint(url, params)
+        if kind == "esearch":
+            self._remember_search(body)
+        if not self.ttls.get(kind, self.ttls["other"]):
+            return
+        file_path = self._file(self.key(url, params))
+        data = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            try:
+                old_size = os.path.getsize(file_path)
+            except OSError:
+                old_size = 0
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            self._size += len(data) - old_size
+            METRICS.incr("http_cache_writes")
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _entries(self):
+        # (atime, size, path) of every entry
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".gz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self, target):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, file_path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            self._size -= size
+            evicted += 1
+        METRICS.incr("http_cache_evictions", evicted)
+
+    def stats(self):
+        entries = self._entries()
+        return {"path": self.path, "entries": len(entries), "mb": round(sum(size for _, size, _ in entries) / 1024 / 1024, 2),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2)}
+
+    def clear(self):
+        '''
+        Delete every entry; returns the number deleted.
+        '''
+        with self._lock:
+            entries = self._entries()
+            for _, _, file_path in entries:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            self._size = 0
+            self._history.clear()
+        return len(entries)
@@ -0,0 +1,153 @@
+'''
+Run instrumentation: per-stage timers, counters and peak-memory samples.
+
+pubmed_utils and html_generate record into the process-wide METRICS object:
+
+    stages   : esearch, efetch, parse, excel_write, jcr_load, journal_match, fuzzy_match,
+               read_input, render_cards, render_write
+    counters : requests, bytes, records, retries, http_cache_hits, http_cache_misses, cards, ...
+
+    from instrumentation import METRICS
+    METRICS.reset()
+    ... run stages ...
+    METRICS.write_report("run_report.json")
+
+profiled() wraps a block with cProfile (stdlib) or pyinstrument (optional dependency).
+'''
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process in MB (None where unavailable).
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 返回 KB，macOS 返回 bytes
+    if sys.platform == "darwin":
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+class Metrics():
+    '''
+    Thread-safe collector of stage timings, counters and memory samples.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._t0 = time.perf_counter()
+            self.stages = {}
+            self.counters = {}
+            self.memory_samples = []
+            self.meta = {}
+
+    @contextmanager
+    def stage(self, name):
+        # Accumulate wall time and call count for a named stage; sample peak RSS on exit.
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = {"calls": 0, "seconds": 0.0, "peak_rss_mb": None}
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+            rss = peak_rss_mb()
+            if rss is not None:
+                entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0, rss)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def sample_memory(self, label):
+        rss = peak_rss_mb()
+        with self._lock:
+            self.memory_samples.append({"label": label, "elapsed": round(time.perf_counter() - self._t0, 3), "peak_rss_mb": rss})
+        return rss
+
+    def set_meta(self, **fields):
+        with self._lock:
+            self.meta.update(fields)
+
+    def report(self):
+        with self._lock:
+            stages = {name: {"calls": entry["calls"], "seconds": round(entry["seconds"], 4), "peak_rss_mb": entry["peak_rss_mb"]}
+                      for name, entry in self.stages.items()}
+            return {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "elapsed": round(time.perf_counter() - self._t0, 4),
+                "meta": dict(self.meta),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "memory": {"peak_rss_mb": peak_rss_mb(), "samples": list(self.memory_samples)},
+            }
+
+    def write_report(self, path):
+        report = self.report()
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def profiled(kind, output_path):
+    '''
+    Profile the enclosed block.
+
+    Parameters:
+    -----------
+    kind : str
+        "cprofile" (writes pstats data) or "pyinstrument" (writes an HTML report)
+    output_path : str
+        Profile output file
+    '''
+    if kind == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_path)
+    elif kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("pyinstrument is not installed (pip install pyinstrument)")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    else:
+        raise ValueError(f"unknown profiler: {kind}")
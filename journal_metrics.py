@@ -0,0 +1,381 @@
+'''
+Multi-year journal metrics store.
+
+Several yearly JCR / CSA reference workbooks are merged into one indexed structure,
+
+    journal id x year -> IF, JCR quartile, CSA quartile, Top, OA
+
+with one NumPy array per reference field of the schema: float fields are float64 with NaN
+for missing values, text fields are int16 codes into a short category list. Full and
+abbreviated journal names of every edition map to the same journal id. Gaps (a journal
+missing from one edition) are filled from the nearest edition when the store is built, so
+enriching any number of papers is one fancy-index per field:
+
+    store = load_store(["jcr_2023.xlsx", "jcr_2025.xlsx@2024", "JCR_CSA_2025.xlsx"])
+    ids, methods = store.resolve(["Nat Commun", "Sci Rep"])
+    values = store.lookup(ids, [2019, 2024])      # {schema key: array}, metrics of each paper's year
+
+Each workbook is parsed once: its columns are cached as JSON under cache_dir(), keyed by
+path, size, mtime and schema, so adding another year only parses the new workbook.
+
+The edition year of a workbook comes from a "path@year" suffix, else from the headers
+("JIF 2024", "2025分区"), else from a "JCR Year" column, else from the file name.
+'''
+import hashlib
+import json
+import os
+import re
+
+import field_schema
+from field_schema import JCR, CSA
+from instrumentation import METRICS
+
+
+SOURCES = (JCR, CSA)
+_YEAR_RE = re.compile(r"(?<!\d)(19\d{2}|20\d{2})(?!\d)")
+_COMPACT_DATE_RE = re.compile(r"(19\d{2}|20\d{2})\d{4}$")   # 20250223
+
+
+def cache_dir():
+    # $GRABPUBMED_CACHE_DIR, default ~/.cache/grabpubmed
+    return os.environ.get("GRABPUBMED_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "grabpubmed")
+
+
+def split_reference(reference):
+    '''
+    "jcr.xlsx@2023" -> ("jcr.xlsx", 2023); "jcr.xlsx" -> ("jcr.xlsx", None)
+    '''
+    path, sep, year = str(reference).rpartition("@")
+    if sep and year.isdigit() and len(year) == 4:
+        return path, int(year)
+    return str(reference), None
+
+
+def publication_year(*values):
+    # First 4-digit year found in DP ("2021 Mar 5"), then publish_date ("20250223"), ...
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and value == value:
+            value = str(int(value))
+        text = str(value).strip()
+        m = _YEAR_RE.search(text) or _COMPACT_DATE_RE.match(text)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+def _header_year(header_rows):
+    for header_row in header_rows:
+        for value in header_row:
+            if value is None:
+                continue
+            text = str(value)
+            if re.search(r"(?i)jif|impact|分区|quartile", text):
+                m = _YEAR_RE.search(text)
+                if m:
+                    return int(m.group(1))
+    return None
+
+
+def _schema_signature(schema):
+    specs = [(spec.key, spec.source, spec.kind, spec.ref_headers, spec.legacy_column)
+             for spec in schema if spec.source in SOURCES]
+    return hashlib.sha1(repr(specs).encode("utf-8")).hexdigest()[:12]
+
+
+def _read_workbook(path, schema):
+    # Columnar parse of one reference workbook: {"year": int|None, "jcr": {"full": [...], "abbr": [...], key: [...]}, "csa": {...}}
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True)
+    sheets = wb.worksheets
+    specs = {source: field_schema.fields_for(schema, source) for source in SOURCES}
+
+    # 按表头定位各个来源所在的工作表和列
+    headers = {}
+    resolved = {}
+    for ws in sheets:
+        header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        headers[ws.title] = header_row
+        for source in SOURCES:
+            if source in resolved or not specs[source]:
+                continue
+            columns = field_schema.resolve_reference_columns(header_row, specs[source])
+            if columns:
+                resolved[source] = (ws, columns)
+                break
+    if not resolved:
+        for sheet_index, source in enumerate(SOURCES):
+            if sheet_index < len(sheets) and specs[source]:
+                resolved[source] = (sheets[sheet_index], field_schema.legacy_reference_columns(specs[source]))
+
+    year = _header_year(headers.values())
+    data = {}
+    for source in SOURCES:
+        table = {"full": [], "abbr": []}
+        for spec in specs[source]:
+            table[spec.key] = []
+        if source in resolved:
+            ws, columns = resolved[source]
+            header_row = headers[ws.title]
+            year_column = next((i for i, v in enumerate(header_row) if v and str(v).strip().lower() == "jcr year"), None)
+            for values in ws.iter_rows(min_row=2, values_only=True):
+                full_name = values[columns["name"]-1] if columns["name"] <= len(values) else None
+                abbr_name = values[columns["abbr"]-1] if columns["abbr"] <= len(values) else None
+                full_name = str(full_name).strip() if full_name else ""
+                abbr_name = str(abbr_name).strip() if abbr_name else ""
+                if not full_name and not abbr_name:
+                    continue
+                if year is None and year_column is not None and year_column < len(values):
+                    year = publication_year(values[year_column])
+                table["full"].append(full_name)
+                table["abbr"].append(abbr_name)
+                for spec in specs[source]:
+                    column = columns.get(spec.key)
+                    value = spec.coerce(values[column-1] if column and column <= len(values) else None)
+                    if spec.kind == "float" and not isinstance(value, float):
+                        value = None
+                    elif spec.kind != "float" and value is not None:
+                        value = str(value).strip() or None
+                    table[spec.key].append(value)
+        data[source] = table
+    wb.close()
+    if year is None:
+        year = publication_year(os.path.basename(path))
+    data["year"] = year
+    return data
+
+
+def read_workbook(path, schema=field_schema.DEFAULT_SCHEMA, use_cache=True):
+    '''
+    Parse one reference workbook into columns, through the on-disk cache.
+
+    Returns:
+    --------
+    dict : {"year": int or None, "jcr": {"full": [...], "abbr": [...], <schema key>: [...]}, "csa": {...}}
+    '''
+    stat = os.stat(path)
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir(), "metrics", f"{key}-{stat.st_size}-{stat.st_mtime_ns}-{_schema_signature(schema)}.json")
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            METRICS.incr("metrics_cache_hits")
+            return data
+        except (OSError, ValueError):
+            pass
+    METRICS.incr("metrics_cache_misses")
+    data = _read_workbook(path, schema)
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # 缓存不可写时直接使用解析结果
+    return data
+
+
+def _fill_nearest(values, valid):
+    # Fill missing years from the previous edition, then leading gaps from the next one (axis 1).
+    import numpy as np
+    n_years = values.shape[1]
+    positions = np.arange(n_years)
+    forward = np.maximum.accumulate(np.where(valid, positions, -1), axis=1)
+    backward = np.minimum.accumulate(np.where(valid, positions, n_years)[:, ::-1], axis=1)[:, ::-1]
+    source = np.where(forward >= 0, forward, backward)
+    has_any = valid.any(axis=1)
+    source[~has_any] = 0
+    rows = np.arange(values.shape[0])[:, None]
+    return values[rows, source], valid[rows, source] & has_any[:, None]
+
+
+class MetricsStore():
+    '''
+    journal id x edition year -> reference metrics, built from read_workbook() tables.
+
+    Parameters:
+    -----------
+    tables : list of dict
+        read_workbook() results, one per edition
+    schema : tuple of FieldSpec
+        Only the "jcr" / "csa" fields are stored
+    '''
+    def __init__(self, tables, schema=field_schema.DEFAULT_SCHEMA):
+        import numpy as np
+
+        self.specs = [spec for spec in schema if spec.source in SOURCES]
+        self.years = np.array(sorted({table["year"] for table in tables}), dtype=np.int32)
+        year_index = {int(year): i for i, year in enumerate(self.years)}
+
+        self.journals = []           # 期刊全称（无全称时为缩略名）
+        self.full_index = {}         # FULL NAME -> id
+        self.abbr_index = {}         # ABBR -> id
+        cells = {spec.key: {} for spec in self.specs}
+        for table in tables:
+            y = year_index[table["year"]]
+            for source in SOURCES:
+                columns = table.get(source) or {}
+                keys = [spec.key for spec in self.specs if spec.source == source and spec.key in columns]
+                for row, (full_name, abbr_name) in enumerate(zip(columns.get("full", ()), columns.get("abbr", ()))):
+                    jid = self._journal_id(full_name, abbr_name)
+                    for key in keys:
+                        value = columns[key][row]
+                        if value is not None:
+                            cells[key][(jid, y)] = value
+
+        n, n_years = len(self.journals), len(self.years)
+        self.values = {}
+        self.categories = {}
+        self.present = {source: np.zeros(n, dtype=bool) for source in SOURCES}
+        for spec in self.specs:
+            valid = np.zeros((n, n_years), dtype=bool)
+            if spec.kind == "float":
+                values = np.full((n, n_years), np.nan)
+                for (jid, y), value in cells[spec.key].items():
+                    values[jid, y] = value
+                    valid[jid, y] = True
+            else:
+                categories = sorted({str(v) for v in cells[spec.key].values()})
+                codes = {category: i for i, category in enumerate(categories)}
+                values = np.full((n, n_years), -1, dtype=np.int16)
+                for (jid, y), value in cells[spec.key].items():
+                    values[jid, y] = codes[str(value)]
+                    valid[jid, y] = True
+                self.categories[spec.key] = np.array(categories + [None], dtype=object)
+            self.present[spec.source] |= valid.any(axis=1)
+            self.values[spec.key], _ = _fill_nearest(values, valid)
+        self._resolved = {}
+
+    def _journal_id(self, full_name, abbr_name):
+        full_upper = full_name.upper()
+        abbr_upper = abbr_name.upper()
+        jid = self.full_index.get(full_upper) if full_upper else None
+        if jid is None and abbr_upper:
+            jid = self.abbr_index.get(abbr_upper)
+        if jid is None:
+            jid = len(self.journals)
+            self.journals.append(full_name or abbr_name)
+        if full_upper:
+            self.full_index.setdefault(full_upper, jid)
+        if abbr_upper:
+            self.abbr_index.setdefault(abbr_upper, jid)
+        return jid
+
+    def __len__(self):
+        return len(self.journals)
+
+    def resolve_name(self, name):
+        '''
+        全称精确匹配 -> 缩略名精确匹配 -> 部分匹配（全称）; returns (journal id or -1, method or None)
+        '''
+        name_upper = str(name).strip().upper() if name else ""
+        if name_upper in self._resolved:
+            return self._resolved[name_upper]
+        result = (-1, None)
+        if name_upper:
+            if name_upper in self.full_index:
+                result = (self.full_index[name_upper], "full")
+            elif name_upper in self.abbr_index:
+                result = (self.abbr_index[name_upper], "abbr")
+            else:
+                for journal, jid in self.full_index.items():
+                    if name_upper in journal or journal in name_upper:
+                        result = (jid, "partial")
+                        break
+        self._resolved[name_upper] = result
+        return result
+
+    def resolve(self, names):
+        '''
+        Journal ids (-1 = unmatched) and per-source match methods for a list of names.
+
+        Returns:
+        --------
+        (ids, methods) : (int array, list of {"jcr": method, "csa": method})
+        '''
+        import numpy as np
+        with METRICS.stage("journal_match"):
+            ids = np.empty(len(names), dtype=np.int64)
+            methods = []
+            for i, name in enumerate(names):
+                jid, method = self.resolve_name(name)
+                ids[i] = jid
+                methods.append({source: method if jid >= 0 and self.present[source][jid] else None for source in SOURCES})
+        return ids, methods
+
+    def year_index(self, years):
+        # Edition for each publication year: the latest edition <= year, else the oldest; unknown -> latest
+        import numpy as np
+        years = np.array([-1 if y is None else y for y in years], dtype=np.int64)
+        index = np.searchsorted(self.years, years, side="right") - 1
+        index = np.clip(index, 0, len(self.years) - 1)
+        index[years < 0] = len(self.years) - 1
+        return index
+
+    def lookup(self, ids, years):
+        '''
+        Metrics for every (journal id, publication year) pair in one vectorised pass.
+
+        Returns:
+        --------
+        dict : {schema key: array}; float64 (NaN = missing) for float fields, object
+               (None = missing) for text fields. Unmatched ids give missing values.
+        '''
+        import numpy as np
+        ids = np.asarray(ids, dtype=np.int64)
+        out = {}
+        if not len(self.years) or not len(self.journals):
+            for spec in self.specs:
+                out[spec.key] = np.full(len(ids), np.nan) if spec.kind == "float" else np.full(len(ids), None, dtype=object)
+            return out
+        matched = ids >= 0
+        rows = np.where(matched, ids, 0)
+        cols = self.year_index(years)
+        for spec in self.specs:
+            values = self.values[spec.key][rows, cols]
+            if spec.kind == "float":
+                out[spec.key] = np.where(matched, values, np.nan)
+            else:
+                out[spec.key] = self.categories[spec.key][np.where(matched, values, -1)]
+        return out
+
+    def edition_years(self, years):
+        # Edition year used for each publication year (for reporting)
+        return self.years[self.year_index(years)] if len(self.years) else None
+
+
+_STORES = {}
+
+
+def load_store(references, schema=field_schema.DEFAULT_SCHEMA, use_cache=True):
+    '''
+    Build (or reuse) the MetricsStore for a list of reference workbooks.
+
+    Parameters:
+    -----------
+    references : str or list of str
+        Workbook paths, optionally "path@year" to force the edition year
+    '''
+    if isinstance(references, (str, os.PathLike)):
+        references = [references]
+    parsed = [split_reference(reference) for reference in references]
+    key = (tuple((os.path.abspath(path), year, os.stat(path).st_mtime_ns) for path, year in parsed), _schema_signature(schema))
+    store = _STORES.get(key)
+    if store is not None:
+        return store
+    tables = []
+    for path, year in parsed:
+        table = read_workbook(path, schema, use_cache=use_cache)
+        if year is not None:
+            table = dict(table, year=year)
+        if table["year"] is None:
+            raise ValueError(f"Cannot tell the edition year of {path}; pass it as {path}@<year>")
+        tables.append(table)
+    store = MetricsStore(tables, schema)
+    _STORES[key] = store
+    return store
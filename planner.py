@@ -0,0 +1,214 @@
+'''
+Dry-run harvest planning: ESearch only, no EFetch.
+
+    plan = plan_harvest(pubmed_utils(), api_key, "(wnt5a NOT cancer) AND fibro*", days=None)
+    plan["count"], plan["estimate"]          # matches; pages, requests, seconds
+    save_plan(plan, "wnt5a_plan.json")
+    for record in iter_planned_records(pubmed_utils(), load_plan("wnt5a_plan.json"), api_key):
+        ...
+
+ESearch (and EFetch through the history server) only reach the first MAX_WINDOW records
+of a query. Larger queries are split into date windows by bisection, each window's count
+coming from one ESearch, until every window fits. The PMIDs of each window are checked
+against the local corpus (query_engine.LocalCorpus): records stored there need no EFetch.
+
+The plan is a plain JSON-serialisable dict; the executor (iter_planned_records, or
+`grabpubmed run --plan plan.json`) re-runs one ESearch per window, yields the stored
+records first and fetches only the missing ones. The API key is never written to a plan.
+'''
+import json
+import math
+import os
+import time
+from datetime import date, timedelta
+
+from instrumentation import METRICS
+
+
+MAX_WINDOW = 9999          # records one ESearch / history EFetch can reach
+PLAN_VERSION = 1
+NCBI_RATE = 3              # requests per second without an API key
+NCBI_RATE_WITH_KEY = 10
+_FIRST_DAY = date(1800, 1, 1)
+_LAST_DAY = date(3000, 12, 31)
+
+
+def _fmt(day):
+    return day.strftime("%Y/%m/%d")
+
+
+def _search(utils, api_key, plan, window, timings):
+    t0 = time.perf_counter()
+    result = utils.esearch(api_key, plan["query"], plan["days"] if not window.get("mindate") else None, plan["paper_type"],
+                           retmax=MAX_WINDOW, datetype=window.get("datetype"), mindate=window.get("mindate"),
+                           maxdate=window.get("maxdate"))
+    timings.append(time.perf_counter() - t0)
+    time.sleep(utils.request_interval)  # 遵守API限制
+    return result
+
+
+def _bisect(utils, api_key, plan, low, high, datetype, timings):
+    # Date windows (newest first) whose counts fit MAX_WINDOW, with their PMIDs
+    window = {"datetype": datetype, "mindate": _fmt(low), "maxdate": _fmt(high)}
+    result = _search(utils, api_key, plan, window, timings)
+    if result["count"] == 0:
+        return []
+    if result["count"] <= MAX_WINDOW or low == high:
+        # 单日仍超过上限时无法再拆分，只能取前 MAX_WINDOW 条
+        return [dict(window, count=result["count"], ids=result["ids"], truncated=result["count"] > len(result["ids"]))]
+    middle = low + timedelta(days=(high - low).days // 2)
+    return (_bisect(utils, api_key, plan, middle + timedelta(days=1), high, datetype, timings)
+            + _bisect(utils, api_key, plan, low, middle, datetype, timings))
+
+
+def plan_harvest(utils, api_key, query, days=None, paper_type="Journal Article", grab_total=None, db=None, today=None):
+    '''
+    Plan a harvest with ESearch requests only.
+
+    Parameters:
+    -----------
+    utils : pubmed_utils
+        Client (eutils_base, grab_step and request_interval are taken from it)
+    api_key : str
+        NCBI API key (sets the rate limit; not stored in the plan)
+    query, days, paper_type, grab_total :
+        Same as get_main_info_into_excel
+    db : str, optional
+        Local corpus checked for already-stored PMIDs (default: corpus.sqlite in the cache directory)
+    today : datetime.date, optional
+        End of the date range (default: today)
+
+    Returns:
+    --------
+    dict with "query", "days", "paper_type", "grab_total", "count", "slicing", "windows"
+    (datetype / mindate / maxdate / count / local_hits per window, newest first), "local_hits",
+    "estimate" (pages, requests, seconds) and "rate" (requests per second, request_interval)
+    '''
+    today = today or date.today()
+    plan = {"version": PLAN_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "query": query, "days": days,
+            "paper_type": paper_type, "grab_total": grab_total, "batch_size": utils.grab_step}
+    timings = []
+    with METRICS.stage("plan"):
+        first = _search(utils, api_key, plan, {}, timings)
+        count = first["count"]
+        wanted = count if grab_total is None else min(count, grab_total)
+        if wanted <= len(first["ids"]) or count <= MAX_WINDOW:
+            windows = [{"datetype": None, "mindate": None, "maxdate": None, "count": count, "ids": first["ids"],
+                        "truncated": False}] if count else []
+        elif days:
+            # "最近 N 天"按 Entrez 日期（收录日期）拆分
+            windows = _bisect(utils, api_key, plan, today - timedelta(days=days), today, "edat", timings)
+        else:
+            windows = _bisect(utils, api_key, plan, _FIRST_DAY, _LAST_DAY, "pdat", timings)
+
+        # 按 grab_total 截断（最新的窗口优先）
+        remaining = wanted
+        for window in windows:
+            window["fetch"] = min(len(window["ids"]), remaining)
+            remaining -= window["fetch"]
+
+        stored = set()
+        db_path = db
+        if db_path is None:
+            from journal_metrics import cache_dir
+            db_path = os.path.join(cache_dir(), "corpus.sqlite")
+        if os.path.exists(db_path):
+            from query_engine import LocalCorpus
+            with LocalCorpus(db_path) as corpus:
+                stored = set(corpus.lookup([pmid for window in windows for pmid in window["ids"][:window["fetch"]]]))
+
+    rate = NCBI_RATE_WITH_KEY if api_key else NCBI_RATE
+    latency = sum(timings) / len(timings) if timings else 0.0
+    pages = 0
+    for window in windows:
+        ids = window.pop("ids")[:window["fetch"]]
+        window["local_hits"] = sum(1 for pmid in ids if pmid in stored)
+        pages += math.ceil((window["fetch"] - window["local_hits"]) / utils.grab_step)
+    requests = len(windows) + pages
+    # 每页 EFetch 之后等待 request_interval；总速率不超过 NCBI 限制
+    seconds = max(requests / rate, len(windows) * latency + pages * (latency + utils.request_interval))
+    plan.update(
+        count=count,
+        records=wanted,
+        slicing=len(windows) > 1 or any(window["mindate"] for window in windows),
+        truncated=sum(window["count"] - window["fetch"] for window in windows if window["truncated"]),
+        windows=windows,
+        local_hits=len(stored),
+        rate={"requests_per_second": rate, "request_interval": utils.request_interval},
+        estimate={"pages": pages, "requests": requests, "seconds": round(seconds, 1),
+                  "esearch_latency": round(latency, 3), "planning_requests": len(timings)},
+    )
+    return plan
+
+
+def save_plan(plan, path):
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+
+
+def load_plan(path):
+    with open(path, encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"{path}: unsupported plan version {plan.get('version')!r}")
+    return plan
+
+
+def iter_planned_records(utils, plan, api_key, db=None, use_local=True, progress=None):
+    '''
+    Execute a plan: one ESearch per window, then the window's records, newest window first.
+    Records stored in the local corpus are yielded from it, the others are fetched by PMID;
+    at most plan["records"] records are yielded.
+
+    Parameters:
+    -----------
+    utils : pubmed_utils
+        Client
+    plan : dict
+        plan_harvest() result (or load_plan())
+    api_key : str
+        NCBI API key
+    db : str, optional
+        Local corpus (default: corpus.sqlite in the cache directory)
+    use_local : bool
+        Take stored records from the corpus instead of fetching them
+    progress : callable, optional
+        progress(done_records, planned_records)
+    '''
+    from records import record_type
+
+    rtype = record_type(utils.schema)
+    corpus = None
+    if use_local:
+        from query_engine import LocalCorpus
+        corpus = LocalCorpus(db, utils.schema)
+    remaining = plan["records"]
+    done = 0
+    timings = []
+    try:
+        for window in plan["windows"]:
+            if remaining <= 0:
+                break
+            ids = _search(utils, api_key, plan, window, timings)["ids"][:remaining]
+            stored = corpus.lookup(ids) if corpus is not None else {}
+            for pmid in ids:
+                payload = stored.get(pmid)
+                if payload is not None:
+                    METRICS.incr("local_hits")
+                    yield rtype(**{spec.key: payload.get(spec.header) for spec in utils.schema})
+            done += len(stored)
+            missing = [pmid for pmid in ids if pmid not in stored]
+            for record in utils.iter_records_by_id(api_key, missing):
+                yield record
+                done += 1
+                if progress and done % utils.grab_step == 0:
+                    progress(done, plan["records"])
+            remaining -= len(ids)
+            if progress:
+                progress(done, plan["records"])
+    finally:
+        if corpus is not None:
+            corpus.close()
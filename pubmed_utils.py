@@ -1,19 +1,32 @@
-import os
-print("working directory:", os.getcwd())
-from Bio import Entrez, Medline
-import requests
-import openpyxl
 import time
-from tqdm import trange
-from bs4 import BeautifulSoup
 import re
+import field_schema
+from field_schema import JCR, CSA
+from instrumentation import METRICS
 
 class pubmed_utils():
-    def __init__(self):
-        pass
+    eutils_base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+    grab_step = 10           # 每次 EFetch 获取的记录数
+    request_interval = 0.5   # 两次请求之间的间隔（秒），遵守API限制
+    max_retries = 3          # 429 / 5xx / 网络错误时的重试次数
+    retry_backoff = 1.0      # 重试等待时间（秒），每次翻倍
+    request_timeout = (10, 60)   # (连接, 读取) 超时（秒）；超时按网络错误重试
+    response_cache = True    # E-utilities 响应缓存到磁盘（http_cache.py）
+
+    def __init__(self, schema=None):
+        '''
+        Parameters:
+        -----------
+        schema : sequence of field_schema.FieldSpec, optional
+            Output column schema，默认为 field_schema.DEFAULT_SCHEMA（11列）
+        '''
+        self.schema = tuple(schema) if schema else field_schema.DEFAULT_SCHEMA
+        self.excel_property_dic = field_schema.column_map(self.schema)
+        self._session = None   # requests.Session，首次请求时创建，复用 HTTP 连接
+        self.cache = None      # http_cache.ResponseCache，首次请求时创建（response_cache 为 False 时不使用）
         
         
-    def get_main_info_into_excel(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, save_path="./paper_info.xlsx"):
+    def get_main_info_into_excel(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, save_path="./paper_info.xlsx", progress=None, records=None):
         '''
         grab info from pubmed using NCBI eUtils API, save it into a excel
         支持逻辑符号: AND, OR, NOT 等
@@ -32,80 +45,238 @@ class pubmed_utils():
             获取论文数量，默认为None（获取所有）
         save_path : str
             Excel保存路径
+        progress : callable, optional
+            progress(done_records, grab_total)，默认显示 tqdm 进度条
+        records : iterable of Record, optional
+            Records to save instead of running the search (e.g. planner.iter_planned_records)
         '''
         
-        grab_step = 10
+        import openpyxl
+        
+        # 初始化Excel（列结构由 schema 决定）；write_only 模式逐行写出，内存不随记录数增长
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet")
+        ws.append([spec.header for spec in self.schema])
+
+        cur_row = 2
+        if records is None:
+            records = self.iter_pubmed_records(api_key, search_key_words, release_date_cutoff, paper_type, grab_total, progress)
+        for values in records:
+            # 写入Excel - 按 schema 顺序写入一行
+            t0 = time.perf_counter()
+            ws.append(values.row())
+            cur_row += 1
+            METRICS.add_time("excel_write", time.perf_counter() - t0)
+
+        with METRICS.stage("excel_save"):
+            wb.save(save_path)
+        print(f"Data saved to {save_path}")
+        print(f"Total records written: {cur_row - 2}")
+        
         
+    def _get(self, url, params, stage):
+        '''
+        GET with retries on 429 / 5xx / connection errors; counts requests, bytes and retries.
+        Requests share one keep-alive session (connection pool) per pubmed_utils instance.
+        Successful responses go through the on-disk response cache (http_cache.py); a cached
+        response has from_cache = True.
+        '''
+        import requests
+        
+        if self.cache is None and self.response_cache:
+            from http_cache import ResponseCache
+            self.cache = ResponseCache()
+        cache = self.cache if self.response_cache else None
+        if cache is not None:
+            body = cache.get(url, params)
+            if body is not None:
+                response = requests.Response()
+                response._content = body
+                response.status_code = 200
+                response.encoding = "utf-8"
+                response.url = url
+                response.from_cache = True
+                return response
+        if self._session is None:
+            self._session = requests.Session()
+        attempt = 0
+        while True:
+            METRICS.incr("requests")
+            try:
+                with METRICS.stage(stage):
+                    response = self._session.get(url, params=params, timeout=self.request_timeout)
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    METRICS.incr("bytes", len(response.content))
+                    if cache is not None:
+                        cache.put(url, params, response.content)
+                    return response
+                error = requests.HTTPError(f"{response.status_code} from {url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            METRICS.incr("retries")
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
+
+
+    def _pause(self, response):
+        # 遵守API限制；缓存命中没有发出请求，不需要等待
+        if not getattr(response, "from_cache", False):
+            time.sleep(self.request_interval)
+
+
+    def esearch(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", retmax=0, datetype=None,
+                mindate=None, maxdate=None):
+        '''
+        ESearch only: return {"count", "webenv", "query_key", "term", "ids"} for the query
+
+        Parameters:
+        -----------
+        retmax : int
+            Number of PMIDs to return in "ids" (0: count only; NCBI caps this at 10000)
+        datetype : str, optional
+            Date field release_date_cutoff / mindate / maxdate apply to, e.g. "edat" (added to PubMed) or "pdat"
+        mindate, maxdate : str, optional
+            Explicit date range ("YYYY/MM/DD"), used instead of release_date_cutoff (see planner.py)
+        '''
         # 构建搜索词
         search_term = search_key_words
         if paper_type:
             search_term += f" AND \"{paper_type}\"[PT]"
         
         # 步骤1: ESearch - 搜索论文
-        esearch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+        esearch_url = self.eutils_base + "esearch.fcgi"
         esearch_params = {
             "db": "pubmed",
             "term": search_term,
             "api_key": api_key,
             "usehistory": "y",
-            "retmax": 0  # 只获取总数
+            "retmax": retmax  # 0: 只获取总数
         }
         
         # 添加日期范围限制
-        if release_date_cutoff:
+        if mindate or maxdate:
+            esearch_params["mindate"] = mindate or "1800/01/01"
+            esearch_params["maxdate"] = maxdate or "3000/12/31"
+            esearch_params["datetype"] = datetype or "pdat"
+        elif release_date_cutoff:
             esearch_params["reldate"] = release_date_cutoff
+            if datetype:
+                esearch_params["datetype"] = datetype
         
         print("Searching PubMed...")
-        esearch_response = requests.get(esearch_url, params=esearch_params)
+        esearch_response = self._get(esearch_url, esearch_params, "esearch")
         esearch_data = esearch_response.text
         
         # 解析搜索结果
         import xml.etree.ElementTree as ET
         root = ET.fromstring(esearch_data)
-        total = int(root.find("Count").text)
-        webenv = root.find("WebEnv").text
-        query_key = root.find("QueryKey").text
+        return {
+            "count": int(root.find("Count").text),
+            "webenv": root.find("WebEnv").text,
+            "query_key": root.find("QueryKey").text,
+            "term": search_term,
+            "ids": [el.text for el in root.iterfind("IdList/Id")],
+        }
+
+
+    def iter_pubmed_records(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, progress=None):
+        '''
+        Generator version of the harvest loop: yield one compact Record (records.py) per record
+        as soon as its EFetch page has been parsed.
+
+        Parameters are the same as get_main_info_into_excel, plus:
+        
+        progress : callable, optional
+            progress(done_records, grab_total) called after every EFetch page;
+            a tqdm bar is shown when omitted
+        '''
+        search = self.esearch(api_key, search_key_words, release_date_cutoff, paper_type)
+        total = search["count"]
         
         print(f"Find total: {total}")
         
         if grab_total is None or grab_total > total:
             grab_total = total
         
-        # 初始化Excel
-        self.excel_property_dic = {token:index for index, token in enumerate(["PMID", "TI", "TA", "IF", "Quartile", "JCR_Quartile", "Top", "OA", "LR", "AB", "LID"], start=1)}
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.cell(row=1, column=self.excel_property_dic["PMID"]).value = "PMID"
-        ws.cell(row=1, column=self.excel_property_dic["TI"]).value = "Title"
-        ws.cell(row=1, column=self.excel_property_dic["TA"]).value = "Journal"
-        ws.cell(row=1, column=self.excel_property_dic["IF"]).value = "IF"
-        ws.cell(row=1, column=self.excel_property_dic["Quartile"]).value = "JCR_Quartile"
-        ws.cell(row=1, column=self.excel_property_dic["JCR_Quartile"]).value = "CSA_Quartile"
-        ws.cell(row=1, column=self.excel_property_dic["Top"]).value = "Top"
-        ws.cell(row=1, column=self.excel_property_dic["OA"]).value = "Open Access"
-        ws.cell(row=1, column=self.excel_property_dic["LR"]).value = "publish_date"
-        ws.cell(row=1, column=self.excel_property_dic["AB"]).value = "Abstract"
-        ws.cell(row=1, column=self.excel_property_dic["LID"]).value = "DOI"
-
-        # 步骤2: EFetch - 获取详细信息
-        cur_row = 2
-        efetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+        extract = field_schema.build_extractor(self.schema)
+        grab_step = self.grab_step
         
-        for step in trange(0, (grab_total + grab_step - 1) // grab_step, desc="getting pubmed info"):
+        # 步骤2: EFetch - 获取详细信息
+        efetch_url = self.eutils_base + "efetch.fcgi"
+        n_steps = (grab_total + grab_step - 1) // grab_step
+        if progress:
+            steps = range(n_steps)
+        else:
+            from tqdm import trange
+            steps = trange(0, n_steps, desc="getting pubmed info")
+        done = 0
+        
+        for step in steps:
             efetch_params = {
                 "db": "pubmed",
                 "retstart": step * grab_step,
                 "retmax": grab_step,
-                "webenv": webenv,
-                "query_key": query_key,
+                "webenv": search["webenv"],
+                "query_key": search["query_key"],
+                "rettype": "medline",
+                "retmode": "text",
+                "api_key": api_key
+            }
+            
+            efetch_response = self._get(efetch_url, efetch_params, "efetch")
+            page = self.parse_medline(efetch_response.text, extract)
+            
+            METRICS.incr("records", len(page))
+            done += len(page)
+            yield from page
+            
+            if progress:
+                progress(done, grab_total)
+            self._pause(efetch_response)
+
+
+    def iter_records_by_id(self, api_key, pmids, progress=None):
+        '''
+        EFetch the given PMIDs (grab_step per request) and yield one Record per record;
+        used to fetch only the records that are not stored locally yet (see watch_service.py).
+        '''
+        pmids = [str(pmid) for pmid in pmids]
+        extract = field_schema.build_extractor(self.schema)
+        efetch_url = self.eutils_base + "efetch.fcgi"
+        done = 0
+        for start in range(0, len(pmids), self.grab_step):
+            efetch_params = {
+                "db": "pubmed",
+                "id": ",".join(pmids[start:start + self.grab_step]),
                 "rettype": "medline",
                 "retmode": "text",
                 "api_key": api_key
             }
+            efetch_response = self._get(efetch_url, efetch_params, "efetch")
+            page = self.parse_medline(efetch_response.text, extract)
             
-            efetch_response = requests.get(efetch_url, params=efetch_params)
-            response_text = efetch_response.text
+            METRICS.incr("records", len(page))
+            done += len(page)
+            yield from page
             
+            if progress:
+                progress(done, len(pmids))
+            self._pause(efetch_response)
+
+
+    def parse_medline(self, response_text, extract=None):
+        '''
+        Parse one EFetch MEDLINE page into a list of compact Records (see records.py).
+        '''
+        from Bio import Medline
+        
+        if extract is None:
+            extract = field_schema.build_extractor(self.schema)
+        page = []
+        with METRICS.stage("parse"):
             # 修复：使用正则表达式按照 PMID 行来分割记录
             # PMID行格式为: "PMID- 12345678"
             record_texts = re.split(r'\n(?=PMID- )', response_text)
@@ -117,96 +288,167 @@ class pubmed_utils():
                 try:
                     # 解析单条记录
                     records = list(Medline.parse(record_text.split('\n')))
-                    
-                    for record in records:
-                        if 'PMID' not in record:
-                            continue
-                            
-                        # 写入Excel - 每个字段
-                        for key in self.excel_property_dic.keys():
-                            if key not in record:
-                                continue
-                            
-                            key_info = record[key]
-                            
-                            # 处理列表类型的字段
-                            if isinstance(key_info, list):
-                                if key == 'LID':  # DOI 字段
-                                    # 找到包含 [doi] 的项
-                                    doi_items = [item for item in key_info if '[doi]' in item.lower()]
-                                    if doi_items:
-                                        key_info = doi_items[0]
-                                    elif key_info:
-                                        key_info = key_info[0]
-                                    else:
-                                        key_info = ''
-                                elif key == 'LR':  # 日期字段 - 取最新的（第一个）
-                                    key_info = key_info[0] if key_info else ''
-                                else:
-                                    # 其他列表字段不应该出现在这些关键字段中
-                                    # 如果出现，用分号连接
-                                    key_info = '; '.join(str(x) for x in key_info)
-                            
-                            ws.cell(row=cur_row, column=self.excel_property_dic[key]).value = key_info
-                        
-                        cur_row += 1
-                        
                 except Exception as e:
+                    METRICS.incr("parse_errors")
                     print(f"解析记录时出错: {e}")
                     continue
-            
-            time.sleep(0.5)  # 遵守API限制
+                    
+                for record in records:
+                    if 'PMID' in record:
+                        page.append(extract(record))
+        return page
+
+
+    def _data_sheet(self, wb):
+        # 输出文件默认工作表名为 "Sheet"，其他来源的文件退回到活动工作表
+        return wb["Sheet"] if "Sheet" in wb.sheetnames else wb.active
+
+
+    def load_reference_tables(self, jcr_csa_path):
+        '''
+        Load the JCR/CSA reference workbook into lookup tables.
+
+        Sheets and columns are resolved by header name through the schema, so workbooks
+        with a different column order (or without a CSA sheet) load correctly. Workbooks
+        whose headers are not recognised fall back to the legacy layout
+        (sheet 1 = JCR, sheet 2 = CSA).
+
+        Returns:
+        --------
+        dict : {"jcr": (full_dic, abbr_dic), "csa": (full_dic, abbr_dic)}
+            full_dic / abbr_dic map NAME.upper() -> {"full", "abbr", <schema key>: value}
+        '''
+        with METRICS.stage("jcr_load"):
+            return self._read_reference_tables(jcr_csa_path)
+
+
+    def _read_reference_tables(self, jcr_csa_path):
+        import journal_metrics
+
+        # 工作表/列解析与缓存由 journal_metrics.read_workbook 负责
+        data = journal_metrics.read_workbook(journal_metrics.split_reference(jcr_csa_path)[0], self.schema)
+        tables = {}
+        for source in (JCR, CSA):
+            columns = data.get(source) or {"full": [], "abbr": []}
+            keys = [spec.key for spec in field_schema.fields_for(self.schema, source)]
+            full_dic = {}
+            abbr_dic = {}
+            for row, (full_name, abbr_name) in enumerate(zip(columns["full"], columns["abbr"])):
+                entry = {"full": full_name, "abbr": abbr_name}
+                for key in keys:
+                    entry[key] = columns[key][row] if key in columns else None
+                if full_name:
+                    full_dic[full_name.upper()] = entry
+                if abbr_name:
+                    abbr_dic[abbr_name.upper()] = entry
+            tables[source] = (full_dic, abbr_dic)
+        return tables
+
+
+    def _match_journal(self, j_name_upper, full_dic, abbr_dic):
+        '''
+        全称精确匹配 -> 缩略名精确匹配 -> 部分匹配（全称）
+        返回 (entry, method)，未匹配时返回 (None, None)
+        '''
+        if j_name_upper in full_dic:
+            return full_dic[j_name_upper], "full"
+        if j_name_upper in abbr_dic:
+            return abbr_dic[j_name_upper], "abbr"
+        for journal in full_dic.keys():
+            if j_name_upper in journal or journal in j_name_upper:
+                return full_dic[journal], "partial"
+        return None, None
+
+
+    def match_journal_metrics(self, j_name, tables):
+        '''
+        Look up one journal name in the tables from load_reference_tables.
+
+        Returns:
+        --------
+        (updates, methods) : ({schema key: value}, {"jcr": method, "csa": method})
+            method is "full" / "abbr" / "partial", or None when unmatched.
+            JCR 未匹配时 JCR 字段写入 "Unknow"，供 refine_IF_matching 识别
+        '''
+        t0 = time.perf_counter()
+        j_name_upper = str(j_name).strip().upper()
+        updates = {}
+        methods = {}
+        for source in (JCR, CSA):
+            full_dic, abbr_dic = tables[source]
+            entry, method = self._match_journal(j_name_upper, full_dic, abbr_dic)
+            methods[source] = method
+            for spec in field_schema.fields_for(self.schema, source):
+                if entry is not None:
+                    updates[spec.key] = entry.get(spec.key)
+                elif source == JCR:
+                    updates[spec.key] = "Unknow"
+        METRICS.add_time("journal_match", time.perf_counter() - t0)
+        return updates, methods
+
+
+    def load_metrics_store(self, references):
+        '''
+        Load one or more yearly JCR/CSA workbooks into a journal_metrics.MetricsStore.
+
+        Parameters:
+        -----------
+        references : str or list of str
+            Workbook paths, "path@year" to force the edition year
+        '''
+        import journal_metrics
+        with METRICS.stage("jcr_load"):
+            return journal_metrics.load_store(references, self.schema)
+
+
+    def lookup_journal_metrics(self, names, years, store):
+        '''
+        Vectorised counterpart of match_journal_metrics: metrics of each journal for each
+        paper's publication year (None = unknown year -> latest edition).
+
+        Returns:
+        --------
+        list of (updates, methods), same shapes as match_journal_metrics
+        '''
+        ids, methods = store.resolve(names)
+        values = store.lookup(ids, years)
+        results = []
+        for i, row_methods in enumerate(methods):
+            updates = {}
+            for spec in store.specs:
+                if row_methods[spec.source] is None:
+                    # JCR 未匹配写入 "Unknow"（供 refine_IF_matching 识别），CSA 未匹配保持原值
+                    if spec.source == JCR:
+                        updates[spec.key] = "Unknow"
+                    continue
+                value = values[spec.key][i]
+                if spec.kind == "float":
+                    value = None if value != value else float(value)
+                updates[spec.key] = value
+            results.append((updates, row_methods))
+        return results
+
 
-        wb.save(save_path)
-        print(f"Data saved to {save_path}")
-        print(f"Total records written: {cur_row - 2}")
-        
-        
     def embed_IF_into_excel(self, excel_path, jcr_csa_path="JCR_CSA_2025.xlsx"):
         '''
         grab IF, JCR Quartile, CSA Quartile, Top, and OA info from local JCR_CSA_2025.xlsx and save it into excel
         支持全称和缩略名双重匹配
+
+        jcr_csa_path may also be a list of yearly workbooks; each paper then gets the
+        metrics of its publication year (DP column, else publish_date), see journal_metrics.py
         '''
         
-        # Load JCR_CSA data
-        jcr_csa_wb = openpyxl.load_workbook(jcr_csa_path)
+        import openpyxl
+        import journal_metrics
         
-        # Sheet 1: JCR info (IF and Quartile)
-        ws_jcr = jcr_csa_wb[jcr_csa_wb.sheetnames[0]]
-        jcr_dic = {}  # {journal_name: {"IF": value, "Quartile": value}}
-        jcr_abbr_dic = {}  # {abbreviation: {"IF": value, "Quartile": value}}
+        # Load JCR_CSA data（多年参考表合并为一个 MetricsStore）
+        store = self.load_metrics_store(jcr_csa_path)
         
-        for jcr_row in range(2, ws_jcr.max_row+1):
-            journal_name = ws_jcr.cell(row=jcr_row, column=1).value  # 期刊全称
-            journal_abbr = ws_jcr.cell(row=jcr_row, column=2).value  # 期刊缩略名
-            jif_value = ws_jcr.cell(row=jcr_row, column=7).value     # 2024JIF (列位置已调整)
-            quartile_value = ws_jcr.cell(row=jcr_row, column=8).value  # Quartile (列位置已调整)
-            
-            if journal_name:
-                jcr_dic[journal_name.strip().upper()] = {"IF": jif_value, "Quartile": quartile_value}
-            if journal_abbr:
-                jcr_abbr_dic[journal_abbr.strip().upper()] = {"IF": jif_value, "Quartile": quartile_value}
-        
-        # Sheet 2: CSA info (中科院分区, Top, OA)
-        ws_csa = jcr_csa_wb[jcr_csa_wb.sheetnames[1]]
-        csa_dic = {}  # {journal_name: {"CSA_Quartile": value, "Top": value, "OA": value}}
-        csa_abbr_dic = {}  # {abbreviation: {"CSA_Quartile": value, "Top": value, "OA": value}}
-        
-        for csa_row in range(2, ws_csa.max_row+1):
-            journal_name = ws_csa.cell(row=csa_row, column=1).value  # 期刊全称
-            journal_abbr = ws_csa.cell(row=csa_row, column=2).value  # 期刊缩略名
-            csa_quartile = ws_csa.cell(row=csa_row, column=3).value   # 2025分区 (列位置已调整)
-            top_value = ws_csa.cell(row=csa_row, column=4).value      # Top (列位置已调整)
-            oa_value = ws_csa.cell(row=csa_row, column=5).value       # Open Access (列位置已调整)
-            
-            if journal_name:
-                csa_dic[journal_name.strip().upper()] = {"CSA_Quartile": csa_quartile, "Top": top_value, "OA": oa_value}
-            if journal_abbr:
-                csa_abbr_dic[journal_abbr.strip().upper()] = {"CSA_Quartile": csa_quartile, "Top": top_value, "OA": oa_value}
-        
-        # Load target excel and update values
-        wb = openpyxl.load_workbook(excel_path)
-        ws = wb["Sheet"]
+        # Load target excel and update values（按表头定位列，可直接处理已有文件）
+        with METRICS.stage("excel_load"):
+            wb = openpyxl.load_workbook(excel_path)
+        ws = self._data_sheet(wb)
+        columns = field_schema.resolve_columns(ws, self.schema)
         
         # 匹配统计
         match_stats = {
@@ -219,95 +461,42 @@ class pubmed_utils():
             "csa_partial_match": 0,
             "csa_no_match": 0
         }
+        method_labels = {"full": "全称", "abbr": "缩略", "partial": "部分", None: "未匹配"}
         fail_list = []
         
-        for cur_row in range(2, ws.max_row+1):
-            j_name = ws.cell(row=cur_row, column=self.excel_property_dic["TA"]).value
-            if not j_name:
-                continue
-                
-            j_name_upper = j_name.strip().upper()
-            jcr_found = False
-            csa_found = False
-            match_method = ""
-            
-            # === JCR 匹配策略 ===
-            # 1. 尝试全称精确匹配
-            if j_name_upper in jcr_dic:
-                ws.cell(row=cur_row, column=self.excel_property_dic["IF"]).value = jcr_dic[j_name_upper]["IF"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["Quartile"]).value = jcr_dic[j_name_upper]["Quartile"]
-                jcr_found = True
-                match_stats["jcr_full_match"] += 1
-                match_method = "JCR:全称"
-            
-            # 2. 尝试缩略名精确匹配
-            elif j_name_upper in jcr_abbr_dic:
-                ws.cell(row=cur_row, column=self.excel_property_dic["IF"]).value = jcr_abbr_dic[j_name_upper]["IF"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["Quartile"]).value = jcr_abbr_dic[j_name_upper]["Quartile"]
-                jcr_found = True
-                match_stats["jcr_abbr_match"] += 1
-                match_method = "JCR:缩略"
-            
-            # 3. 尝试部分匹配（全称）
-            else:
-                for jcr_journal in jcr_dic.keys():
-                    if j_name_upper in jcr_journal or jcr_journal in j_name_upper:
-                        ws.cell(row=cur_row, column=self.excel_property_dic["IF"]).value = jcr_dic[jcr_journal]["IF"]
-                        ws.cell(row=cur_row, column=self.excel_property_dic["Quartile"]).value = jcr_dic[jcr_journal]["Quartile"]
-                        jcr_found = True
-                        match_stats["jcr_partial_match"] += 1
-                        match_method = "JCR:部分"
-                        break
-            
-            # 4. 未匹配
-            if not jcr_found:
-                ws.cell(row=cur_row, column=self.excel_property_dic["IF"]).value = "Unknow"
-                ws.cell(row=cur_row, column=self.excel_property_dic["Quartile"]).value = "Unknow"
-                match_stats["jcr_no_match"] += 1
-                match_method = "JCR:未匹配"
-            
-            # === CSA 匹配策略 ===
-            # 1. 尝试全称精确匹配
-            if j_name_upper in csa_dic:
-                ws.cell(row=cur_row, column=self.excel_property_dic["JCR_Quartile"]).value = csa_dic[j_name_upper]["CSA_Quartile"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["Top"]).value = csa_dic[j_name_upper]["Top"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["OA"]).value = csa_dic[j_name_upper]["OA"]
-                csa_found = True
-                match_stats["csa_full_match"] += 1
-                match_method += " | CSA:全称"
-            
-            # 2. 尝试缩略名精确匹配
-            elif j_name_upper in csa_abbr_dic:
-                ws.cell(row=cur_row, column=self.excel_property_dic["JCR_Quartile"]).value = csa_abbr_dic[j_name_upper]["CSA_Quartile"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["Top"]).value = csa_abbr_dic[j_name_upper]["Top"]
-                ws.cell(row=cur_row, column=self.excel_property_dic["OA"]).value = csa_abbr_dic[j_name_upper]["OA"]
-                csa_found = True
-                match_stats["csa_abbr_match"] += 1
-                match_method += " | CSA:缩略"
-            
-            # 3. 尝试部分匹配（全称）
-            else:
-                for csa_journal in csa_dic.keys():
-                    if j_name_upper in csa_journal or csa_journal in j_name_upper:
-                        ws.cell(row=cur_row, column=self.excel_property_dic["JCR_Quartile"]).value = csa_dic[csa_journal]["CSA_Quartile"]
-                        ws.cell(row=cur_row, column=self.excel_property_dic["Top"]).value = csa_dic[csa_journal]["Top"]
-                        ws.cell(row=cur_row, column=self.excel_property_dic["OA"]).value = csa_dic[csa_journal]["OA"]
-                        csa_found = True
-                        match_stats["csa_partial_match"] += 1
-                        match_method += " | CSA:部分"
-                        break
-            
-            # 4. 未匹配
-            if not csa_found:
-                match_stats["csa_no_match"] += 1
-                match_method += " | CSA:未匹配"
+        # 一次读出所有期刊名和出版年份，批量查询
+        def cell(values, key):
+            column = columns.get(key)
+            return values[column-1] if column and column <= len(values) else None
+
+        pending = []
+        for cur_row, values in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            j_name = cell(values, "TA")
+            if j_name:
+                pending.append((cur_row, j_name, journal_metrics.publication_year(cell(values, "DP"), cell(values, "LR"))))
+        results = self.lookup_journal_metrics([j_name for _, j_name, _ in pending], [year for _, _, year in pending], store)
+        
+        for (cur_row, j_name, _), (updates, methods) in zip(pending, results):
+            for key, value in updates.items():
+                ws.cell(row=cur_row, column=columns[key]).value = value
+            
+            match_methods = []
+            all_found = True
+            for source in (JCR, CSA):
+                method = methods[source]
+                match_methods.append(f"{source.upper()}:{method_labels[method]}")
+                if method:
+                    match_stats[f"{source}_{method}_match"] += 1
+                else:
+                    match_stats[f"{source}_no_match"] += 1
+                    all_found = False
             
             # 记录未完全匹配的期刊
-            if not (jcr_found and csa_found):
-                fail_list.append(f"{j_name[:40]} ({match_method})")
+            if not all_found:
+                fail_list.append(f"{str(j_name)[:40]} ({' | '.join(match_methods)})")
         
         # 打印详细匹配统计
-        total_journals = ws.max_row - 1
+        total_journals = max(ws.max_row - 1, 1)
         print("\n" + "="*60)
         print("期刊信息匹配报告")
         print("="*60)
@@ -335,7 +524,8 @@ class pubmed_utils():
                 print(f"  {item}")
         
         print("="*60)
-        wb.save(excel_path)
+        with METRICS.stage("excel_save"):
+            wb.save(excel_path)
     
     
 
@@ -356,88 +546,44 @@ class pubmed_utils():
         '''
         
         import difflib
+        import openpyxl
         
         print("\n" + "="*70)
         print("开始智能补充匹配")
         print("="*70)
         
         # 加载 JCR_CSA 数据
-        jcr_csa_wb = openpyxl.load_workbook(jcr_csa_path)
+        tables = self.load_reference_tables(jcr_csa_path)
         
         # 构建完整的期刊数据库（全称 + 缩略名）
         print("\n加载期刊数据库...")
-        ws_jcr = jcr_csa_wb[jcr_csa_wb.sheetnames[0]]
-        ws_csa = jcr_csa_wb[jcr_csa_wb.sheetnames[1]]
-        
-        # JCR 数据字典
-        jcr_journals = {}  # {期刊名(大写): {"full": 全称, "abbr": 缩略, "IF": IF值, "Quartile": 分区}}
-        for row in range(2, ws_jcr.max_row+1):
-            full_name = ws_jcr.cell(row=row, column=1).value
-            abbr_name = ws_jcr.cell(row=row, column=2).value
-            jif_value = ws_jcr.cell(row=row, column=7).value
-            quartile = ws_jcr.cell(row=row, column=8).value
-            
-            if full_name:
-                key = full_name.strip().upper()
-                jcr_journals[key] = {
-                    "full": full_name.strip(),
-                    "abbr": abbr_name.strip() if abbr_name else "",
-                    "IF": jif_value,
-                    "Quartile": quartile
-                }
-            if abbr_name:
-                key_abbr = abbr_name.strip().upper()
-                if key_abbr not in jcr_journals:
-                    jcr_journals[key_abbr] = {
-                        "full": full_name.strip() if full_name else "",
-                        "abbr": abbr_name.strip(),
-                        "IF": jif_value,
-                        "Quartile": quartile
-                    }
-        
-        # CSA 数据字典
-        csa_journals = {}  # {期刊名(大写): {"full": 全称, "abbr": 缩略, "CSA": 分区, "Top": Top, "OA": OA}}
-        for row in range(2, ws_csa.max_row+1):
-            full_name = ws_csa.cell(row=row, column=1).value
-            abbr_name = ws_csa.cell(row=row, column=2).value
-            csa_quartile = ws_csa.cell(row=row, column=3).value
-            top = ws_csa.cell(row=row, column=4).value
-            oa = ws_csa.cell(row=row, column=5).value
-            
-            if full_name:
-                key = full_name.strip().upper()
-                csa_journals[key] = {
-                    "full": full_name.strip(),
-                    "abbr": abbr_name.strip() if abbr_name else "",
-                    "CSA_Quartile": csa_quartile,
-                    "Top": top,
-                    "OA": oa
-                }
-            if abbr_name:
-                key_abbr = abbr_name.strip().upper()
-                if key_abbr not in csa_journals:
-                    csa_journals[key_abbr] = {
-                        "full": full_name.strip() if full_name else "",
-                        "abbr": abbr_name.strip(),
-                        "CSA_Quartile": csa_quartile,
-                        "Top": top,
-                        "OA": oa
-                    }
+        journal_dbs = {}  # {source: {期刊名(大写): {"full": 全称, "abbr": 缩略, <schema key>: 值}}}
+        for source in (JCR, CSA):
+            full_dic, abbr_dic = tables[source]
+            journals = dict(full_dic)
+            for key_abbr, entry in abbr_dic.items():
+                if key_abbr not in journals:
+                    journals[key_abbr] = entry
+            journal_dbs[source] = journals
+        jcr_journals = journal_dbs[JCR]
+        csa_journals = journal_dbs[CSA]
         
         print(f"已加载 {len(jcr_journals)} 个 JCR 期刊")
         print(f"已加载 {len(csa_journals)} 个 CSA 期刊")
         
         # 加载目标 Excel
-        wb = openpyxl.load_workbook(excel_path)
-        ws = wb["Sheet"]
+        with METRICS.stage("excel_load"):
+            wb = openpyxl.load_workbook(excel_path)
+        ws = self._data_sheet(wb)
+        columns = field_schema.resolve_columns(ws, self.schema)
         
         # 统计未匹配的记录
         unmatched_rows = []
         for row in range(2, ws.max_row+1):
-            if_value = ws.cell(row=row, column=self.excel_property_dic["IF"]).value
-            j_name = ws.cell(row=row, column=self.excel_property_dic["TA"]).value
+            if_value = ws.cell(row=row, column=columns["IF"]).value
+            j_name = ws.cell(row=row, column=columns["TA"]).value
             if if_value == "Unknow" and j_name:
-                unmatched_rows.append((row, j_name.strip()))
+                unmatched_rows.append((row, str(j_name).strip()))
         
         print(f"\n找到 {len(unmatched_rows)} 个未匹配的期刊记录")
         
@@ -506,6 +652,7 @@ class pubmed_utils():
         
         matched_details = []
         
+        fuzzy_t0 = time.perf_counter()
         for row_idx, pubmed_journal in unmatched_rows:
             best_jcr_match = None
             best_jcr_score = 0
@@ -538,15 +685,14 @@ class pubmed_utils():
             csa_matched = False
             
             if best_jcr_match:
-                ws.cell(row=row_idx, column=self.excel_property_dic["IF"]).value = best_jcr_match["IF"]
-                ws.cell(row=row_idx, column=self.excel_property_dic["Quartile"]).value = best_jcr_match["Quartile"]
+                for spec in field_schema.fields_for(self.schema, JCR):
+                    ws.cell(row=row_idx, column=columns[spec.key]).value = best_jcr_match.get(spec.key)
                 jcr_matched = True
                 match_results["jcr_matched"] += 1
             
             if best_csa_match:
-                ws.cell(row=row_idx, column=self.excel_property_dic["JCR_Quartile"]).value = best_csa_match["CSA_Quartile"]
-                ws.cell(row=row_idx, column=self.excel_property_dic["Top"]).value = best_csa_match["Top"]
-                ws.cell(row=row_idx, column=self.excel_property_dic["OA"]).value = best_csa_match["OA"]
+                for spec in field_schema.fields_for(self.schema, CSA):
+                    ws.cell(row=row_idx, column=columns[spec.key]).value = best_csa_match.get(spec.key)
                 csa_matched = True
                 match_results["csa_matched"] += 1
             
@@ -565,8 +711,11 @@ class pubmed_utils():
                     detail += f" -> CSA: {best_csa_match['abbr'] or best_csa_match['full'][:30]} (相似度:{best_csa_score:.2f})"
                 matched_details.append(detail)
         
+        METRICS.add_time("fuzzy_match", time.perf_counter() - fuzzy_t0)
+        
         # 保存文件
-        wb.save(excel_path)
+        with METRICS.stage("excel_save"):
+            wb.save(excel_path)
         
         # 打印结果
         print("\n" + "="*70)
@@ -588,31 +737,87 @@ class pubmed_utils():
         print(f"已更新文件: {excel_path}")
         print("="*70)
 
-def download_pdf(self, excel_path, pdf_savepath, IF_cutoff):
+    def flag_duplicates_in_excel(self, excel_path, collapse=False, threshold=0.8):
+        '''
+        Flag (Duplicate_of column) or remove duplicate / near-duplicate records in a saved Excel.
+
+        Parameters:
+        -----------
+        excel_path : str
+            Excel written by get_main_info_into_excel (columns are resolved by header)
+        collapse : bool
+            Delete duplicate rows instead of flagging them
+        threshold : float
+            Minimum estimated Jaccard similarity of title + abstract (see dedup.py)
+        '''
+        import openpyxl
+        import dedup
+
+        with METRICS.stage("excel_load"):
+            wb = openpyxl.load_workbook(excel_path)
+        ws = self._data_sheet(wb)
+        columns = field_schema.resolve_columns(ws, self.schema)
+        headers = {spec.key: spec.header for spec in self.schema}
+        rows = [{headers[key]: values[column - 1] if column <= len(values) else None for key, column in columns.items()}
+                for values in ws.iter_rows(min_row=2, values_only=True)]
+
+        groups = dedup.find_duplicates(rows, threshold=threshold)
+        duplicates = sum(len(group) - 1 for group in groups)
+        if collapse:
+            kept = set(range(len(rows))) - {i for group in groups for i in group[1:]}
+            values = [row for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True)) if i in kept]
+            ws.delete_rows(2, ws.max_row)
+            for row in values:
+                ws.append(row)
+        else:
+            duplicate_column = columns.get(dedup.DUPLICATE_FIELD[0])
+            if duplicate_column is None:
+                # 自定义 schema 中没有该列时追加到最后
+                duplicate_column = ws.max_column + 1
+                ws.cell(row=1, column=duplicate_column).value = dedup.DUPLICATE_FIELD[1]
+            for row in range(2, ws.max_row + 1):
+                ws.cell(row=row, column=duplicate_column).value = None
+            dedup.mark_duplicates(rows, groups)
+            for i, row in enumerate(rows):
+                ws.cell(row=i + 2, column=duplicate_column).value = row.get(dedup.DUPLICATE_FIELD[1])
+
+        with METRICS.stage("excel_save"):
+            wb.save(excel_path)
+        action = "已删除" if collapse else "已标记"
+        print(f"重复记录: {duplicates} 条（{len(groups)} 组），{action}: {excel_path}")
+        return {"groups": len(groups), "duplicates": duplicates}
+
+    def download_pdf(self, excel_path, pdf_savepath, IF_cutoff):
         '''
         try to download paper which IF higher than cutoff
         warning: very low successful rate
         '''
+        import openpyxl
+        import requests
+        from bs4 import BeautifulSoup
+        from tqdm import trange
         
         wb = openpyxl.load_workbook(excel_path)
-        ws = wb["Sheet"]
+        ws = self._data_sheet(wb)
+        columns = field_schema.resolve_columns(ws, self.schema, add_missing=False)
         base_url = "https://sci-hub.tw/"
         success_count = 0
         for cur_row in trange(2, ws.max_row+1, desc="downloading pdf"):
-            IF = ws.cell(row=cur_row, column=self.excel_property_dic["IF"]).value
-            pmid = ws.cell(row=cur_row, column=self.excel_property_dic["PMID"]).value
-            title = ws.cell(row=cur_row, column=self.excel_property_dic["TI"]).value
-            if IF=="Unknow" or float(IF)<IF_cutoff:
+            IF = ws.cell(row=cur_row, column=columns["IF"]).value if "IF" in columns else None
+            pmid = ws.cell(row=cur_row, column=columns["PMID"]).value
+            title = ws.cell(row=cur_row, column=columns["TI"]).value
+            if IF in (None, "", "Unknow") or float(IF)<IF_cutoff:
                 continue
 
-            file_name = pdf_savepath+pmid+"_"+title+".pdf"
+            file_name = pdf_savepath+str(pmid)+"_"+str(title)+".pdf"
             try:
-                doi = ws.cell(row=cur_row, column=self.excel_property_dic["LID"]).value.split(" ")[0]
+                doi = ws.cell(row=cur_row, column=columns["LID"]).value.split(" ")[0]
                 url = base_url + doi
-                getpage = requests.get(url, verify=True)
+                METRICS.incr("requests", 2)
+                getpage = requests.get(url, verify=True, timeout=self.request_timeout)
                 getpage_soup = BeautifulSoup(getpage.text, "html.parser")
                 src = getpage_soup.find("iframe", src=True).get_attribute_list("src")[0]
-                response = requests.get("https:"+src, verify=True)
+                response = requests.get("https:"+src, verify=True, timeout=self.request_timeout)
                 f = open(file_name, "wb+")
                 f.write(response.content)
                 f.close()
@@ -0,0 +1,562 @@
+'''
+Offline PubMed-style boolean queries over everything harvested so far.
+
+parse() turns a query into an AST. It follows PubMed's rules: AND / OR / NOT are
+evaluated left to right (no precedence), parentheses nest, adjacent terms are ANDed,
+"quoted phrases" stay together, a trailing * is a prefix wildcard, and field tags
+([tiab], [ti], [ab], [ta], [pmid], [dp], ...) restrict a term to a column.
+
+    tree = parse('(wnt5a OR wnt7a[ti]) AND fibros* NOT review[pt]')
+    highlight_pattern(tree)          # regex of the terms that can appear in the results
+    text_terms(tree)                 # the same terms, for ranking.py
+
+LocalCorpus keeps harvested records in SQLite with an FTS5 full-text index on title,
+abstract and journal. Each AST node becomes a set of row ids (AND = INTERSECT, OR =
+UNION, NOT = EXCEPT), so narrowing or recombining a query runs locally instead of
+going back to NCBI:
+
+    with LocalCorpus() as corpus:               # $GRABPUBMED_CACHE_DIR/corpus.sqlite
+        corpus.add_excel("wnt5a.xlsx")          # upsert by PMID
+        rows = corpus.search("wnt5a AND 2023:2025[dp] NOT cancer[ti]")
+
+Without FTS5 in the local SQLite build, the same AST is evaluated in Python with the
+highlight regexes (slower, same results).
+'''
+import json
+import os
+import re
+
+import field_schema
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+# 字段标签 -> 检索范围；TEXT_FIELDS 以外的标签按其含义处理
+TEXT_FIELDS = {
+    "tiab": ("title", "abstract"),
+    "ti": ("title",),
+    "ab": ("abstract",),
+    "ta": ("journal",),
+    "all": ("title", "abstract", "journal"),
+}
+FIELD_TAGS = {
+    "tiab": "tiab", "title/abstract": "tiab", "tw": "tiab", "text word": "tiab",
+    "ti": "ti", "title": "ti",
+    "ab": "ab", "abstract": "ab",
+    "ta": "ta", "journal": "ta", "jour": "ta", "so": "ta",
+    "pmid": "pmid", "uid": "pmid",
+    "dp": "dp", "pdat": "dp", "publication date": "dp", "edat": "dp", "crdt": "dp",
+    # MeSH、作者等未保存在本地：退化为全文检索
+    "all": "all", "all fields": "all", "mh": "all", "mesh": "all", "mesh terms": "all", "majr": "all",
+    "au": "all", "author": "all", "ot": "all", "nm": "all",
+    # 检索时已应用的过滤条件（文献类型、语言等），本地视为全部满足
+    "pt": "filter", "publication type": "filter", "la": "filter", "language": "filter", "sb": "filter",
+    "filter": "filter",
+}
+OPERATORS = ("AND", "OR", "NOT")
+
+_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|\[([^\]]*)\]|([^\s()"\[\]]+))')
+
+
+class Term():
+    '''
+    One search term: words (a phrase when there are several), the field it is limited to
+    and whether the last word is a prefix wildcard.
+    '''
+    def __init__(self, text, field="all", prefix=False):
+        self.text = text
+        self.field = field
+        self.prefix = prefix
+
+    @property
+    def words(self):
+        return re.findall(r"[^\W_]+", self.text.lower())
+
+    def __eq__(self, other):
+        return isinstance(other, Term) and (self.text, self.field, self.prefix) == (other.text, other.field, other.prefix)
+
+    def __repr__(self):
+        return f"Term({self.text!r}, {self.field!r}{', prefix=True' if self.prefix else ''})"
+
+
+class Op():
+    '''
+    AND / OR over any number of children, NOT as (include, exclude); NOT with a single
+    child (a query starting with NOT) excludes from the whole corpus.
+    '''
+    def __init__(self, op, children):
+        self.op = op
+        self.children = list(children)
+
+    def __eq__(self, other):
+        return isinstance(other, Op) and (self.op, self.children) == (other.op, other.children)
+
+    def __repr__(self):
+        return f"Op({self.op!r}, {self.children!r})"
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        m = _TOKEN_RE.match(query, position)
+        if not m or m.end() == position:
+            raise QuerySyntaxError(f"Unexpected character at {position}: {query[position:position + 10]!r}")
+        position = m.end()
+        open_paren, close_paren, phrase, tag, word = m.groups()
+        if open_paren:
+            tokens.append(("(", None))
+        elif close_paren:
+            tokens.append((")", None))
+        elif tag is not None:
+            tokens.append(("tag", tag))
+        elif phrase is not None:
+            tokens.append(("phrase", phrase))
+        elif word.upper() in OPERATORS:
+            tokens.append(("op", word.upper()))
+        else:
+            tokens.append(("term", word))
+    return tokens
+
+
+def _make_term(text, tag):
+    field = "all"
+    if tag is not None:
+        field = FIELD_TAGS.get(re.sub(r"\s+", " ", tag.strip().lower()))
+        if field is None:
+            field = "all"   # 未知标签按全文处理
+    prefix = text.endswith("*")
+    text = text.split("*")[0].strip() if "*" in text else text.strip()
+    if field in ("pmid", "dp", "filter"):
+        return Term(text, field)
+    if not re.search(r"[^\W_]", text):
+        return None
+    return Term(text, field, prefix)
+
+
+def parse(query):
+    '''
+    Parse a PubMed query into a Term / Op tree (None for an empty query).
+
+    Raises QuerySyntaxError for unbalanced parentheses or dangling operators.
+    '''
+    if not query or not isinstance(query, str) or not query.strip():
+        return None
+    tokens = _tokenize(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def operand():
+        nonlocal position
+        kind, value = peek()
+        if kind == "(":
+            position += 1
+            node = expression()
+            if peek()[0] != ")":
+                raise QuerySyntaxError("Missing closing parenthesis")
+            position += 1
+            return node
+        if kind in ("term", "phrase"):
+            position += 1
+            if kind == "term":
+                # 未加引号的相邻词后接字段标签时作为一个短语（Nat Commun[ta]），否则各自成词
+                run = position
+                while run < len(tokens) and tokens[run][0] == "term":
+                    run += 1
+                if run > position and run < len(tokens) and tokens[run][0] == "tag":
+                    value = " ".join([value] + [text for _, text in tokens[position:run]])
+                    position = run
+            tag = None
+            if peek()[0] == "tag":
+                tag = peek()[1]
+                position += 1
+            term = _make_term(value, tag)
+            return term if term is not None else Op("AND", [])
+        if kind == "op" and value == "NOT":
+            position += 1
+            return Op("NOT", [operand()])
+        if kind is None:
+            raise QuerySyntaxError("Query ends with an operator")
+        raise QuerySyntaxError(f"Unexpected {value or kind!r}")
+
+    def combine(op, left, right):
+        # 同一运算符连续出现时合并为一个节点；NOT 保持二元
+        if op != "NOT" and isinstance(left, Op) and left.op == op:
+            left.children.append(right)
+            return left
+        return Op(op, [left, right])
+
+    def expression():
+        nonlocal position
+        node = operand()
+        while True:
+            kind, value = peek()
+            if kind in (None, ")"):
+                return node
+            if kind == "op":
+                position += 1
+                node = combine(value, node, operand())
+            else:
+                node = combine("AND", node, operand())   # 相邻的词隐含 AND
+
+    tree = expression()
+    if position != len(tokens):
+        raise QuerySyntaxError("Unbalanced closing parenthesis")
+    return _simplify(tree)
+
+
+def _simplify(node):
+    # Drop empty AND nodes left by terms without any word characters
+    if isinstance(node, Term):
+        return node
+    children = [_simplify(child) for child in node.children]
+    if node.op == "NOT":
+        if children[-1] is None:
+            return children[0] if len(children) == 2 else None
+        if len(children) == 2 and children[0] is None:
+            children = children[1:]
+        return Op("NOT", children)
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else Op(node.op, children)
+
+
+def text_terms(node, positive=True):
+    '''
+    Title / abstract terms that can occur in the matching records: every term except
+    those on the excluded side of an odd number of NOTs.
+    '''
+    if node is None:
+        return []
+    if isinstance(node, Term):
+        return [node] if positive and node.field in ("all", "tiab", "ti", "ab") else []
+    if node.op == "NOT":
+        excluded = node.children[-1]
+        included = node.children[:-1]
+        return [t for child in included for t in text_terms(child, positive)] + text_terms(excluded, not positive)
+    return [t for child in node.children for t in text_terms(child, positive)]
+
+
+def query_terms(query):
+    '''
+    Title / abstract search terms of a PubMed query, from its AST: terms
+    excluded by NOT and terms limited to other fields ([ta], [dp], [pmid], ...) are dropped,
+    phrases are kept as space-separated words and a "*" suffix marks a prefix wildcard.
+
+    "(wnt5a OR wnt7a) AND fibros*[tiab] NOT review" -> ["wnt5a", "wnt7a", "fibros*"]
+    '''
+    if not query or not isinstance(query, str):
+        return []
+    try:
+        tree = parse(query)
+    except QuerySyntaxError:
+        return _split_terms(query)
+    return [" ".join(term.words) + ("*" if term.prefix else "") for term in text_terms(tree)]
+
+
+def _split_terms(query):
+    # Token-by-token fallback for queries the parser rejects (unbalanced parentheses, ...)
+    tokens = re.split(r"\s+", query)
+    cleaned = []
+    skip_next = False  # 追踪 NOT 操作符
+
+    for t in tokens:
+        up = t.upper()
+
+        # 遇到 NOT 操作符，标记跳过下一个词
+        if up == "NOT":
+            skip_next = True
+            continue
+
+        # 跳过 AND、OR 并重置 NOT 标志
+        if up in ("AND", "OR"):
+            skip_next = False
+            continue
+
+        # 移除括号和字段限定符
+        t = t.strip('()')
+        if '[' in t:
+            t = t.split('[')[0]
+        t = t.strip('"')
+
+        # 忽略无效的 token
+        if not re.search(r"[A-Za-z0-9*]", t):
+            continue
+
+        # 跳过 NOT 操作的词（如： NOT cancer）
+        if skip_next:
+            skip_next = False
+            continue
+
+        cleaned.append(t)
+    return cleaned
+
+
+def term_regex(term):
+    # Word-exact regex of a term: words separated by any non-word run, "\w*" after a prefix
+    words = [re.escape(word) for word in term.words]
+    if not words:
+        return None
+    return r"\b" + r"[\W_]+".join(words) + (r"\w*" if term.prefix else r"\b")
+
+
+def highlight_pattern(node):
+    '''
+    Highlight regex for the reading list (same shape as html_generate's patterns), or None.
+    '''
+    patterns = []
+    for term in text_terms(node):
+        pattern = term_regex(term)
+        if pattern and pattern not in patterns:
+            patterns.append(pattern)
+    if not patterns:
+        return None
+    return r'(?i)(' + '|'.join(patterns) + r')'
+
+
+_DATE_RE = re.compile(r"((?:19|20)\d{2})(?:[/-]?(\d{1,2}))?(?:[/-]?(\d{1,2}))?")
+_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+def date_key(value, upper=False):
+    '''
+    YYYYMMDD integer of a date ("20250223", "2024 Mar 5", "2024/03", "2024"); missing month /
+    day become the start (or, with upper=True, the end) of the period. None if no year.
+    '''
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    for number, name in enumerate(_MONTHS, start=1):
+        text = re.sub(rf"\b{name}[a-z]*\b", f"{number:02d}", text)
+    m = _DATE_RE.search(re.sub(r"\s+", "/", text))
+    if not m:
+        return None
+    year, month, day = m.groups()
+    month = int(month) if month else (12 if upper else 1)
+    day = int(day) if day else (31 if upper else 1)
+    return int(year) * 10000 + month * 100 + day
+
+
+def date_range(text):
+    # "2020:2024" / "2023/06" / "2023/01/01:2023/06/30" -> (low, high) YYYYMMDD
+    low, _, high = text.partition(":")
+    low_key = date_key(low)
+    high_key = date_key(high or low, upper=True)
+    if low_key is None or high_key is None:
+        raise QuerySyntaxError(f"Invalid date: {text!r}")
+    return low_key, high_key
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return value
+
+
+class LocalCorpus():
+    '''
+    SQLite store of harvested records with an FTS5 index, queried with parse() trees.
+
+    Parameters:
+    -----------
+    path : str, optional
+        Database file (default: corpus.sqlite in journal_metrics.cache_dir()); ":memory:" for a throwaway corpus
+    schema : tuple of FieldSpec
+        Columns kept for each record (returned rows are dicts keyed by Excel header)
+    '''
+    def __init__(self, path=None, schema=field_schema.DEFAULT_SCHEMA):
+        import sqlite3
+        if path is None:
+            from journal_metrics import cache_dir
+            path = os.path.join(cache_dir(), "corpus.sqlite")
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.schema = schema
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS records (rowid INTEGER PRIMARY KEY, pmid TEXT UNIQUE, title TEXT, "
+            "abstract TEXT, journal TEXT, pubdate INTEGER, payload TEXT)")
+        self.fts5 = self._create_fts()
+        self.db.commit()
+
+    def _create_fts(self):
+        import sqlite3
+        try:
+            self.db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(title, abstract, journal, "
+                "content='records', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        except sqlite3.OperationalError:
+            return False   # 当前 SQLite 未编译 FTS5：改用 Python 逐条匹配
+        # 外部内容表：由触发器保持全文索引与 records 同步
+        self.db.executescript('''
+            CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN
+                INSERT INTO records_fts(rowid, title, abstract, journal) VALUES (new.rowid, new.title, new.abstract, new.journal);
+            END;
+            CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN
+                INSERT INTO records_fts(records_fts, rowid, title, abstract, journal) VALUES ('delete', old.rowid, old.title, old.abstract, old.journal);
+            END;
+            CREATE TRIGGER IF NOT EXISTS records_au AFTER UPDATE ON records BEGIN
+                INSERT INTO records_fts(records_fts, rowid, title, abstract, journal) VALUES ('delete', old.rowid, old.title, old.abstract, old.journal);
+                INSERT INTO records_fts(rowid, title, abstract, journal) VALUES (new.rowid, new.title, new.abstract, new.journal);
+            END;
+        ''')
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def add(self, rows):
+        '''
+        Insert or update records (records.py objects, dicts or pandas rows keyed by Excel
+        header or MEDLINE tag) by PMID; rows without a PMID are skipped. Returns the count.
+        '''
+        def value(row, spec):
+            v = _clean(row.get(spec.header))
+            return _clean(row.get(spec.key)) if v is None else v
+
+        batch = []
+        for row in rows:
+            payload = {spec.header: value(row, spec) for spec in self.schema}
+            pmid = payload.get("PMID")
+            if pmid is None or not str(pmid).strip():
+                continue
+            pmid = str(pmid).strip()
+            date = date_key(payload.get("Publication_Date")) or date_key(payload.get("publish_date"))
+            batch.append((pmid, payload.get("Title"), payload.get("Abstract"), payload.get("Journal"), date,
+                          json.dumps(payload, ensure_ascii=False, default=str)))
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO records (pmid, title, abstract, journal, pubdate, payload) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(pmid) DO UPDATE SET title=excluded.title, abstract=excluded.abstract, "
+                "journal=excluded.journal, pubdate=excluded.pubdate, payload=excluded.payload", batch)
+        return len(batch)
+
+    def lookup(self, pmids):
+        # {pmid: row dict keyed by Excel header} for the PMIDs already stored
+        pmids = [str(pmid) for pmid in pmids]
+        found = {}
+        for start in range(0, len(pmids), 900):
+            chunk = pmids[start:start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            for pmid, payload in self.db.execute(f"SELECT pmid, payload FROM records WHERE pmid IN ({placeholders})", chunk):
+                found[pmid] = json.loads(payload)
+        return found
+
+    def add_excel(self, excel_path):
+        # Index an Excel written by get_main_info_into_excel / grabpubmed (columns resolved by header)
+        import openpyxl
+        wb = openpyxl.load_workbook(excel_path, read_only=True)
+        try:
+            ws = wb.worksheets[0]
+            columns = field_schema.resolve_columns(ws, self.schema, add_missing=False)
+            headers = {spec.key: spec.header for spec in self.schema}
+            rows = ({headers[key]: values[column - 1] if column <= len(values) else None for key, column in columns.items()}
+                    for values in ws.iter_rows(min_row=2, values_only=True))
+            return self.add(rows)
+        finally:
+            wb.close()
+
+    def _fts_match(self, term):
+        # FTS5 query for one term: {columns} : "phrase" [*]
+        columns = " ".join(TEXT_FIELDS[term.field])
+        phrase = '"' + " ".join(term.words).replace('"', '""') + '"'
+        return f"{{{columns}}} : {phrase}" + (" *" if term.prefix else "")
+
+    def _term_sql(self, term):
+        if term.field == "filter":
+            return "SELECT rowid FROM records", []
+        if term.field == "pmid":
+            return "SELECT rowid FROM records WHERE pmid = ?", [term.text]
+        if term.field == "dp":
+            return "SELECT rowid FROM records WHERE pubdate BETWEEN ? AND ?", list(date_range(term.text))
+        return "SELECT rowid FROM records_fts WHERE records_fts MATCH ?", [self._fts_match(term)]
+
+    def _sql(self, node):
+        # Compound SELECT of the row ids matching node (sub-selects nested in FROM (...))
+        if isinstance(node, Term):
+            return self._term_sql(node)
+        parts = [self._sql(child) for child in node.children]
+        if node.op == "NOT" and len(parts) == 1:
+            parts.insert(0, ("SELECT rowid FROM records", []))
+        joiner = {"AND": " INTERSECT ", "OR": " UNION ", "NOT": " EXCEPT "}[node.op]
+        sql = joiner.join(f"SELECT rowid FROM ({part})" for part, _ in parts)
+        return sql, [p for _, params in parts for p in params]
+
+    def _python_ids(self, node, texts):
+        # FTS5 不可用时：用与高亮相同的正则逐条匹配
+        if isinstance(node, Term):
+            if node.field == "filter":
+                return set(texts)
+            if node.field == "pmid":
+                return {rowid for rowid, t in texts.items() if t["pmid"] == node.text}
+            if node.field == "dp":
+                low, high = date_range(node.text)
+                return {rowid for rowid, t in texts.items() if t["pubdate"] is not None and low <= t["pubdate"] <= high}
+            pattern = re.compile(term_regex(node), re.IGNORECASE)
+            columns = TEXT_FIELDS[node.field]
+            return {rowid for rowid, t in texts.items() if any(t[c] and pattern.search(t[c]) for c in columns)}
+        sets = [self._python_ids(child, texts) for child in node.children]
+        if node.op == "NOT":
+            if len(sets) == 1:
+                sets.insert(0, set(texts))
+            return sets[0] - sets[1]
+        result = sets[0]
+        for other in sets[1:]:
+            result = result & other if node.op == "AND" else result | other
+        return result
+
+    def match_ids(self, query):
+        # Row ids matching query (a string or a parse() tree), ascending
+        tree = parse(query) if isinstance(query, str) else query
+        if tree is None:
+            return []
+        if self.fts5:
+            sql, params = self._sql(tree)
+            return [rowid for (rowid,) in self.db.execute(f"SELECT rowid FROM ({sql}) ORDER BY rowid", params)]
+        texts = {rowid: {"pmid": pmid, "title": title, "abstract": abstract, "journal": journal, "pubdate": pubdate}
+                 for rowid, pmid, title, abstract, journal, pubdate
+                 in self.db.execute("SELECT rowid, pmid, title, abstract, journal, pubdate FROM records")}
+        return sorted(self._python_ids(tree, texts))
+
+    def search(self, query, limit=None):
+        '''
+        Records matching query, newest first, as dicts keyed by Excel header.
+
+        Parameters:
+        -----------
+        query : str
+            PubMed query (see parse)
+        limit : int, optional
+            Maximum number of records
+        '''
+        from instrumentation import METRICS
+        with METRICS.stage("local_query"):
+            ids = self.match_ids(query)
+            METRICS.incr("local_matches", len(ids))
+            rows = []
+            # 分批取回，避免超过 SQLite 的参数个数上限
+            for start in range(0, len(ids), 900):
+                chunk = ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self.db.execute(
+                    f"SELECT pubdate, rowid, payload FROM records WHERE rowid IN ({placeholders})", chunk))
+            rows.sort(key=lambda r: (-(r[0] or 0), -r[1]))
+            if limit is not None:
+                rows = rows[:limit]
+            return [json.loads(payload) for _, _, payload in rows]
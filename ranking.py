@@ -0,0 +1,274 @@
+'''
+Relevance ranking of harvested records (BM25, optionally blended with IF and recency).
+
+Titles and abstracts are lower-cased and packed into one byte buffer; a NumPy pass marks
+the token boundaries, so the corpus is tokenized without building one Python string per
+word. Scoring a query gathers the occurrences of its terms (wildcards included) into a
+documents x query-terms frequency matrix and applies BM25 to all records at once:
+
+    index = TermIndex.from_rows(rows)                  # tokenize once
+    scores = bm25(index, query_terms("wnt5a AND fibros*"))
+    order, scores = rank(rows, query, if_weight=0.2, recency_weight=0.2)
+
+Title tokens count TITLE_WEIGHT times (a simple BM25F). With blending, the score is
+
+    bm25 / max(bm25) + if_weight * log1p(IF) / log1p(max IF) + recency_weight * 0.5 ** (age / half_life)
+
+Rows may be records (records.py), dicts or pandas rows keyed by Excel header or MEDLINE tag.
+'''
+import re
+from datetime import date
+from functools import lru_cache
+
+from instrumentation import METRICS
+from query_engine import query_terms   # noqa: F401  (re-exported: ranking.query_terms)
+from records import first_value
+
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2
+HALF_LIFE_DAYS = 730    # recency: a two-year-old paper gets half the bonus of a new one
+
+_DATE_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?:[-/ ]?(\d{2}|[A-Za-z]{3})(?:[-/ ]?(\d{1,2}))?)?")
+_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+# bytes.translate table: 1 for bytes that belong to a token (a-z, 0-9, any UTF-8 multi-byte sequence);
+# non-ASCII text first has its non-word code points replaced by spaces (_NON_WORD), so only
+# letters and digits remain multi-byte -- the same [^\W_]+ words as query_engine / the highlighter
+_WORD_BYTES = bytes(1 if chr(i).isascii() and (chr(i).islower() or chr(i).isdigit()) or i >= 128 else 0 for i in range(256))
+_NON_WORD = re.compile(r"[^\x00-\x7f\w]")   # non-ASCII punctuation / spaces: ’ – — NBSP U+2011 ...
+
+
+def _key_masks():
+    # _key_masks()[n] keeps the first n bytes of a little-endian 8-byte key
+    import numpy as np
+    return np.array([2**(8 * n) - 1 for n in range(8)] + [2**64 - 1], dtype=np.uint64)
+
+
+def _term_parts(term):
+    # "beta-catenin" -> [b"beta", b"catenin"]; "fibros*" -> [b"fibros*"]
+    return [part.encode("utf-8") for part in re.findall(r"[^\W_]+\*?|\*", term.lower()) if part != "*"]
+
+
+class TermIndex():
+    '''
+    Token positions of a corpus: one lower-cased byte buffer and, per token, its start,
+    length and first 8 bytes packed in a uint64 key, so a term (or a wildcard prefix) of
+    up to 8 bytes is found with one vectorised comparison. Tokens are stored in corpus
+    order; part_ends[i] is the number of tokens up to the end of part i (parts alternate
+    title / abstract), which maps token positions back to documents.
+    '''
+    def __init__(self, buffer, starts, lengths, part_ends, n_docs):
+        import numpy as np
+        self.buffer = buffer
+        self.starts = starts
+        self.lengths = lengths
+        self.part_ends = part_ends
+        self.n_docs = n_docs
+        tokens = np.diff(part_ends, prepend=0).reshape(n_docs, 2)
+        self.doc_lengths = tokens[:, 0] * TITLE_WEIGHT + tokens[:, 1]
+
+        # 每个词前 8 个字节的 uint64 视图（缓冲区末尾已补 8 个空字节）
+        words = np.ndarray(shape=(len(buffer) - 7,), dtype="<u8", buffer=buffer, strides=(1,))
+        self.keys = words[starts]
+        self.keys &= _key_masks()[np.minimum(lengths, 8)]
+
+    @classmethod
+    def from_texts(cls, titles, abstracts=None):
+        import numpy as np
+        with METRICS.stage("rank_index"):
+            if abstracts is None:
+                abstracts = [''] * len(titles)
+            parts = []
+            for title, abstract in zip(titles, abstracts):
+                parts.append(title or '')
+                parts.append(abstract or '')
+            # 缓冲区以换行开头、以 8 个空字节结尾：每个词都有起点和终点，8 字节视图不会越界
+            text = "\n".join(["", *parts, "\0" * 8]).lower()
+            if text.isascii():
+                # 纯 ASCII：字符偏移即字节偏移，一次编码
+                sizes = np.fromiter(map(len, parts), dtype=np.int64, count=len(parts))
+                data = text.encode("ascii")
+            else:
+                encoded = [_NON_WORD.sub(" ", part.lower()).encode("utf-8") for part in parts]
+                sizes = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+                data = b"\n".join([b"", *encoded, bytes(8)])
+            del text
+            byte_ends = np.cumsum(sizes + 1) + 1
+            buffer = np.frombuffer(data, dtype=np.uint8)
+
+            # 词边界：词字符区间的起止位置交替出现
+            is_word = np.frombuffer(data.translate(_WORD_BYTES), dtype=np.bool_)
+            edges = np.flatnonzero(is_word[1:] != is_word[:-1]) + 1
+            del is_word
+            offset_type = np.int32 if len(buffer) < 2**31 else np.int64
+            starts = edges[0::2].astype(offset_type)
+            lengths = np.minimum(edges[1::2] - edges[0::2], 255).astype(np.uint8)
+            part_ends = np.searchsorted(starts, byte_ends)
+            return cls(buffer, starts, lengths, part_ends, len(titles))
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        return cls.from_texts([first_value(row, ('Title', 'TI')) for row in rows],
+                              [first_value(row, ('Abstract', 'AB')) for row in rows])
+
+    def _matching(self, term, positions=None):
+        # Token positions (all tokens, or the given ones) equal to term, or starting with it when it ends with b"*"
+        import numpy as np
+        prefix = term.endswith(b"*")
+        word = term[:-1] if prefix else term
+        if not word or len(word) > 255:
+            return np.empty(0, dtype=np.int64)
+        keys = self.keys if positions is None else self.keys[positions]
+        lengths = self.lengths if positions is None else self.lengths[positions]
+        key = np.uint64(int.from_bytes(word[:8].ljust(8, b"\0"), "little"))
+        if prefix and len(word) < 8:
+            matched = (keys & _key_masks()[len(word)]) == key
+        else:
+            matched = keys == key
+        matched &= (lengths >= len(word)) if prefix else (lengths == len(word))
+        candidates = np.flatnonzero(matched)
+        if positions is not None:
+            candidates = positions[candidates]
+        # 超过 8 个字节的部分逐字节比较（候选已很少）
+        for offset in range(8, len(word)):
+            if not len(candidates):
+                break
+            candidates = candidates[self.buffer[self.starts[candidates] + offset] == word[offset]]
+        return candidates
+
+    def occurrences(self, term):
+        '''
+        Token positions where term occurs (bytes or str; "*" suffix = prefix match). A term of
+        several words ("beta-catenin", "planar cell") matches where its words follow each other.
+        '''
+        import numpy as np
+        parts = _term_parts(term) if isinstance(term, str) else [term]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        hits = self._matching(parts[0])
+        for offset, part in enumerate(parts[1:], start=1):
+            following = hits + offset
+            following = following[following < len(self.starts)]
+            hits = self._matching(part, following) - offset
+        if len(parts) > 1:
+            # 短语不能跨越标题 / 摘要 / 文献边界
+            hits = hits[np.searchsorted(self.part_ends, hits, side="right")
+                        == np.searchsorted(self.part_ends, hits + len(parts) - 1, side="right")]
+        return hits
+
+    def frequencies(self, terms):
+        '''
+        Term frequencies as a (n_docs, len(terms)) array; title occurrences count TITLE_WEIGHT times.
+        '''
+        import numpy as np
+        tf = np.zeros((self.n_docs, len(terms)))
+        for column, term in enumerate(terms):
+            hits = self.occurrences(term)
+            if len(hits):
+                part = np.searchsorted(self.part_ends, hits, side="right")
+                weights = np.where(part % 2 == 0, float(TITLE_WEIGHT), 1.0)
+                tf[:, column] = np.bincount(part // 2, weights=weights, minlength=self.n_docs)
+        return tf
+
+
+def bm25(index, terms, k1=K1, b=B):
+    '''
+    BM25 score of every document of index for the query terms (0 for documents without any).
+    '''
+    import numpy as np
+    with METRICS.stage("rank_score"):
+        if not terms or not index.n_docs:
+            return np.zeros(index.n_docs)
+        tf = index.frequencies(terms)
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log1p((index.n_docs - df + 0.5) / (df + 0.5))
+        average = index.doc_lengths.mean() or 1.0
+        norm = k1 * (1 - b + b * index.doc_lengths / average)
+        return (tf * (k1 + 1) / (tf + norm[:, None])) @ idf
+
+
+@lru_cache(maxsize=4096)
+def _date_ordinal(value):
+    # "20250223" / "2024 Mar 5" / "2024" -> date ordinal, None when no year is found
+    m = _DATE_RE.search(value)
+    if not m:
+        return None
+    year, month, day = m.groups()
+    if month and not month.isdigit():
+        month = _MONTHS.index(month.lower()) + 1 if month.lower() in _MONTHS else None
+    try:
+        return date(int(year), int(month or 1), int(day or 1)).toordinal()
+    except ValueError:
+        return date(int(year), 1, 1).toordinal()
+
+
+def _impact_factor(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0   # "Unknow" / 空值
+    return value if value > 0 else 0.0
+
+
+def score_rows(rows, query, if_weight=0.0, recency_weight=0.0, half_life_days=HALF_LIFE_DAYS, today=None, index=None):
+    '''
+    Relevance score of every row for a query.
+
+    Parameters:
+    -----------
+    rows : list
+        Records, dicts or pandas rows (keyed by Excel header or MEDLINE tag)
+    query : str or list of str
+        PubMed query (see query_terms) or a list of terms
+    if_weight, recency_weight : float
+        Weight of the normalised impact factor and of the recency bonus (0 = BM25 only)
+    half_life_days : float
+        Age at which the recency bonus is halved
+    today : datetime.date
+        Reference date for the recency bonus (default: today)
+    index : TermIndex
+        Reuse an index built from the same rows
+
+    Returns:
+    --------
+    numpy array of scores, in row order
+    '''
+    import numpy as np
+    rows = list(rows)
+    terms = query_terms(query) if isinstance(query, str) or query is None else list(query)
+    if index is None:
+        index = TermIndex.from_rows(rows)
+    scores = bm25(index, terms)
+    top = scores.max() if len(scores) else 0.0
+    if top > 0:
+        scores = scores / top
+    if if_weight:
+        impact = np.log1p([_impact_factor(row.get('IF')) for row in rows])
+        if impact.max() > 0:
+            scores = scores + if_weight * impact / impact.max()
+    if recency_weight:
+        today = (today or date.today()).toordinal()
+        # 发表日期（DP）优先，LR 是 MEDLINE 最后修订日期，只作后备
+        dates = [_date_ordinal(first_value(row, ('Publication_Date', 'DP', 'publish_date', 'LR'))) for row in rows]
+        age = np.array([today - d if d is not None else np.inf for d in dates], dtype=float)
+        scores = scores + recency_weight * np.power(0.5, np.clip(age, 0, None) / half_life_days)
+    return scores
+
+
+def rank(rows, query, **kwargs):
+    '''
+    Order rows by score_rows (highest first, ties keep their original order).
+
+    Returns:
+    --------
+    (order, scores) : row indices best-first, and the scores in row order
+    '''
+    import numpy as np
+    with METRICS.stage("rank"):
+        scores = score_rows(rows, query, **kwargs)
+        order = np.argsort(-scores, kind="stable")
+    return order, scores
+
@@ -0,0 +1,140 @@
+'''
+Compact in-memory record representation.
+
+record_type(schema) builds a __slots__ class with one attribute per schema key, so a
+harvested record costs one small object instead of a Bio.Medline dict plus openpyxl cells
+plus a pandas row. The parser emits these records directly; enrichment (update) and
+rendering (get, by Excel header or MEDLINE tag) consume them without conversion.
+
+    rtype = record_type(field_schema.DEFAULT_SCHEMA)
+    rec = rtype(PMID="123", TI="Title", TA="Nat Commun")
+    rec.get("Title"), rec.get("TI")    # same value
+    to_dataframe(records, schema)      # pandas, columns named by header
+    to_arrow(records, schema)          # pyarrow.Table (optional dependency)
+    first_value(row, ("Title", "TI"))  # any row type: record, dict or pandas row
+'''
+import sys
+
+
+class RecordBase():
+    __slots__ = ()
+    _keys = ()        # schema keys, in schema (= Excel column) order
+    _headers = {}     # Excel header -> key
+
+    def __init__(self, **values):
+        for key in self._keys:
+            setattr(self, key, values.get(key))
+
+    def get(self, name, default=None):
+        # Look up by Excel header first ("JCR_Quartile" -> key "Quartile"), then by key.
+        key = self._headers.get(name, name)
+        if key not in self._keys:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._keys and getattr(self, key) is not None
+
+    def update(self, values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def items(self):
+        # (key, value) pairs for the fields that are set
+        for key in self._keys:
+            value = getattr(self, key)
+            if value is not None:
+                yield key, value
+
+    def row(self):
+        # Values in schema order, e.g. for worksheet.append
+        return [getattr(self, key) for key in self._keys]
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self._keys}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.row() == other.row()
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.items())
+        return f"{type(self).__name__}({fields})"
+
+
+_TYPES = {}
+
+
+def record_type(schema):
+    '''
+    Return the (cached) slotted record class for a schema.
+    '''
+    keys = tuple(spec.key for spec in schema)
+    headers = tuple(spec.header for spec in schema)
+    cache_key = (keys, headers)
+    rtype = _TYPES.get(cache_key)
+    if rtype is None:
+        rtype = type("Record", (RecordBase,), {
+            "__slots__": keys,
+            "_keys": keys,
+            "_headers": dict(zip(headers, keys)),
+        })
+        _TYPES[cache_key] = rtype
+    return rtype
+
+
+def first_value(row, names, default=''):
+    '''
+    First non-empty value of row among names (Excel headers or MEDLINE tags), as a stripped str.
+    Rows may be records, dicts or pandas rows; None, NaN (empty pandas cells) and blank strings count as empty.
+    '''
+    for name in names:
+        value = row.get(name)
+        if value is None or (isinstance(value, float) and value != value):
+            continue
+        value = str(value).strip()
+        if value:
+            return value
+    return default
+
+
+def intern_value(value):
+    # Repeated short strings (journal names, quartiles) share one object
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def columns(records, schema):
+    '''
+    {header: list of values} built straight from the record attributes. The lists hold
+    references to the same str objects as the records, so no text is copied.
+    '''
+    return {spec.header: [getattr(rec, spec.key) for rec in records] for spec in schema}
+
+
+def to_dataframe(records, schema):
+    import pandas as pd
+    return pd.DataFrame(columns(records, schema), columns=[spec.header for spec in schema])
+
+
+def to_arrow(records, schema):
+    '''
+    Convert to a pyarrow.Table; interned (repeated) columns are dictionary-encoded.
+    '''
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("to_arrow requires pyarrow (pip install pyarrow)")
+    arrays = []
+    for spec in schema:
+        values = [getattr(rec, spec.key) for rec in records]
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array([None if v is None else str(v) for v in values])
+        if getattr(spec, "intern", False) and pa.types.is_string(array.type):
+            array = array.dictionary_encode()
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=[spec.header for spec in schema])
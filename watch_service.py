@@ -0,0 +1,509 @@
+'''
+Long-running watch service: registered queries re-run on a schedule by one warm process.
+
+    python grabpubmed.py watch add wnt5a -q "(wnt5a NOT cancer) AND fibro*" --every 30
+    python grabpubmed.py watch list
+    python grabpubmed.py watch serve --port 8600        # scheduler + http://127.0.0.1:8600/
+    python grabpubmed.py watch run                      # run every watch once (cron)
+
+The process keeps the expensive state between runs: one pubmed_utils with a keep-alive
+connection pool, the journal metrics store (journal_metrics.py) and the local corpus
+(query_engine.LocalCorpus). A run only handles the delta: one ESearch (PMIDs only) over
+the days since the previous run, records already in the reading list are skipped, records
+already in the corpus are taken from it, and only the rest are fetched with EFetch,
+enriched, indexed and inserted at the top of the reading list (ReadingListUpdater).
+
+The HTTP server (stdlib http.server, bound to 127.0.0.1 by default) serves:
+
+    /                       watch overview
+    /watch/<name>/          the reading list of a watch (and its sidecar abstract chunks)
+    /api/watches            watch status as JSON; POST /api/watches/<name>/run runs one now
+    /api/state/<key>        GET / PUT the star and read marks of a reading list
+
+Pages opened through the server sync their star / read marks with /api/state, so they
+survive a browser change; opened from disk they keep using localStorage only.
+'''
+import html
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from instrumentation import METRICS
+
+
+WATCHES_FILE = "watches.json"
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_BACKFILL_DAYS = 30     # ESearch window of the first run of a watch
+DEFAULT_PORT = 8600
+MAX_BACKOFF_MINUTES = 24 * 60  # 连续失败时重试间隔的上限
+MAX_IDS = 10000                # ESearch retmax limit; larger windows are truncated (see run_watch)
+_OVERLAP_DAYS = 1              # 时间窗口多取一天：已在阅读列表中的 PMID 会被跳过
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+_CHUNK_RE = re.compile(r"^(.+)_abstracts/([0-9a-f]+-[0-9]+\.js)$")   # 旁路摘要块（html_generate sidecar 模式）
+_CONTENT_TYPES = {".html": "text/html", ".js": "application/javascript", ".json": "application/json", ".css": "text/css"}
+
+
+def default_watches_path():
+    from journal_metrics import cache_dir
+    return os.path.join(cache_dir(), WATCHES_FILE)
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S") if value else None
+
+
+def _write_json(path, data):
+    # 先写临时文件再替换，进程中断时不会留下半个文件
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class WatchRegistry():
+    '''
+    Registered watches, kept in a JSON file: {name: {query, type, days, every, html, last_run, ...}}.
+
+    Parameters:
+    -----------
+    path : str, optional
+        JSON file (default: watches.json in journal_metrics.cache_dir())
+    '''
+    def __init__(self, path=None):
+        self.path = path or default_watches_path()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def all(self):
+        with self._lock:
+            return self._load()
+
+    def get(self, name):
+        watch = self.all().get(name)
+        if watch is None:
+            raise KeyError(f"No watch named {name!r}")
+        return watch
+
+    def add(self, name, query, paper_type="Journal Article", days=DEFAULT_BACKFILL_DAYS, every=DEFAULT_INTERVAL_MINUTES,
+            html_path=None):
+        '''
+        Register (or redefine) a watch; returns its entry.
+
+        Parameters:
+        -----------
+        name : str
+            Letters, digits, "_", "-" and "."; used in URLs
+        query : str
+            PubMed query
+        paper_type : str
+            Publication type filter ("" to disable)
+        days : int
+            ESearch window of the first run (later runs cover the days since the previous run)
+        every : float
+            Minutes between runs
+        html_path : str, optional
+            Reading list path (default: <name>_reading_list.html next to the registry file)
+        '''
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Invalid watch name {name!r} (letters, digits, '_', '-', '.')")
+        if every <= 0:
+            raise ValueError("--every must be positive")
+        html_path = os.path.abspath(html_path or os.path.join(os.path.dirname(os.path.abspath(self.path)),
+                                                              f"{name}_reading_list.html"))
+        with self._lock:
+            watches = self._load()
+            watch = watches.get(name, {})
+            if watch.get("query") != query or watch.get("type") != paper_type:
+                # 检索式变了：下次按 days 重新回溯
+                watch = {}
+            watch.update(query=query, type=paper_type, days=days, every=every, html=html_path)
+            watches[name] = watch
+            _write_json(self.path, watches)
+        return watch
+
+    def remove(self, name):
+        with self._lock:
+            watches = self._load()
+            if watches.pop(name, None) is None:
+                raise KeyError(f"No watch named {name!r}")
+            _write_json(self.path, watches)
+
+    def update(self, name, **fields):
+        with self._lock:
+            watches = self._load()
+            if name in watches:
+                watches[name].update(fields)
+                _write_json(self.path, watches)
+
+    def next_due(self, watch):
+        # Time of the next scheduled run (None: never run, due now). After a failed run the
+        # interval doubles with each consecutive failure, up to MAX_BACKOFF_MINUTES.
+        times = [t.timestamp() for t in (_parse_time(watch.get("last_run")), _parse_time(watch.get("last_attempt"))) if t]
+        if not times:
+            return None
+        minutes = watch["every"]
+        failures = watch.get("failures") or 0
+        if failures:
+            minutes = min(minutes * 2 ** (failures - 1), max(minutes, MAX_BACKOFF_MINUTES))
+        return max(times) + minutes * 60
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return [name for name, watch in self.all().items() if (self.next_due(watch) or 0) <= now]
+
+
+class StateStore():
+    '''
+    Star / read marks of the served reading lists, one JSON file per storage key.
+
+    Parameters:
+    -----------
+    path : str
+        Directory of the <key>.json files
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        if not _NAME_RE.match(key):
+            raise ValueError(f"Invalid state key {key!r}")
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key):
+        path = self._file(key)
+        with self._lock:
+            if not os.path.exists(path):
+                return {"starred": [], "read": [], "updated": None}
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+
+    def put(self, key, state):
+        marks = {kind: [str(item) for item in state.get(kind) or []] for kind in ("starred", "read")}
+        marks["updated"] = _now()
+        path = self._file(key)
+        with self._lock:
+            _write_json(path, marks)
+        return marks
+
+
+class WatchService():
+    '''
+    Runs registered watches with warm caches and serves their reading lists.
+
+    Parameters:
+    -----------
+    registry : WatchRegistry
+        Registered watches
+    api_key : str, optional
+        NCBI API key (never written to the registry)
+    references : list of str, optional
+        JCR/CSA workbook(s) for enrichment (path@year, see journal_metrics.py); None to skip
+    db : str, optional
+        Local corpus database (default: corpus.sqlite in the cache directory)
+    state_dir : str, optional
+        Directory of the synced star / read marks (default: state/ next to the registry file)
+    '''
+    def __init__(self, registry, api_key=None, references=None, db=None, state_dir=None):
+        from pubmed_utils import pubmed_utils
+        self.registry = registry
+        self.api_key = api_key
+        self.references = references
+        self.db = db
+        self.state = StateStore(state_dir or os.path.join(os.path.dirname(os.path.abspath(registry.path)), "state"))
+        self.utils = pubmed_utils()
+        if self.utils.response_cache:
+            # ESearch 每次都要发出（新论文）；EFetch 仍走磁盘缓存
+            from http_cache import ResponseCache
+            self.utils.cache = ResponseCache(ttls={"esearch": 0})
+        self.store = None
+        self.corpus = None
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._requested = set()
+
+    def _warm_up(self):
+        # 参考表和本地语料库只加载一次，之后每次运行复用
+        if self.references and self.store is None:
+            self.store = self.utils.load_metrics_store(self.references)
+        if self.corpus is None:
+            from query_engine import LocalCorpus
+            self.corpus = LocalCorpus(self.db, self.utils.schema)
+
+    def close(self):
+        if self.corpus is not None:
+            self.corpus.close()
+            self.corpus = None
+
+    def _window_days(self, watch):
+        last_run = _parse_time(watch.get("last_run"))
+        if last_run is None:
+            return watch.get("days")
+        elapsed = (datetime.now() - last_run).total_seconds() / 86400
+        return max(1, math.ceil(elapsed)) + _OVERLAP_DAYS
+
+    def _enrich(self, records):
+        from journal_metrics import publication_year
+        named = [values for values in records if values.TA]
+        if self.store is None or not named:
+            return
+        years = [publication_year(values.DP, values.LR) for values in named]
+        results = self.utils.lookup_journal_metrics([values.TA for values in named], years, self.store)
+        for values, (updates, _) in zip(named, results):
+            values.update(updates)
+
+    def run_watch(self, name):
+        '''
+        Run one watch now: ESearch the new window, fetch only unknown PMIDs, update the reading list.
+        Returns {"new", "from_corpus", "fetched", "esearch_count", "window_days", "requests", "seconds"}.
+        '''
+        from html_generate import ReadingListUpdater, ReadingListWriter
+
+        with self._run_lock:
+            watch = self.registry.get(name)
+            self._warm_up()
+            t0 = time.perf_counter()
+            requests_before = METRICS.counters.get("requests", 0)
+            started = _now()
+            window = self._window_days(watch)
+            search = self.utils.esearch(self.api_key, watch["query"], window, watch.get("type"), retmax=MAX_IDS,
+                                        datetype="edat")
+            if search["count"] > len(search["ids"]):
+                print(f"[{name}] {search['count']} matches in the last {window} days; only the first {len(search['ids'])} are watched")
+
+            html_path = watch["html"]
+            search_info = {"search_keywords": watch["query"], "paper_type": watch.get("type"), "release_date_cutoff": window,
+                           "grab_total": None, "save_path": html_path, "search_date": None}
+            writer = None
+            if os.path.exists(html_path):
+                try:
+                    writer = ReadingListUpdater(html_path, search_info)
+                except ValueError as e:
+                    print(f"{e}; writing a full reading list instead")
+            if writer is None:
+                writer = ReadingListWriter(html_path, search_info)
+            known = getattr(writer, "existing", set())
+            known_before = len(known)   # writer.add() 会把新记录加入 existing
+            new_ids = [pmid for pmid in dict.fromkeys(search["ids"]) if pmid not in known]
+
+            # 本地语料库中已有的记录不再请求 EFetch
+            stored = self.corpus.lookup(new_ids)
+            missing = [pmid for pmid in new_ids if pmid not in stored]
+            fetched = {}
+            if missing:
+                records = list(self.utils.iter_records_by_id(self.api_key, missing, progress=lambda done, total: None))
+                self._enrich(records)
+                self.corpus.add(records)
+                fetched = {str(values.PMID): values for values in records}
+            with writer:
+                for pmid in new_ids:
+                    row = stored.get(pmid) or fetched.get(pmid)
+                    if row is not None:
+                        writer.add(row)
+
+            result = {"new": writer.count, "from_corpus": len(stored), "fetched": len(fetched),
+                      "esearch_count": search["count"], "window_days": window,
+                      "requests": METRICS.counters.get("requests", 0) - requests_before,
+                      "seconds": round(time.perf_counter() - t0, 3)}
+            self.registry.update(name, last_run=started, last_attempt=started, last_result=result, last_error=None, failures=0,
+                                 total=known_before + writer.count)
+            return result
+
+    def run_due(self, names=None):
+        # Run the given watches (default: those due); one failing watch does not stop the others.
+        results = {}
+        for name in names if names is not None else self.registry.due():
+            try:
+                results[name] = self.run_watch(name)
+            except Exception as e:
+                # 失败也记录尝试时间：下次按退避间隔重试，不会立即循环请求 NCBI
+                failures = (self.registry.all().get(name) or {}).get("failures") or 0
+                self.registry.update(name, last_error=f"{type(e).__name__}: {e}", last_attempt=_now(), failures=failures + 1)
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"[{name}] {results[name]}")
+        return results
+
+    def request_run(self, name):
+        self.registry.get(name)
+        self._requested.add(name)
+        self._wake.set()
+
+    def _seconds_until_due(self):
+        dues = [self.registry.next_due(watch) for watch in self.registry.all().values()]
+        if not dues:
+            return 60
+        return min(max(0.0, (due or 0) - time.time()) for due in dues)
+
+    def scheduler(self):
+        # 串行执行到期的 watch（遵守 NCBI 速率限制），空闲时等待下一个到期时间或手动触发
+        # 语料库（SQLite 连接）只在本线程中打开和关闭
+        try:
+            while not self._stop.is_set():
+                requested, self._requested = self._requested, set()
+                due = set(self.registry.due()) | requested
+                if due:
+                    self.run_due(sorted(due))
+                self._wake.wait(timeout=min(self._seconds_until_due(), 60))
+                self._wake.clear()
+        finally:
+            self.close()
+
+    def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        '''
+        Start the scheduler thread and serve HTTP until interrupted (Ctrl+C).
+        '''
+        from http.server import ThreadingHTTPServer
+
+        httpd = ThreadingHTTPServer((host, port), _handler(self))
+        httpd.daemon_threads = True
+        thread = threading.Thread(target=self.scheduler, name="watch-scheduler", daemon=True)
+        thread.start()
+        print(f"Serving {len(self.registry.all())} watch(es) at http://{host}:{httpd.server_address[1]}/")
+        try:
+            httpd.serve_forever()
+        finally:
+            self._stop.set()
+            self._wake.set()
+            httpd.server_close()
+            thread.join()
+
+    def status(self):
+        watches = {}
+        for name, watch in self.registry.all().items():
+            due = self.registry.next_due(watch)
+            watches[name] = {**watch, "url": f"/watch/{name}/",
+                             "next_run": datetime.fromtimestamp(due).strftime("%Y-%m-%dT%H:%M:%S") if due else None}
+        return watches
+
+
+def _overview_html(watches):
+    rows = []
+    for name, watch in sorted(watches.items()):
+        result = watch.get("last_result") or {}
+        status = html.escape(watch.get("last_error") or f"+{result.get('new', 0)} new")
+        rows.append(f'<tr><td><a href="{html.escape(watch["url"])}">{html.escape(name)}</a></td>'
+                    f'<td>{html.escape(watch["query"])}</td><td>{watch.get("total", 0)}</td>'
+                    f'<td>{html.escape(watch.get("last_run") or "never")}</td><td>{status}</td>'
+                    f'<td>{html.escape(watch.get("next_run") or "now")}</td>'
+                    f'<td><button onclick="runNow(\'{html.escape(name)}\')">Run now</button></td></tr>')
+    return f'''<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8"><title>Watches</title>
+<style>
+body {{ font-family: sans-serif; background: #1e1e1e; color: #e0e0e0; padding: 20px; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border-bottom: 1px solid #444; padding: 8px; text-align: left; }}
+a {{ color: #4a9eff; }}
+button {{ background: #4a9eff; color: white; border: none; padding: 5px 10px; border-radius: 3px; cursor: pointer; }}
+</style></head><body>
+<h1>Watches</h1>
+<table><tr><th>Name</th><th>Query</th><th>Records</th><th>Last run</th><th>Result</th><th>Next run</th><th></th></tr>
+{"".join(rows)}
+</table>
+<script>
+function runNow(name) {{
+    fetch('/api/watches/' + encodeURIComponent(name) + '/run', {{method: 'POST'}}).then(() => setTimeout(() => location.reload(), 2000));
+}}
+</script>
+</body></html>
+'''
+
+
+def _handler(service):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import unquote, urlparse
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = unquote(urlparse(self.path).path)
+            try:
+                if path == "/":
+                    return self._send(200, "text/html", _overview_html(service.status()).encode("utf-8"))
+                if path == "/api/watches":
+                    return self._send_json(200, service.status())
+                if path.startswith("/api/state/"):
+                    return self._send_json(200, service.state.get(path[len("/api/state/"):]))
+                if path.startswith("/watch/"):
+                    return self._send_file(path[len("/watch/"):])
+            except (KeyError, ValueError) as e:
+                return self._send_json(404, {"error": str(e)})
+            self._send_json(404, {"error": "not found"})
+
+        def do_PUT(self):
+            path = unquote(urlparse(self.path).path)
+            if not path.startswith("/api/state/"):
+                return self._send_json(404, {"error": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                state = json.loads(self.rfile.read(length) or b"{}")
+                self._send_json(200, service.state.put(path[len("/api/state/"):], state))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+
+        def do_POST(self):
+            match = re.match(r"^/api/watches/([^/]+)/run$", unquote(urlparse(self.path).path))
+            if not match:
+                return self._send_json(404, {"error": "not found"})
+            try:
+                service.request_run(match.group(1))
+            except KeyError as e:
+                return self._send_json(404, {"error": str(e)})
+            self._send_json(202, {"queued": match.group(1)})
+
+        def _send_file(self, rest):
+            # /watch/<name>/ 是阅读列表本身，/watch/<name>/<stem>_abstracts/<chunk>.js 是旁路摘要块
+            name, slash, relative = rest.partition("/")
+            watch = service.registry.get(name)
+            if not slash:
+                self.send_response(301)
+                self.send_header("Location", f"/watch/{name}/")
+                self.end_headers()
+                return
+            # 只提供阅读列表本身和 <stem>_abstracts/<chunk>.js，目录中的其他文件（语料库、缓存、密钥……）一律 404
+            stem = os.path.splitext(os.path.basename(watch["html"]))[0]
+            chunk = _CHUNK_RE.match(relative)
+            if not relative:
+                target = watch["html"]
+            elif chunk and chunk.group(1) == stem:
+                target = os.path.join(os.path.dirname(watch["html"]), f"{stem}_abstracts", chunk.group(2))
+            else:
+                return self._send_json(404, {"error": "not found"})
+            if not os.path.isfile(target):
+                return self._send_json(404, {"error": "not found"})
+            content_type = _CONTENT_TYPES.get(os.path.splitext(target)[1].lower(), "application/octet-stream")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type + "; charset=UTF-8")
+            self.send_header("Content-Length", str(os.path.getsize(target)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            with open(target, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+
+        def _send_json(self, status, data):
+            self._send(status, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type + "; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler